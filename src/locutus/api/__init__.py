@@ -1,10 +1,20 @@
+from flask import request
+from bson import json_util
+import json
+import os
+
 from locutus.sessions import SessionManager
 from locutus import get_code_index
+from locutus.model.exceptions import APIError, InvalidQueryParameter
 
 default_headers = [
     ("Content-Type", "application/fhir+json"),
 ]
 
+# Number of resources returned by the list endpoints when the request doesn't
+# specify a limit. Unset (or 0), everything is returned as a single page.
+default_page_size = int(os.getenv("LOCUTUS_PAGE_SIZE", 0)) or None
+
 
 # Whenever you delete a document where a collection is anchored, you must also
 # delete the collection, since the document's delete doesn't actually know
@@ -24,6 +34,59 @@ def delete_collection(collection, batch_size=100):
     return total_deleted
 
 
+def count_arg(parameter, default=None):
+    """A query parameter which must be a positive integer, such as a limit"""
+    value = request.args.get(parameter)
+    if value is None:
+        return default
+    try:
+        count = int(value)
+    except ValueError:
+        count = 0
+    if count < 1:
+        raise InvalidQueryParameter(parameter, value, "a positive integer")
+    return count
+
+
+def list_resources(resource_class):
+    """Response listing every resource of the given (Serializable) class.
+
+    Query parameters:
+        summary - when true, only the id, name, title, url and a count of the
+                  resource's children are returned (see summary_projection)
+        limit   - maximum number of resources to return (defaults to
+                  LOCUTUS_PAGE_SIZE)
+        after   - id of the last resource from the previous page
+
+    When there are more resources to come, the id to pass as after for the
+    next page is returned in the X-Next-Cursor header."""
+    summary = request.args.get("summary", "false").lower() == "true"
+    after = request.args.get("after")
+    try:
+        limit = count_arg("limit", default_page_size)
+    except APIError as e:
+        return e.to_dict(), e.status_code, default_headers
+
+    projection = None
+    if summary:
+        projection = resource_class.summary_projection()
+
+    # Ask for one more than we need to find out if there is another page
+    resources = resource_class.get(
+        return_instance=False,
+        projection=projection,
+        limit=None if limit is None else limit + 1,
+        after=after,
+    )
+
+    headers = list(default_headers)
+    if limit is not None and len(resources) > limit:
+        resources = resources[:limit]
+        headers.append(("X-Next-Cursor", resources[-1]["id"]))
+
+    return json.loads(json_util.dumps(resources)), 200, headers
+
+
 def get_editor(body, editor):
     if body and "editor" in body:
         editor = body["editor"]
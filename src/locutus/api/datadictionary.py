@@ -2,8 +2,8 @@ from flask_restful import Resource
 from flask import request
 from locutus.model.datadictionary import DataDictionary as DD
 from locutus.model.harmony_export import HarmonyFormat, HarmonyOutputFormat 
-from locutus.api.study import Studies
-from locutus.api import default_headers
+from locutus.api import default_headers, list_resources
+from locutus.api.harmony import harmony_response
 
 from flask_cors import cross_origin
 
@@ -12,11 +12,7 @@ import json
 
 class DataDictionaries(Resource):
     def get(self):
-        return (
-            json.loads(json_util.dumps(DD.get(return_instance=False))),
-            200,
-            default_headers,
-        )
+        return list_resources(DD)
 
     def save_dd(self, dd):
         if "resource_type" in dd:
@@ -32,21 +28,6 @@ class DataDictionaries(Resource):
         d = self.save_dd(dd)
         return json.loads(json_util.dumps(d.dump())), 201, default_headers
 
-    def delete_table_references(self, table_id):
-        # Does this need to be batched. I'm assuming we'll end up using a
-        # different database before we get enough of these to matter
-
-        affected_dds = 0
-        for d in DD.get(return_instance=True):
-            matched_references = d.remove_table(table_id)
-
-            if matched_references > 0:
-                d.save()
-
-                affected_dds += 1
-
-        return affected_dds
-
 
 class DataDictionary(Resource):
 
@@ -71,12 +52,14 @@ class DataDictionary(Resource):
         return json.loads(json_util.dumps(d.dump())), 201, default_headers
 
     def delete(self, id):
+        """Deletes the data dictionary, removing it from any studies. With
+        ?cascade=true, its tables (see Table.delete) that no other data
+        dictionary uses are deleted as well."""
+        cascade = request.args.get("cascade", "false").lower() == "true"
         dd = DD.get(id)
-        d = dd.dump()
 
-        # Delete any references to the data dictionary from any studies:
-        Studies().delete_dd_references(id)
-        dd.delete()
+        # References to the data dictionary from any studies go with it
+        d = dd.delete(cascade=cascade, use_transaction=True)
 
         return json.loads(json_util.dumps(d)), 200, default_headers
 
@@ -110,9 +93,10 @@ class DataDictionaryHarmony(Resource):
 
         t = DD.get(id)
 
-
         try:
-            harmony = t.as_harmony(harmony_format=data_format, harmony_output_format=file_format)
+            return harmony_response(
+                t.iter_harmony(harmony_format=data_format, harmony_output_format=file_format),
+                file_format,
+            )
         except KeyError as e:
             return {"message_to_user": str(e)}, 400, default_headers
-        return json.loads(json_util.dumps(harmony)), 200, default_headers
@@ -0,0 +1,50 @@
+"""Shared plumbing for the harmony endpoints, which stream their rows back to
+the client rather than building the entire export before responding."""
+
+from itertools import chain
+
+from flask import Response, request, stream_with_context
+
+from locutus.api import default_headers
+from locutus.model.harmony_export import (
+    HarmonyOutputFormat,
+    encode_csv,
+    encode_json_array,
+    encode_ndjson,
+)
+
+
+def harmony_response(rows, output_format):
+    """Build a streaming response for the harmony rows.
+
+    JSON and CSV exports are returned as a JSON array (of objects and of lists
+    respectively) just as they always have been unless the client asks for
+    text/csv, in which case CSV exports are returned as actual CSV. NDJSON
+    returns one object per line.
+
+    The first row is pulled before the response is built so that any problem
+    with the export (such as a KeyError) is raised to the caller, who can
+    still return a proper error status.
+    """
+    rows = iter(rows)
+    try:
+        first = [next(rows)]
+    except StopIteration:
+        first = []
+    rows = chain(first, rows)
+
+    if output_format == HarmonyOutputFormat.NDJSON:
+        body = encode_ndjson(rows)
+        headers = [("Content-Type", "application/x-ndjson")]
+    elif (
+        output_format == HarmonyOutputFormat.CSV
+        and request.accept_mimetypes.best_match(["application/json", "text/csv"])
+        == "text/csv"
+    ):
+        body = encode_csv(rows)
+        headers = [("Content-Type", "text/csv")]
+    else:
+        body = encode_json_array(rows)
+        headers = default_headers
+
+    return Response(stream_with_context(body), status=200, headers=headers)
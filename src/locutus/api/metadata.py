@@ -1,6 +1,12 @@
+import logging
 import os
 from flask_restful import Resource
+from pymongo.errors import PyMongoError
+
+import locutus
 from locutus._version import __version__
+from locutus.model import provenance_queue
+from locutus.model.indexes import missing_unique_indexes
 
 class Version(Resource):
     def get(self):
@@ -10,3 +16,27 @@ class Version(Resource):
         version = os.getenv('VERSION') or __version__
 
         return {'version': version}
+
+
+class Ready(Resource):
+    def get(self):
+        """Readiness check. Returns 503 until the database can be reached
+        and has the unique indexes that saving codings and user input rely on
+        (see locutus-indexes), so that load balancers hold off sending
+        requests our way. The response also reports on the provenance queue
+        (see locutus.model.provenance_queue)."""
+        try:
+            locutus.persistence().ping()
+            missing = missing_unique_indexes()
+        except PyMongoError as e:
+            logging.warning(f"Not ready, unable to reach the database: {e}")
+            return {"status": "unavailable"}, 503
+
+        if missing:
+            missing = [f"{collection}.{name}" for collection, name in missing]
+            logging.error(
+                f"Not ready, missing unique indexes (run locutus-indexes): {', '.join(missing)}"
+            )
+            return {"status": "missing indexes", "missing_indexes": missing}, 503
+
+        return {"status": "ready", "provenance_queue": provenance_queue.stats()}
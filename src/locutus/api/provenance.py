@@ -2,22 +2,89 @@ from flask_restful import Resource
 from flask import request
 from locutus.model.table import Table
 from locutus.model.terminology import Terminology, Coding
+from locutus.model.exceptions import APIError, InvalidQueryParameter
+from locutus.model.provenance import parse_timestamp
 from locutus.api.terminology_mappings import TerminologyMappings
 from flask_cors import cross_origin
-from locutus.api import default_headers
+from locutus.api import count_arg, default_headers, default_page_size
 
 from bson import json_util 
 import json
 
+
+def timestamp_args():
+    """The since and until query parameters, as datetimes"""
+    timestamps = {}
+    for parameter in ["since", "until"]:
+        value = request.args.get(parameter)
+        if value is not None:
+            try:
+                timestamps[parameter] = parse_timestamp(value)
+            except ValueError:
+                raise InvalidQueryParameter(parameter, value, "an ISO 8601 timestamp")
+    return timestamps
+
+
+def provenance_response(term, code, resource):
+    """Response with the provenance for the terminology (code None or "self")
+    or one of its codes.
+
+    Query parameters:
+        since  - only changes made at or after this time (ISO 8601, UTC
+                 unless the offset says otherwise)
+        until  - only changes made before this time
+        limit  - maximum number of changes to return (defaults to
+                 LOCUTUS_PAGE_SIZE)
+        cursor - the X-Next-Cursor header from the previous page
+
+    When there are more changes to come, the cursor for the next page is
+    returned in the X-Next-Cursor header."""
+    try:
+        prov, next_cursor = term.provenance_page(
+            code=code,
+            limit=count_arg("limit", default_page_size),
+            cursor=request.args.get("cursor"),
+            **timestamp_args(),
+        )
+    except APIError as e:
+        return e.to_dict(), e.status_code, default_headers
+
+    headers = list(default_headers)
+    if next_cursor is not None:
+        headers.append(("X-Next-Cursor", next_cursor))
+
+    response = {**resource, "provenance": prov}
+    return (json.loads(json_util.dumps(response)), 200, headers)
+
+
+def provenance_by_target_response(term, resource):
+    """Response with the provenance for the terminology and all of its codes,
+    keyed by target, from a single query.
+
+    Query parameters:
+        since  - only changes made at or after this time
+        until  - only changes made before this time
+        latest - only the latest this many changes to each target"""
+    try:
+        prov = term.provenance_by_target(
+            latest=count_arg("latest"),
+            **timestamp_args(),
+        )
+    except APIError as e:
+        return e.to_dict(), e.status_code, default_headers
+
+    response = {**resource, "provenance": prov}
+    return (json.loads(json_util.dumps(response)), 200, default_headers)
+
+
 class TableProvenance(Resource):
     def get(self, id):
         table = Table.get(id)
         term = table.terminology.dereference()
 
-        prov = term.get_provenance(code="self")
-
-        response = {"table": {"Reference": f"Table/{table.id}"}, "provenance": prov}
-        return (json.loads(json_util.dumps(response)), 200, default_headers)
+        return provenance_response(
+            term, "self", {"table": {"Reference": f"Table/{table.id}"}}
+        )
 
 
 class TableVarProvenance(Resource):
@@ -27,32 +94,43 @@ class TableVarProvenance(Resource):
 
         if code == "ALL":
             code = None
-        prov = term.get_provenance(code=code)
-        response = {"table": {"Reference": f"Table/{table.id}"}, "provenance": prov}
-
-        return (json.loads(json_util.dumps(response)), 200, default_headers)
+        return provenance_response(
+            term, code, {"table": {"Reference": f"Table/{table.id}"}}
+        )
 
 
 class TerminologyProvenance(Resource):
     def get(self, id):
         term = Terminology.get(id)
 
-        prov = term.get_provenance(code="self")
-        response = {
-            "terminology": {"Reference": f"Terminology/{term.id}"},
-            "provenance": prov,
-        }
-
-        return (json.loads(json_util.dumps(response)), 200, default_headers)
+        return provenance_response(
+            term, "self", {"terminology": {"Reference": f"Terminology/{term.id}"}}
+        )
 
 
 class TerminologyCodeProvenance(Resource):
     def get(self, id, code):
         term = Terminology.get(id)
-        prov = term.get_provenance(code=code)
-        response = {
-            "terminology": {"Reference": f"Terminology/{term.id}"},
-            "provenance": prov,
-        }
 
-        return (json.loads(json_util.dumps(response)), 200, default_headers)
+        return provenance_response(
+            term, code, {"terminology": {"Reference": f"Terminology/{term.id}"}}
+        )
+
+
+class TableTargetProvenance(Resource):
+    def get(self, id):
+        table = Table.get(id)
+        term = table.terminology.dereference()
+
+        return provenance_by_target_response(
+            term, {"table": {"Reference": f"Table/{table.id}"}}
+        )
+
+
+class TerminologyTargetProvenance(Resource):
+    def get(self, id):
+        term = Terminology.get(id)
+
+        return provenance_by_target_response(
+            term, {"terminology": {"Reference": f"Terminology/{term.id}"}}
+        )
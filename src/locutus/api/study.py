@@ -2,18 +2,15 @@ from flask_restful import Resource
 from flask import request
 from locutus.model.study import Study as mStudyTerm
 from locutus.model.harmony_export import HarmonyFormat, HarmonyOutputFormat
-from locutus.api import default_headers
+from locutus.api import default_headers, list_resources
+from locutus.api.harmony import harmony_response
 
 from bson import json_util 
 import json
 
 class Studies(Resource):
     def get(self):
-        return (
-            json.loads(json_util.dumps(mStudyTerm.get(return_instance=False))),
-            200,
-            default_headers,
-        )
+        return list_resources(mStudyTerm)
 
     def post(self):
         sty = request.get_json()
@@ -38,18 +35,6 @@ class Studies(Resource):
         study.save()
         return json.loads(json_util.dumps(study.dump())), 201, default_headers
 
-    def delete_dd_references(self, id):
-        affected_ids = 0
-        
-        for study in mStudyTerm.get(return_instance=True):
-            matched_references = study.remove_dd(id)
-
-            if matched_references > 0:
-                study.save()
-                affected_ids += matched_references 
-
-        return affected_ids
-
 
 class Study(Resource):
     def get(self, id):
@@ -75,9 +60,11 @@ class Study(Resource):
         return json.loads(json_util.dumps(study.dump())), 201, default_headers
 
     def delete(self, id):
+        """Deletes the study. With ?cascade=true, its data dictionaries (see
+        DataDictionary.delete) that no other study uses are deleted as well."""
+        cascade = request.args.get("cascade", "false").lower() == "true"
         study = mStudyTerm.get(id)
-        t = study.dump()
-        study.delete()
+        t = study.delete(cascade=cascade, use_transaction=True)
 
         return json.loads(json_util.dumps(t)), 200, default_headers
 
@@ -108,13 +95,12 @@ class StudyHarmony(Resource):
         except ValueError as e:
             return {"message_to_user": str(e)}, 400, default_headers
 
-        print(f"Exporting Study Harmony: ")
-        print(f"Harmony format: {data_format}")
-        print(f"File format: {file_format}")
         t = mStudyTerm.get(id)
 
         try:
-            harmony = t.as_harmony(harmony_format=data_format, harmony_output_format=file_format)
+            return harmony_response(
+                t.iter_harmony(harmony_format=data_format, harmony_output_format=file_format),
+                file_format,
+            )
         except KeyError as e:
             return {"message_to_user": str(e)}, 400, default_headers
-        return json.loads(json_util.dumps(harmony)), 200, default_headers
@@ -4,8 +4,8 @@ from locutus.model.table import Table as mTable
 from locutus.model.provenance import Provenance 
 from locutus.model.terminology import Terminology
 from locutus.model.harmony_export import HarmonyFormat, HarmonyOutputFormat 
-from locutus.api import default_headers, get_editor
-from locutus.api.datadictionary import DataDictionaries
+from locutus.api import default_headers, get_editor, list_resources
+from locutus.api.harmony import harmony_response
 from locutus.model.exceptions import *
 from copy import deepcopy
 
@@ -112,17 +112,7 @@ class TableEdit(Resource):
 
 class Tables(Resource):
     def get(self):
-        """
-        TODO: Paginate these ResourceType/get calls
-        Technically, this will probably not get so big as to be a problem
-        but it's technically not wise to pull these into a single response.
-        We should plan on paginating this at some point."""
-
-        return (
-            json.loads(json_util.dumps(mTable.get(return_instance = False))),
-            200,
-            default_headers,
-        )
+        return list_resources(mTable)
 
     def post(self):
         tbl = request.get_json()
@@ -165,7 +155,11 @@ class Table(Resource):
         return json.loads(json_util.dumps(t.dump())), 200, default_headers
 
     def delete(self, id):
+        """Deletes the table, removing it from any data dictionaries. With
+        ?cascade=true, the table's shadow and enumeration terminologies that
+        no other table uses are deleted as well."""
         body = request.get_json()
+        cascade = request.args.get("cascade", "false").lower() == "true"
         try:
             editor = get_editor(body=body, editor=None)
             if editor is None:
@@ -180,14 +174,11 @@ class Table(Resource):
                 editor=editor,
             )
 
-            # Delete any references to the table from any data-dictionaries:
-            DataDictionaries().delete_table_references(id)
-
         except APIError as e:
             return e.to_dict(), e.status_code, default_headers
 
-        table_content = t.dump()
-        t.delete()
+        # References to the table from any data-dictionaries go with it
+        table_content = t.delete(cascade=cascade, use_transaction=True)
 
         return json.loads(json_util.dumps(table_content)), 200, default_headers
 
@@ -208,11 +199,9 @@ class HarmonyTableCSV(Resource):
         t = mTable.get(id)
 
         try:
-            print(f"Harmony Format: {data_format}")
-            print(f"Output Format: {file_format}")
-
-            harmony = t.as_harmony(harmony_format=data_format, harmony_output_format=file_format)
-
+            return harmony_response(
+                t.iter_harmony(harmony_format=data_format, harmony_output_format=file_format),
+                file_format,
+            )
         except KeyError as e:
             return {"message_to_user": str(e)}, 400, default_headers
-        return json.loads(json_util.dumps(harmony)), 200, default_headers
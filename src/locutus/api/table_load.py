@@ -1,46 +1,14 @@
 import json
 
-import rich
 from bson import json_util
 from flask import request
 from flask_restful import Resource
 
 from locutus.api import default_headers, get_editor
+from locutus.model.bulk_load import TableBulkLoader
 from locutus.model.provenance import Provenance
 from locutus.model.table import Table as mTable
-from locutus.model.terminology import Terminology as Term
-from locutus.model.variable import InvalidVariableDefinition, Variable
-
-# Eventually, these should either live in the dataset or in a top level table
-# so that the user can edit them. But, for now, we'll just maintain a static
-# set of variable representations for data type.
-_data_types = {
-    "int": "integer",
-    "bool": "boolean",
-    "number": "quantity",
-    "float": "quantity",
-    "numeric": "quantity",
-}
-
-
-def get_data_type(data_type):
-    global _data_types
-
-    dtype = data_type.lower()
-    if dtype in _data_types:
-        print(f"Swapping {dtype} out for {_data_types[dtype]}")
-        dtype = _data_types[dtype]
-
-    valid_types = Variable._factory_workers.keys()
-    if dtype not in valid_types:
-        valid_types = ", ".join(valid_types)
-        msg = (
-            f"The data_type, {data_type}, isn't one of the valid types: {valid_types}."
-        )
-        print(msg)
-        raise KeyError(msg)
-
-    return dtype
+from locutus.model.variable import InvalidVariableDefinition
 
 
 class TableLoader(Resource):
@@ -93,87 +61,21 @@ class TableLoader(Resource):
             change_type = Provenance.ChangeType.AddVariables
 
         try:
-            for varData in csvContents:
-                if "data_type" not in varData:
-                    print(
-                        f"The property, 'data_type', is missing from CSV row. {varData['variable_name']}"
-                    )
-
-                varname = varData["variable_name"]
-                code = varData.get("variable_code", varData["variable_name"])
-
-                var = {
-                    "code": code,
-                    "name": varname,
-                    "data_type": get_data_type(varData["data_type"]),
-                }
-                if "description" in varData:
-                    var["description"] = varData["description"]
-                if "min" in varData and varData["min"].strip() != "":
-                    var["min"] = varData["min"]
-                if "max" in varData and varData["max"].strip() != "":
-                    var["max"] = varData["max"]
-                if "units" in varData and varData["units"].strip() != "":
-                    var["units"] = varData["units"]
-
-                url = tbl.url
-
-                # These enums are not valid and cause non-enumerations to become enumerations
-                illegal_enums = ["NA", ""]
-
-                # Note: strip() may fail with various forms of NULL, None, etc
-                if (
-                    "enumerations" in varData
-                    and varData["enumerations"].strip() not in illegal_enums
-                ):
-                    var["data_type"] = "ENUMERATION"
-                    terminology = {
-                        "name": varname,
-                        "url": f"{url}/{code}",
-                        "codes": [],
-                    }
-
-                    for code in [
-                        x.strip() for x in varData["enumerations"].strip().split(";")
-                    ]:
-                        description = None
-
-                        if "=" in code:
-                            code, description = code.split("=")
-                        term = {"code": code, "system": url}
-                        if description is not None:
-                            term["display"] = description
-
-                        terminology["codes"].append(term)
-
-                    rich.print(terminology)
-                    t = Term(**terminology)
-                    t.save()
-                    var["enumerations"] = {"reference": f"Terminology/{t.id}"}
-                # maybe do try except here to catch errors
-                try:
-                    tbl.add_variable(var)
-                except ValueError as e:
-                    return (
-                        {"message_to_user": str(e), "data": var},
-                        400,
-                        default_headers,
-                    )
-                except InvalidVariableDefinition as e:
-                    return (
-                        {"message_to_user": e.message(), "data": e.variable},
-                        400,
-                        default_headers,
-                    )
-            tbl.save()
-            tbl.terminology.dereference().add_provenance(
-                change_type=change_type,
-                target="self",
-                editor=editor,
+            TableBulkLoader(tbl).load(
+                csvContents, editor=editor, change_type=change_type
             )
-            return json.loads(json_util.dumps(tbl.dump())), 201, default_headers
         except KeyError as e:
             return {"message_to_user": str(e)}, 400, default_headers
+        except ValueError as e:
+            return {"message_to_user": str(e)}, 400, default_headers
+        except InvalidVariableDefinition as e:
+            return (
+                {"message_to_user": e.message(), "data": e.variable},
+                400,
+                default_headers,
+            )
+
+        return json.loads(json_util.dumps(tbl.dump())), 201, default_headers
 
 
 class TableLoader2(Resource):
@@ -32,16 +32,21 @@ class TableMappings(Resource):
             }
             mappings = term.mappings()
 
+            user_input = None
+            if user_input_param:
+                user_input = MappingUserInputModel.summarize_user_input(
+                    term.id, editor
+                )
+
             for code in mappings:
                 mapping = {"code": code, "mappings": []}
                 for codingmapping in mappings.get(code, []):
-                    if user_input_param:
-                        user_input_data = (
-                            MappingUserInputModel.generate_mapping_user_input(
-                                term.id, code, codingmapping.code, editor
+                    if user_input is not None:
+                        codingmapping.user_input = (
+                            MappingUserInputModel.user_input_for(
+                                user_input, code, codingmapping.code
                             )
                         )
-                        codingmapping.user_input = user_input_data
                     # Returns valid=true mappings or mappings without the 'valid' attribute.
                     if codingmapping.valid != False:
                         mapping["mappings"].append(codingmapping.to_dict())
@@ -103,13 +108,18 @@ class TableMapping(Resource):
             mappings = term.mappings(code)
             response = {"code": code, "mappings": []}
 
+            user_input = None
+            if user_input_param:
+                user_input = MappingUserInputModel.summarize_user_input(
+                    term.id, editor, source_code=code
+                )
+
             # We should recieve a dictionary with a single key
             for codingmapping in mappings.get(code, []):
-                if user_input_param:
-                    user_input_data = MappingUserInputModel.generate_mapping_user_input(
-                        term.id, code, codingmapping.code, editor
+                if user_input is not None:
+                    codingmapping.user_input = MappingUserInputModel.user_input_for(
+                        user_input, code, codingmapping.code
                     )
-                    codingmapping.user_input = user_input_data
                 # Returns valid=true mappings or mappings without the 'valid' attribute.
                 if codingmapping.valid != False:
                     response["mappings"].append(codingmapping.to_dict())
@@ -1,9 +1,10 @@
+import logging
 from flask_restful import Resource
 from flask import request
 from locutus.model.terminology import Coding, Terminology as Term
 from locutus.model.exceptions import *
 from flask_cors import cross_origin
-from locutus.api import default_headers, delete_collection, get_editor
+from locutus.api import default_headers, delete_collection, get_editor, list_resources
 from bson import json_util 
 import json
 
@@ -62,9 +63,9 @@ class TerminologyRenameCode(Resource):
         except APIError as e:
             return e.to_dict(), e.status_code, default_headers
 
-        print(f"Code Updates requested: {code_updates}")
-        print(f"Display Updates requested: {display_updates}")
-        print(f"Description updates requested: {description_updates}")
+        logging.debug(f"Code Updates requested: {code_updates}")
+        logging.debug(f"Display Updates requested: {display_updates}")
+        logging.debug(f"Description updates requested: {description_updates}")
 
         # We MUST have at least a code or a display component to be a valid
         # PATCH
@@ -119,13 +120,7 @@ class TerminologyRenameCode(Resource):
 
 class Terminologies(Resource):
     def get(self):
-        terminologies = Term.get(return_instance=False)
-
-        return (
-            json.loads(json_util.dumps(terminologies)),
-            200,
-            default_headers,
-        )
+        return list_resources(Term)
 
     @cross_origin(allow_headers=["Content-Type"])
     def post(self):
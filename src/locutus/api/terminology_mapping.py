@@ -46,13 +46,18 @@ class TerminologyMapping(Resource):
             mappings = t.mappings(code)
             response = {"code": code, "mappings": []}
 
+            user_input = None
+            if user_input_param:
+                user_input = MappingUserInputModel.summarize_user_input(
+                    id, editor, source_code=code
+                )
+
             # We should recieve a dictionary with a single key
             for codingmapping in mappings.get(code, []):
-                if user_input_param:
-                    user_input_data = MappingUserInputModel.generate_mapping_user_input(
-                        id, code, codingmapping.code, editor
+                if user_input is not None:
+                    codingmapping.user_input = MappingUserInputModel.user_input_for(
+                        user_input, code, codingmapping.code
                     )
-                    codingmapping.user_input = user_input_data
                 # Returns valid=true mappings or mappings without the 'valid' attribute.
                 if codingmapping.valid != False:
                     response["mappings"].append(codingmapping.to_dict())
@@ -36,6 +36,12 @@ class TerminologyMappings(Resource):
                 }
                 mappings = term.mappings()
 
+                user_input = None
+                if user_input_param:
+                    user_input = MappingUserInputModel.summarize_user_input(
+                        id, editor
+                    )
+
                 for code in mappings:
 
                     # Ensure codes are not placeholders at this point.
@@ -43,13 +49,12 @@ class TerminologyMappings(Resource):
 
                     mapping = {"code": code, "mappings": []}
                     for codingmapping in mappings.get(code, []):
-                        if user_input_param:
-                            user_input_data = (
-                                MappingUserInputModel.generate_mapping_user_input(
-                                    id, code, codingmapping.code, editor
+                        if user_input is not None:
+                            codingmapping.user_input = (
+                                MappingUserInputModel.user_input_for(
+                                    user_input, code, codingmapping.code
                                 )
                             )
-                            codingmapping.user_input = user_input_data
                         # Returns valid=true mappings or mappings without the 'valid' attribute.
                         if codingmapping.valid != False:
                             mapping["mappings"].append(codingmapping.to_dict())
@@ -14,7 +14,7 @@ from locutus.api.datadictionary import (
     DataDictionaryHarmony,
     DataDictionaryTable,
 )
-from locutus.api.metadata import Version
+from locutus.api.metadata import Ready, Version
 from locutus.api.ontologies_search import OntologyAPIs, OntologyAPISearch
 from locutus.api.preferences_table import (
     TableOntologyAPISearchPreferences,
@@ -26,9 +26,11 @@ from locutus.api.preferences_term import (
 )
 from locutus.api.provenance import (
     TableProvenance,
+    TableTargetProvenance,
     TableVarProvenance,
     TerminologyCodeProvenance,
     TerminologyProvenance,
+    TerminologyTargetProvenance,
 )
 from locutus.api.sessions import SessionStart, SessionStatus, SessionTerminate
 from locutus.api.sideload import SideLoad
@@ -52,6 +54,7 @@ from locutus.api.terminology_mapping import MappingRelationship, TerminologyMapp
 from locutus.api.terminology_mappings import TerminologyMappings
 from locutus.api.user_input import TableUserInput, TerminologyUserInput
 from locutus.api.user_prefs import UserPrefOntoFilters
+from locutus.model.indexes import reconcile_indexes
 from locutus.model.lookups import FTDOntologyLookup
 from locutus.sessions import SessionManager
 
@@ -65,15 +68,51 @@ def create_app(config_filename=None):
     app.url_map.strict_slashes = False  # allow trailing slashes(code/'../')
 
     from .middleware import add_request_id_header, set_request_id
+    from .storage.stats import add_db_stats_headers, begin_db_stats
+    from .tracing import begin_trace, end_trace
+
+    from .model.provenance_queue import flush_provenance
+    from .model.unit_of_work import (
+        begin_unit_of_work,
+        commit_unit_of_work,
+        end_unit_of_work,
+    )
 
     app.before_request(set_request_id)
+    app.before_request(begin_db_stats)
+    app.before_request(begin_trace)
+    app.before_request(begin_unit_of_work)
+    # after_request functions run in reverse order, so the trace and the
+    # database stats include the pending saves written at the end
+    app.after_request(add_db_stats_headers)
+    app.after_request(end_trace)
+    app.after_request(commit_unit_of_work)
     app.after_request(add_request_id_header)
-    CORS(app)
+    # teardown functions also run in reverse order, so the queued provenance
+    # is written after the request's pending saves
+    app.teardown_request(flush_provenance)
+    app.teardown_request(end_unit_of_work)
+    # Let the frontend read our own response headers
+    CORS(
+        app,
+        expose_headers=[
+            "X-Request-Id",
+            "X-Next-Cursor",
+            "X-DB-Queries",
+            "X-DB-Documents",
+            "X-DB-Time-ms",
+        ],
+    )
     api = Api(app)
 
     # Fetch a lookup from locutus_utilities on deployment or app startup(90d expiration)
     FTDOntologyLookup.fetch_and_store_csv()
 
+    # Indexes are normally managed using locutus-indexes, but for development
+    # the app can create any that are missing when it starts
+    if os.getenv("LOCUTUS_ENSURE_INDEXES", "false").lower() in ("true", "1", "yes"):
+        reconcile_indexes()
+
     # Sessions
     session_manager = SessionManager(app)
 
@@ -81,6 +120,7 @@ def create_app(config_filename=None):
 
     # GET app version
     api.add_resource(Version, "/api/version")
+    api.add_resource(Ready, "/api/ready")
 
     api.add_resource(
         SessionStart,
@@ -210,10 +250,16 @@ def create_app(config_filename=None):
         TerminologyCodeProvenance,
         "/api/Provenance/Terminology/<string:id>/code/<path:code>",
     )
+    api.add_resource(
+        TerminologyTargetProvenance, "/api/Provenance/Terminology/<string:id>/targets"
+    )
     api.add_resource(TableProvenance, "/api/Provenance/Table/<string:id>")
     api.add_resource(
         TableVarProvenance, "/api/Provenance/Table/<string:id>/code/<path:code>"
     )
+    api.add_resource(
+        TableTargetProvenance, "/api/Provenance/Table/<string:id>/targets"
+    )
 
     # GET Ontology All OntologyAPIs and ontology details
     api.add_resource(OntologyAPIs, "/api/OntologyAPI", endpoint="all_ontologies")
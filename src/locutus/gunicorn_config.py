@@ -0,0 +1,53 @@
+"""
+Gunicorn settings for serving locutus (see locutus.wsgi).
+
+Requests spend most of their time waiting on MongoDB or the ontology search
+APIs, so each worker process runs several threads. Everything can be tuned
+through the environment:
+
+    PORT                        port to listen on (8080, what Cloud Run expects)
+    LOCUTUS_WORKERS             worker processes (2 x CPUs + 1)
+    LOCUTUS_THREADS             threads per worker (4)
+    LOCUTUS_TIMEOUT             seconds a request can run before its worker is
+                                restarted (120, harmony exports can be slow)
+    LOCUTUS_GRACEFUL_TIMEOUT    seconds workers get to finish their requests
+                                when shutting down (30)
+    LOCUTUS_KEEPALIVE           seconds to hold idle keep-alive connections (5)
+    LOCUTUS_MAX_REQUESTS        restart workers after this many requests (0, never)
+    LOCUTUS_PRELOAD             load the app before forking the workers (true)
+"""
+
+import multiprocessing
+import os
+
+
+def _flag(value):
+    return value.lower() in ("true", "1", "yes")
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+workers = int(os.getenv("LOCUTUS_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("LOCUTUS_THREADS", 4))
+worker_class = "gthread"
+
+# Loading the app once, before forking, means the workers share the startup
+# work (index checks, lookups, etc). The Mongo client is replaced in each
+# worker, so they don't share the parent's connections
+preload_app = _flag(os.getenv("LOCUTUS_PRELOAD", "true"))
+
+timeout = int(os.getenv("LOCUTUS_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("LOCUTUS_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("LOCUTUS_KEEPALIVE", 5))
+
+max_requests = int(os.getenv("LOCUTUS_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+# Containers often have a disk backed /tmp, which can stall the worker
+# heartbeat
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOCUTUS_LOGLEVEL", "warning").lower()
@@ -0,0 +1,220 @@
+"""
+Bulk ingestion of a table's variables from the CSV content supplied to
+/api/LoadTable.
+
+Adding variables one at a time (Table.add_variable) costs several round trips
+per variable: the shadow terminology is saved again after each new code, each
+enumeration's Terminology saves once per Coding and each Coding runs a lookup
+before it is inserted. For a CSV with a few thousand rows, that adds up to
+tens of thousands of calls.
+
+Instead, the TableBulkLoader validates the entire CSV up front, builds all of
+the Coding, Terminology and Table objects in memory and then writes each
+collection with a single bulk_write, inside a transaction when the database
+supports one. If anything in the CSV is invalid, nothing is written.
+"""
+
+import logging
+
+from bson import ObjectId
+
+import locutus
+from locutus.model.coding import Coding
+from locutus.model.provenance import Provenance
+from locutus.model.simple_reference import SimpleReference
+from locutus.model.table import Table
+from locutus.model.terminology import Terminology
+from locutus.model.variable import Variable
+
+# Eventually, these should either live in the dataset or in a top level table
+# so that the user can edit them. But, for now, we'll just maintain a static
+# set of variable representations for data type.
+_data_types = {
+    "int": "integer",
+    "bool": "boolean",
+    "number": "quantity",
+    "float": "quantity",
+    "numeric": "quantity",
+}
+
+# These enums are not valid and cause non-enumerations to become enumerations
+illegal_enums = ["NA", ""]
+
+
+def get_data_type(data_type):
+    global _data_types
+
+    dtype = data_type.lower()
+    if dtype in _data_types:
+        logging.debug(f"Swapping {dtype} out for {_data_types[dtype]}")
+        dtype = _data_types[dtype]
+
+    valid_types = Variable._factory_workers.keys()
+    if dtype not in valid_types:
+        valid_types = ", ".join(valid_types)
+        msg = (
+            f"The data_type, {data_type}, isn't one of the valid types: {valid_types}."
+        )
+        logging.error(msg)
+        raise KeyError(msg)
+
+    return dtype
+
+
+class TableBulkLoader:
+    """Builds everything needed to add the CSV's variables to a table and
+    writes it with a handful of bulk writes.
+
+    Errors found in the CSV are raised as the same exceptions the one at a
+    time approach raised (KeyError, ValueError and InvalidVariableDefinition)
+    but are raised before anything has been written to the database.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.shadow = table.terminology.dereference()
+
+        # Everything that must be written once the CSV has been validated
+        self.codings = []
+        self.terminologies = []
+        self.provenance = []
+
+    def build_enumerations(self, varname, url, enumerations):
+        """Create the (unsaved) Terminology and Codings for an enumerated
+        variable"""
+        terminology = Terminology(name=varname, url=url)
+        terminology._id = ObjectId()
+
+        seen = set()
+        for entry in [x.strip() for x in enumerations.strip().split(";")]:
+            code = entry
+            display = ""
+
+            if "=" in entry:
+                code, display = entry.split("=", 1)
+
+            coding = Coding(
+                _id=ObjectId(),
+                terminology_id=terminology.id,
+                code=code,
+                display=display,
+                system=terminology.url,
+            )
+            # Repeated codes would only point to the same Coding anyway
+            if coding.code in seen:
+                continue
+            seen.add(coding.code)
+
+            terminology.codes.append(
+                SimpleReference(f"Coding/{coding.id}", instance=coding)
+            )
+            self.codings.append(coding)
+
+        self.terminologies.append(terminology)
+        return terminology
+
+    def build_variable(self, varData):
+        if "data_type" not in varData:
+            logging.warning(
+                f"The property, 'data_type', is missing from CSV row. {varData['variable_name']}"
+            )
+
+        varname = locutus.normalize_ftd_placeholders(varData["variable_name"])
+        code = varData.get("variable_code", varData["variable_name"])
+
+        var = {
+            "code": code,
+            "name": varname,
+            "data_type": get_data_type(varData["data_type"]),
+        }
+        if "description" in varData:
+            var["description"] = varData["description"]
+        if "min" in varData and varData["min"].strip() != "":
+            var["min"] = varData["min"]
+        if "max" in varData and varData["max"].strip() != "":
+            var["max"] = varData["max"]
+        if "units" in varData and varData["units"].strip() != "":
+            var["units"] = varData["units"]
+
+        # Note: strip() may fail with various forms of NULL, None, etc
+        if (
+            "enumerations" in varData
+            and varData["enumerations"].strip() not in illegal_enums
+        ):
+            var["data_type"] = "ENUMERATION"
+            terminology = self.build_enumerations(
+                varname, f"{self.table.url}/{code}", varData["enumerations"]
+            )
+            var["enumerations"] = {"reference": f"Terminology/{terminology.id}"}
+
+        return Variable.deserialize(var)
+
+    def add_shadow_codes(self):
+        """Add a Coding to the shadow terminology for each of the table's
+        variables that isn't already represented there"""
+        shadow = self.shadow
+
+        missing = [
+            var for var in self.table.variables if shadow.get_coding(var.code) is None
+        ]
+
+        # Codings that were removed from the terminology but are still valid
+        # in the database are reused, just like add_code does
+        existing = {}
+        if len(missing) > 0:
+            for coding in Coding.find(
+                {
+                    "terminology_id": shadow.id,
+                    "code": {"$in": [var.code for var in missing]},
+                    "valid": True,
+                }
+            ):
+                existing.setdefault(coding.code, coding)
+
+        for var in missing:
+            if shadow.get_coding(var.code) is not None:
+                continue
+
+            coding = existing.get(var.code)
+            if coding is None:
+                coding = Coding(
+                    _id=ObjectId(),
+                    terminology_id=shadow.id,
+                    code=var.code,
+                    display=var.name,
+                    system=shadow.url,
+                    rank=len(shadow.codes),
+                )
+                self.codings.append(coding)
+            shadow._index_code(SimpleReference(f"Coding/{coding.id}", coding))
+
+    def load(self, csvContents, editor, change_type):
+        """Validate and build everything in memory and then write it all out.
+        Returns the (updated) table."""
+        for varData in csvContents:
+            self.table._insert_variable(self.build_variable(varData))
+
+        self.add_shadow_codes()
+
+        self.provenance.append(
+            Provenance(
+                terminology_id=self.shadow.id,
+                action=change_type,
+                editor=editor,
+                target=None,
+            )
+        )
+
+        # Codings first, so that nothing ever references a document that
+        # doesn't exist, should we not have the benefit of a transaction
+        with locutus.persistence().transaction() as session:
+            Coding.save_all(self.codings, session=session)
+            Terminology.save_all(self.terminologies + [self.shadow], session=session)
+            Table.save_all([self.table], session=session)
+            Provenance.save_all(self.provenance, session=session)
+
+        logging.info(
+            f"Bulk loaded {len(self.table.variables)} variables into {self.table.id} "
+            f"({len(self.codings)} codings, {len(self.terminologies)} enumerations)"
+        )
+        return self.table
@@ -0,0 +1,76 @@
+"""
+Version stamps for caches shared across processes.
+
+Each worker process keeps its own copy of a handful of slowly changing
+resources (see locutus.model.lookups.ResourceSingletonBase). When one of them
+changes, the process making the change can simply drop its copy, but every
+other worker would keep serving the old one.
+
+So, each cached resource has a version stamp, a tiny document in the
+CacheVersion collection whose version is incremented whenever the resource
+changes. Workers check the stamp every so often (a single indexed lookup by
+_id) and reload their copy only when it has moved on. This works against a
+standalone server, unlike change streams, which require a replica set.
+
+The store is pluggable; MemoryVersionStore stands in for the database in
+tests.
+"""
+
+import logging
+from threading import Lock
+
+import locutus
+from locutus.model import unit_of_work
+
+collection_name = "CacheVersion"
+
+
+class MongoVersionStore:
+    def _collection(self):
+        return locutus.persistence().collection(collection_name)
+
+    def get(self, name):
+        doc = self._collection().find_one({"_id": name})
+        if doc is None:
+            return 0
+        return doc.get("version", 0)
+
+    def bump(self, name):
+        doc = self._collection().find_one_and_update(
+            {"_id": name}, {"$inc": {"version": 1}}, upsert=True
+        )
+        return doc["version"]
+
+
+class MemoryVersionStore:
+    def __init__(self):
+        self.versions = {}
+        self._lock = Lock()
+
+    def get(self, name):
+        return self.versions.get(name, 0)
+
+    def bump(self, name):
+        with self._lock:
+            self.versions[name] = self.versions.get(name, 0) + 1
+            return self.versions[name]
+
+
+store = MongoVersionStore()
+
+
+def current(name):
+    """The resource's current version (0 if it has never changed)"""
+    return store.get(name)
+
+
+def bump(name):
+    """Let every process know the resource has changed. Within a request,
+    this waits until the request's pending saves have been written, so that
+    nobody reloads the resource before the change is in the database."""
+
+    def _bump():
+        version = store.bump(name)
+        logging.debug(f"{name} is now at cache version {version}")
+
+    unit_of_work.after_commit(_bump)
@@ -0,0 +1,225 @@
+"""
+Bulk cascading deletes.
+
+Deleting a Terminology used to walk each of its conversations, votes,
+provenance records and codings, pulling every one of them from the database
+just to delete it again. And deleting a Table or DataDictionary walked every
+DataDictionary (or Study) in the database to remove references to it. For
+large resources, that meant tens of thousands of round trips.
+
+The CascadeDelete collects everything that is to go and then deletes (or,
+for soft deletes, invalidates) it with a single delete_many/update_many per
+collection, optionally inside a transaction:
+
+    counts = CascadeDelete(hard_delete=True).terminologies(term.id).run()
+
+Terminologies take their codings, provenance and user input with them.
+Tables, DataDictionaries and Studies are removed from any DataDictionary or
+Study that references them. With cascade=True, a Study also takes its
+DataDictionaries, a DataDictionary its Tables and a Table its shadow and
+enumeration Terminologies, except for those which are still referenced by
+something that isn't being deleted.
+
+run() returns the number of documents removed from (or modified in) each
+collection rather than the documents themselves.
+"""
+
+import logging
+from collections import Counter
+from contextlib import nullcontext
+
+import locutus
+from locutus.model import unit_of_work
+
+# Collections holding documents that belong to a terminology (by
+# terminology_id) and whether they can be soft deleted (valid=False). User
+# input has no valid flag, so it always goes.
+_terminology_children = [
+    ("MappingConversation", False),
+    ("MappingVote", False),
+    ("Provenance", True),
+    ("Coding", True),
+]
+
+# parent collection => (the fields in which it references its children, the
+# children's collection)
+_owned = {
+    "Study": (["datadictionary"], "DataDictionary"),
+    "DataDictionary": (["tables"], "Table"),
+    "Table": (["terminology", "variables.enumerations"], "Terminology"),
+}
+
+# child collection => (the collection referencing it, the field of reference
+# lists to remove it from)
+_referenced_by = {
+    "DataDictionary": ("Study", "datadictionary"),
+    "Table": ("DataDictionary", "tables"),
+}
+
+
+def _references(doc, path):
+    """The reference strings at path ("variables.enumerations") in doc,
+    stepping through any lists along the way"""
+    values = [doc]
+    for key in path.split("."):
+        next_values = []
+        for value in values:
+            if isinstance(value, list):
+                value = [v.get(key) for v in value if isinstance(v, dict)]
+                next_values += [v for v in value if v is not None]
+            elif isinstance(value, dict) and value.get(key) is not None:
+                next_values.append(value[key])
+        values = next_values
+
+    references = []
+    for value in values:
+        for ref in value if isinstance(value, list) else [value]:
+            if isinstance(ref, dict) and ref.get("reference"):
+                references.append(ref["reference"])
+    return references
+
+
+class CascadeDelete:
+    def __init__(self, hard_delete=True, cascade=False, use_transaction=False):
+        self.hard_delete = hard_delete
+        self.cascade = cascade
+        self.use_transaction = use_transaction
+
+        # collection => ids to delete
+        self.ids = {
+            "Study": set(),
+            "DataDictionary": set(),
+            "Table": set(),
+            "Terminology": set(),
+        }
+        self.counts = Counter()
+
+    def studies(self, *ids):
+        self.ids["Study"].update(ids)
+        return self
+
+    def data_dictionaries(self, *ids):
+        self.ids["DataDictionary"].update(ids)
+        return self
+
+    def tables(self, *ids):
+        self.ids["Table"].update(ids)
+        return self
+
+    def terminologies(self, *ids):
+        self.ids["Terminology"].update(ids)
+        return self
+
+    def _collection(self, name):
+        return locutus.persistence().collection(name)
+
+    def _owned_children(self, parent):
+        """Ids of the children referenced by the parents being deleted that
+        nothing else references"""
+        fields, child = _owned[parent]
+        parent_ids = list(self.ids[parent])
+        if len(parent_ids) == 0:
+            return set()
+
+        projection = {"_id": 0, "id": 1}
+        for field in fields:
+            projection[f"{field}.reference"] = 1
+
+        references = set()
+        for doc in self._collection(parent).find(
+            {"id": {"$in": parent_ids}}, projection=projection, return_instance=False
+        ):
+            for field in fields:
+                references.update(_references(doc, field))
+
+        prefix = f"{child}/"
+        references = {ref for ref in references if ref.startswith(prefix)}
+        if len(references) == 0:
+            return set()
+
+        # Leave anything the other parents still need alone
+        for doc in self._collection(parent).find(
+            {
+                "id": {"$nin": parent_ids},
+                "$or": [
+                    {f"{field}.reference": {"$in": list(references)}}
+                    for field in fields
+                ],
+            },
+            projection=projection,
+            return_instance=False,
+        ):
+            for field in fields:
+                shared = references.intersection(_references(doc, field))
+                if shared:
+                    logging.info(
+                        f"Not deleting {', '.join(sorted(shared))}: still "
+                        f"referenced by {parent}/{doc.get('id')}"
+                    )
+                    references -= shared
+
+        return {ref[len(prefix):] for ref in references}
+
+    def _remove(self, collection, query, session, soft_deletable=True):
+        if self.hard_delete or not soft_deletable:
+            count = self._collection(collection).delete_many(query, session=session)
+        else:
+            count = self._collection(collection).update_many(
+                query, {"$set": {"valid": False}}, session=session
+            )
+        self.counts[collection] += count
+
+    def _remove_references(self, collection, session):
+        """Pull the references to the deleted resources out of whoever
+        references them"""
+        parent, field = _referenced_by[collection]
+        references = [f"{collection}/{id}" for id in self.ids[collection]]
+        self.counts[f"{parent}.{field}"] += self._collection(parent).update_many(
+            {f"{field}.reference": {"$in": references}},
+            {"$pull": {field: {"reference": {"$in": references}}}},
+            session=session,
+        )
+
+    def run(self):
+        """Delete everything and return the counts by collection"""
+        if self.cascade:
+            # Top down, so that each level knows everything above it that is
+            # going away
+            for parent in ["Study", "DataDictionary", "Table"]:
+                self.ids[_owned[parent][1]].update(self._owned_children(parent))
+
+        if self.use_transaction:
+            transaction = locutus.persistence().transaction()
+        else:
+            transaction = nullcontext()
+
+        with transaction as session:
+            terminology_ids = list(self.ids["Terminology"])
+            if terminology_ids:
+                query = {"terminology_id": {"$in": terminology_ids}}
+                for collection, soft_deletable in _terminology_children:
+                    self._remove(collection, query, session, soft_deletable)
+
+            for collection in ["Terminology", "Table", "DataDictionary", "Study"]:
+                ids = list(self.ids[collection])
+                if len(ids) == 0:
+                    continue
+                self._remove(collection, {"id": {"$in": ids}}, session)
+
+                # Soft deleted resources are still around to be referenced
+                if self.hard_delete and collection in _referenced_by:
+                    self._remove_references(collection, session)
+
+        for collection, ids in self.ids.items():
+            for id in ids:
+                unit_of_work.evict(collection, id)
+
+        # Imported here since the lookups are built on the models which, in
+        # turn, are built on this
+        from locutus.model.lookups import ResourceSingletonBase
+
+        for id in self.ids["Terminology"]:
+            ResourceSingletonBase.resource_changed(id)
+
+        logging.info(f"Cascade delete: {dict(self.counts)}")
+        return dict(self.counts)
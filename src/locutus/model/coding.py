@@ -7,8 +7,8 @@ from marshmallow import Schema, fields, post_load
 from pymongo import ASCENDING
 
 import locutus
-from locutus.model.exceptions import APIError
 from locutus.model.lookups import FTDConceptMapTerminology, FTDOntologyLookup
+from locutus.model import unit_of_work
 
 from .simple import Simple
 
@@ -160,28 +160,8 @@ class Coding(Simple, BasicCoding):
             logging.error(f"{terminology_id}/{_id}:{code} - {system} ")
             raise ValueError("System is a required string and cannot be empty.")
 
-        if _id is None:
-            prev = self.__class__.get(
-                _id=_id,
-                terminology_id=terminology_id,
-                code=code,
-                system=system,
-                return_instance=False,
-            )
-            if type(prev) is dict:
-                _id = prev["_id"]
-
-                if id is None:
-                    id = prev["id"]
-                if mappings == []:
-                    mappings = prev["mappings"]
-                if api_preferences is None:
-                    api_preferences = prev["api_preferences"]
-            elif type(prev) is list and len(prev) > 0:
-                raise APIError(
-                    f"FAIL: {len(prev)} codes for '{code}' in terminology_id: {terminology_id}"
-                )
-
+        # Codings without an _id may already exist in the database. Rather
+        # than looking, save() will upsert (see save())
         Simple.__init__(
             self, id=id, _id=_id, collection_type="Coding", resource_type="Coding"
         )
@@ -191,8 +171,6 @@ class Coding(Simple, BasicCoding):
         BasicCoding.__init__(
             self, code=code, system=system, display=display, description=description
         )
-        if editor is not None:
-            self.save()
 
         self.terminology_id = terminology_id.strip()
         self.rank = rank
@@ -214,6 +192,10 @@ class Coding(Simple, BasicCoding):
             self.api_preferences = OntoApiPreference(api_preferences)
         """
 
+        # Codings created on behalf of an editor are saved right away
+        if editor is not None:
+            self.save()
+
     @classmethod
     def get(
         cls,
@@ -273,6 +255,54 @@ class Coding(Simple, BasicCoding):
         def build_coding(self, data, **kwargs):
             return Coding(**data)
 
+    def save(self):
+        """Codings that we already know the _id for are saved like any other
+        Simple. Otherwise, we atomically update the (valid) coding with the
+        same terminology_id and code, creating it if there isn't one. Existing
+        mappings and api_preferences are kept unless this coding has its
+        own. New invalid codings are simply inserted, since there can be any
+        number of those for a code."""
+        if self._id is not None or self.valid is not True:
+            return Simple.save(self)
+
+        doc = self.dump()
+        doc.pop("id", None)
+        keep_existing = {
+            "mappings": doc.pop("mappings", []),
+            "api_preferences": doc.pop("api_preferences", {}),
+        }
+        on_insert = {}
+        for field, value in keep_existing.items():
+            if value:
+                doc[field] = value
+            else:
+                on_insert[field] = value
+
+        _id = ObjectId()
+        on_insert["_id"] = _id
+        on_insert["id"] = str(_id)
+
+        saved = (
+            locutus.persistence()
+            .collection(self.resource_type)
+            .find_one_and_update(
+                {
+                    "terminology_id": self.terminology_id,
+                    "code": self.code,
+                    "valid": True,
+                },
+                {"$set": doc, "$setOnInsert": on_insert},
+                upsert=True,
+            )
+        )
+
+        self._id = str(saved["_id"])
+        self.id = saved.get("id", self._id)
+        self.mappings = [CodingMapping(**mp) for mp in saved.get("mappings", [])]
+        self.api_preferences = saved.get("api_preferences", {})
+        self._snapshot = saved
+        unit_of_work.register(self.__class__.__name__, self.id, self, replace=True)
+
     def get_api_preferences(self):
         return {"api_preference": self.api_preferences}
 
@@ -296,6 +326,14 @@ class Coding(Simple, BasicCoding):
     def index_list(cls):
         "For codings, we must have either a terminology or system and the code"
         return [
+            # There can only be one valid coding for a given code in a
+            # terminology. save() relies on this to upsert safely
+            {
+                "keys": [("terminology_id", 1), ("code", 1)],
+                "unique": True,
+                "partialFilterExpression": {"valid": True},
+                "name": "unique_valid_code",
+            },
             [("terminology_id", 1), ("code", 1), ("rank", 1), ("valid", 1)],
             [("terminology_id", 1), ("rank", 1), ("valid", 1)],
             [("system", 1), ("code", 1), ("rank", 1), ("valid", 1)],
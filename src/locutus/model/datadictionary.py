@@ -1,9 +1,11 @@
 from .serializable import Serializable
 from marshmallow import Schema, fields, post_load
 
+from locutus.model.cascade import CascadeDelete
 from locutus.model.reference import Reference
 from locutus.model.harmony_export import HarmonyFormat, HarmonyOutputFormat, basic_date
 from locutus.model.harmony_export import harmony_exporter as build_harmony_exporter
+from locutus.model.harmony_pipeline import iter_harmony_rows
 
 
 """
@@ -29,6 +31,7 @@ references to the various tables that comprise the data-dictionary
 
 class DataDictionary(Serializable):
     _id_prefix = "dd"
+    _summary_counts = ["tables"]
 
     def __init__(self, id=None, _id=None, name=None, description=None, 
                     tables=None,
@@ -67,26 +70,40 @@ class DataDictionary(Serializable):
     def keys(self):
         return [self.name]
 
-    def as_harmony(self, 
+    def iter_harmony(self, 
                 harmony_exporter=None,
                 harmony_format=HarmonyFormat.Whistle,
                 harmony_output_format=HarmonyOutputFormat.JSON,
                 **kwargs):
-
+        """Yields the harmony rows from each of the tables, in order"""
         if kwargs.get('version') is None:
             kwargs['version'] = basic_date()
 
         if harmony_exporter is None:
             harmony_exporter = build_harmony_exporter(harmony_format=harmony_format, output_format=harmony_output_format)
 
-        total_mappings = []
-        for table in self.tables:
-            total_mappings += table.dereference().as_harmony(harmony_exporter=harmony_exporter, 
-                dd_name=self.name,
-                dd_id=self.id,
-                **kwargs)
-        
-        return total_mappings
+        yield from iter_harmony_rows([table.reference_id() for table in self.tables],
+            harmony_exporter,
+            dd_name=self.name,
+            dd_id=self.id,
+            **kwargs)
+
+    def as_harmony(self, **kwargs):
+        return list(self.iter_harmony(**kwargs))
+
+    def delete(self, hard_delete=True, cascade=False, use_transaction=False):
+        """Delete the data dictionary and remove it from any studies. With
+        cascade, its tables (and their terminologies) go with it, unless
+        something else still uses them. See locutus.model.cascade"""
+        t = self.dump()
+        CascadeDelete(
+            hard_delete=hard_delete, cascade=cascade, use_transaction=use_transaction
+        ).data_dictionaries(self.id).run()
+        return t
+
+    @classmethod
+    def index_list(cls):
+        return [cls._id_index]
 
     class _Schema(Schema):
         id = fields.Str()
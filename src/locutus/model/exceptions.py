@@ -77,3 +77,43 @@ class LackingRequiredParameter(APIError):
         message = f"This action requires the parameter: '{self.param}'"
         logging.error(message)
         super().__init__(message, status_code=400)
+
+
+class SearchTimeout(APIError):
+    """
+    Raised when an ontology search doesn't finish in time.
+    """
+
+    def __init__(self, apis, timeout):
+        self.apis = apis
+        self.timeout = timeout
+        message = f"The search timed out after {self.timeout}s waiting on: {', '.join(self.apis)}"
+        logging.error(message)
+        super().__init__(message, status_code=504)
+
+
+class SearchBusy(APIError):
+    """
+    Raised when every ontology search worker is busy, including with searches
+    which have already timed out but are still waiting on their APIs.
+    """
+
+    def __init__(self, running):
+        self.running = running
+        message = f"Too many ontology searches are underway ({self.running}), try again shortly"
+        logging.warning(message)
+        super().__init__(message, status_code=503)
+
+
+class InvalidQueryParameter(APIError):
+    """
+    Raised when a query parameter can't be made sense of.
+    """
+
+    def __init__(self, parameter, value, expected=None):
+        self.parameter = parameter
+        self.value = value
+        message = f"Invalid {self.parameter}: {self.value}"
+        if expected:
+            message += f" (expected {expected})"
+        super().__init__(message, status_code=400)
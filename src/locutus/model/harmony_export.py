@@ -8,6 +8,11 @@ column headers and format.
 """
 from enum import StrEnum 
 from datetime import datetime 
+import csv
+import io
+import json
+
+from bson import json_util
 
 import pdb
 
@@ -21,6 +26,8 @@ class HarmonyFormat(StrEnum):
 class HarmonyOutputFormat(StrEnum):
     CSV = "CSV"
     JSON = "JSON"
+    # Same rows as JSON, but written one object per line
+    NDJSON = "NDJSON"
 
 def harmony_exporter(harmony_format=HarmonyFormat.Whistle, 
                 output_format=HarmonyOutputFormat.JSON):
@@ -54,7 +61,10 @@ class HarmonyBase:
     ]
     def __init__(self, output_format):
         self.output_format = output_format 
-        self.data = [] 
+
+        # Rows are handed back to the caller rather than being held here, so
+        # all we need to remember is whether the CSV header has gone out yet
+        self.header_written = False
     
     def header(self):
         return [self._header_map[col] if col in self._header_map else col for col in self._header_base]
@@ -63,9 +73,9 @@ class HarmonyBase:
         # use default column names unless there is a special mapping for it
         # in _header_map 
         if self.output_format == HarmonyOutputFormat.CSV:
-            if len(self.data) == 0:
-                self.data.append(self.header())
-                return self.data[0]
+            if not self.header_written:
+                self.header_written = True
+                return self.header()
 
 
         # for JSON files, we'll merge them into the objects 
@@ -93,15 +103,13 @@ class HarmonyBase:
         rows_to_return = []
 
         if self.output_format == HarmonyOutputFormat.CSV:
-            if len(self.data) == 0:
-                row = self.init_data()
-                if row is not None:
-                    rows_to_return.append(row)
+            row = self.init_data()
+            if row is not None:
+                rows_to_return.append(row)
             row = []
 
             for col in self._header_base:
                 row.append(locals()[col])
-            self.data.append(row)
             rows_to_return.append(row)
 
         else:
@@ -112,7 +120,6 @@ class HarmonyBase:
                 else:
                     row[col] = locals()[col]
 
-            self.data.append(row)
             rows_to_return.append(row)
 
         return rows_to_return 
@@ -140,4 +147,38 @@ class FtdHarmony(HarmonyBase):
 def basic_date(t=None):
     if t is None:
         t = datetime.now()
-    return t.strftime(FTD_DATE_FORMAT)
\ No newline at end of file
+    return t.strftime(FTD_DATE_FORMAT)
+
+
+def _dumps(row):
+    return json.dumps(row, default=json_util.default)
+
+
+def encode_json_array(rows):
+    """Yield the rows as chunks of a single JSON array"""
+    prefix = "["
+    for row in rows:
+        yield prefix + _dumps(row)
+        prefix = ","
+
+    if prefix == "[":
+        yield "["
+    yield "]"
+
+
+def encode_ndjson(rows):
+    """Yield one JSON document per line"""
+    for row in rows:
+        yield _dumps(row) + "\n"
+
+
+def encode_csv(rows):
+    """Yield CSV lines. Rows are expected to be lists, as created by the
+    exporters when the output format is CSV (header first)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
@@ -0,0 +1,211 @@
+"""
+Server side harmony rows.
+
+Walking the object model to build a harmony file means pulling the table,
+dereferencing the shadow terminology, pulling each of its codings and then
+doing the same for every enumerated variable. That's a query for every code
+in the table.
+
+Instead, we hand MongoDB a single aggregation which starts from the Table
+documents, $lookups each of the relevant terminologies (the shadow terminology
+plus each variable's enumerations) and their codings and $unwinds the codings'
+mappings, so that the cursor returns one document per harmony row with the
+columns named as they are in HarmonyBase._header_base.
+"""
+
+import locutus
+
+# Sort keys carried along by the pipeline and removed before the rows are
+# returned
+_rank_fields = ["_table_rank", "_terminology_rank", "_code_rank", "_mapping_rank"]
+
+
+def _reference_id(reference):
+    """'Terminology/tm-1234' => 'tm-1234'"""
+    return {"$arrayElemAt": [{"$split": [reference, "/"]}, 1]}
+
+
+def _string(value):
+    return {"$ifNull": [value, ""]}
+
+
+# The harmony columns (see HarmonyBase._header_base) as pulled from the Table
+# and Coding documents
+_row_columns = {
+    "table_id": "$id",
+    "source_text": "$_coding.code",
+    "source_description": _string("$_coding.display"),
+    "source_domain": "$name",
+    "source_system": _string("$_coding.system"),
+    "mapping_relationship": _string("$_coding.mappings.mapping_relationship"),
+    "mapped_code": "$_coding.mappings.code",
+    "mapped_display": _string("$_coding.mappings.display"),
+    "mapped_system": _string("$_coding.mappings.system"),
+}
+
+
+def harmony_pipeline(table_ids):
+    """Aggregation yielding the harmony rows for each of the tables. Rows
+    are returned in the same order as the tables in table_ids and, within a
+    table, the shadow terminology comes first followed by the enumerations in
+    the order the variables appear. A code listed more than once in a
+    terminology yields its rows only once."""
+    return [
+        {"$match": {"id": {"$in": table_ids}}},
+        {
+            "$project": {
+                "_id": 0,
+                "id": 1,
+                "name": 1,
+                "_table_rank": {"$indexOfArray": [table_ids, "$id"]},
+                "_terminology": {
+                    "$concatArrays": [
+                        {
+                            "$cond": [
+                                {"$ifNull": ["$terminology.reference", False]},
+                                [_reference_id("$terminology.reference")],
+                                [],
+                            ]
+                        },
+                        {
+                            "$map": {
+                                "input": {
+                                    "$filter": {
+                                        "input": {"$ifNull": ["$variables", []]},
+                                        "cond": {
+                                            "$and": [
+                                                {
+                                                    "$eq": [
+                                                        "$$this.data_type",
+                                                        "ENUMERATION",
+                                                    ]
+                                                },
+                                                {
+                                                    "$ifNull": [
+                                                        "$$this.enumerations.reference",
+                                                        False,
+                                                    ]
+                                                },
+                                            ]
+                                        },
+                                    }
+                                },
+                                "in": _reference_id("$$this.enumerations.reference"),
+                            }
+                        },
+                    ]
+                },
+            }
+        },
+        {
+            "$unwind": {
+                "path": "$_terminology",
+                "includeArrayIndex": "_terminology_rank",
+            }
+        },
+        {
+            "$lookup": {
+                "from": "Terminology",
+                "localField": "_terminology",
+                "foreignField": "id",
+                "as": "_codes",
+            }
+        },
+        {"$unwind": "$_codes"},
+        {"$set": {"_codes": "$_codes.codes"}},
+        {"$unwind": {"path": "$_codes", "includeArrayIndex": "_code_rank"}},
+        {
+            "$set": {
+                "_codes": {
+                    "$convert": {
+                        "input": _reference_id("$_codes.reference"),
+                        "to": "objectId",
+                        "onError": None,
+                        "onNull": None,
+                    }
+                }
+            }
+        },
+        {
+            "$lookup": {
+                "from": "Coding",
+                "localField": "_codes",
+                "foreignField": "_id",
+                "as": "_coding",
+            }
+        },
+        {"$unwind": "$_coding"},
+        {
+            "$unwind": {
+                "path": "$_coding.mappings",
+                "includeArrayIndex": "_mapping_rank",
+            }
+        },
+        {"$project": {**_row_columns, **{field: 1 for field in _rank_fields}}},
+        {"$sort": {field: 1 for field in _rank_fields}},
+        # A terminology can list the same code more than once, but the object
+        # model keyed each terminology's mappings by code, so only the first
+        # of them made it into the harmony file
+        {
+            "$group": {
+                "_id": {
+                    "table_id": "$table_id",
+                    "terminology": "$_terminology_rank",
+                    "code": "$source_text",
+                    "mapped_code": "$mapped_code",
+                },
+                **{
+                    field: {"$first": f"${field}"}
+                    for field in [*_row_columns, *_rank_fields]
+                },
+            }
+        },
+        {"$sort": {field: 1 for field in _rank_fields}},
+        {"$unset": ["_id", *_rank_fields]},
+    ]
+
+
+# Columns the object model strips (see BasicCoding)
+_stripped_columns = [
+    "source_text",
+    "source_description",
+    "source_system",
+    "mapped_code",
+    "mapped_display",
+    "mapped_system",
+]
+
+
+def normalize_row(row):
+    """Clean up a row the way building the Coding and CodingMapping objects
+    would: placeholders in the source code are replaced (see
+    locutus.normalize_ftd_placeholders) and codes, displays and systems are
+    stripped"""
+    if isinstance(row.get("source_text"), str):
+        row["source_text"] = locutus.normalize_ftd_placeholders(row["source_text"])
+    for column in _stripped_columns:
+        if isinstance(row.get(column), str):
+            row[column] = row[column].strip()
+    return row
+
+
+def harmony_rows(table_ids):
+    """Run the pipeline and yield the rows (dicts keyed by the
+    HarmonyBase._header_base column names)"""
+    if len(table_ids) == 0:
+        return
+
+    for row in (
+        locutus.persistence()
+        .collection("Table")
+        .aggregate(harmony_pipeline(table_ids), allow_disk_use=True)
+    ):
+        yield normalize_row(row)
+
+
+def iter_harmony_rows(table_ids, harmony_exporter, **kwargs):
+    """Yield the exporter's rows for each of the tables. Any additional
+    columns (study and data-dictionary details, version, etc) are passed to
+    the exporter along with the row from the database"""
+    for row in harmony_rows(table_ids):
+        yield from harmony_exporter.add_row(**row, **kwargs)
@@ -0,0 +1,175 @@
+"""
+Index management.
+
+Each Serializable and Simple class declares the indexes its collection needs
+via index_list(). Entries are either a list of (key, direction) tuples or a
+dict with that list under "keys" alongside any index options (unique,
+partialFilterExpression, name, etc).
+
+reconcile_indexes() creates any declared index that is missing from the
+database and index_report() uses $indexStats to describe what is there,
+flagging declared indexes that are missing as well as indexes nobody has
+used (or that nobody declared).
+"""
+
+import logging
+
+from pymongo.errors import PyMongoError
+
+import locutus
+from locutus.model.serializable import Serializable
+from locutus.model.simple import Simple
+
+
+def _normalize(index):
+    if type(index) is dict:
+        keys = [tuple(key) for key in index["keys"]]
+        options = {k: v for k, v in index.items() if k != "keys"}
+    else:
+        keys = [tuple(key) for key in index]
+        options = {}
+    return keys, options
+
+
+def declared_indexes():
+    """Collection name => list of (keys, options) for every model class that
+    declares indexes"""
+    declared = {}
+
+    classes = list(Serializable._factory_workers.values()) + list(
+        Simple._factory_workers.values()
+    )
+    for cls in classes:
+        indexes = [_normalize(index) for index in cls.index_list()]
+        if len(indexes) > 0:
+            declared[cls.__name__] = indexes
+
+    return declared
+
+
+def _existing_keys(collection):
+    """key list => index name for the indexes currently on the collection"""
+    return {
+        tuple(tuple(key) for key in info["key"]): name
+        for name, info in collection.index_information().items()
+    }
+
+
+# Once the unique indexes are all there, there's no need to keep looking
+_unique_indexes_present = False
+
+
+def missing_unique_indexes():
+    """(collection, index name) for each declared unique index which doesn't
+    exist. Upserting codings and user input (see Coding.save and
+    UserInput._upsert) is only safe when these are in place; without them,
+    duplicate documents can be created and updates land on any one of
+    them."""
+    global _unique_indexes_present
+    if _unique_indexes_present:
+        return []
+
+    missing = []
+    for collection_name, indexes in declared_indexes().items():
+        unique = [(keys, options) for keys, options in indexes if options.get("unique")]
+        if len(unique) == 0:
+            continue
+
+        existing = _existing_keys(locutus.persistence().collection(collection_name))
+        for keys, options in unique:
+            if tuple(keys) not in existing:
+                missing.append((collection_name, options.get("name", "")))
+
+    _unique_indexes_present = len(missing) == 0
+    return missing
+
+
+def reconcile_indexes():
+    """Create any declared indexes that don't already exist. Returns a
+    dict, collection => list of (index, status) where status is one of
+    "present", "created" or an error message (such as when a unique index
+    can't be built because of duplicate documents)."""
+    results = {}
+
+    for collection_name, indexes in declared_indexes().items():
+        collection = locutus.persistence().collection(collection_name)
+        results[collection_name] = []
+        try:
+            existing = _existing_keys(collection)
+        except PyMongoError as e:
+            # Most likely the database can't be reached, in which case there
+            # is no point trying the rest of the collections either
+            logging.error(f"Unable to list the indexes on {collection_name}: {e}")
+            results[collection_name].append(("*", str(e)))
+            break
+
+        for keys, options in indexes:
+            description = options.get("name", ", ".join(key for key, _ in keys))
+            if tuple(keys) in existing:
+                results[collection_name].append((description, "present"))
+                continue
+
+            try:
+                collection.create_index(keys, **options)
+                logging.info(f"Created index {description} on {collection_name}")
+                results[collection_name].append((description, "created"))
+            except PyMongoError as e:
+                logging.error(
+                    f"Unable to create index {description} on {collection_name}: {e}"
+                )
+                results[collection_name].append((description, str(e)))
+
+    return results
+
+
+def index_report():
+    """Describe the indexes on each of the collections with declared
+    indexes. Returns collection => list of dicts with name, keys, ops (the
+    number of times it has been used since the server started) and status:
+
+        * missing - declared, but not in the database
+        * unused - in the database but not used since the server started
+        * undeclared - in the database but not declared by the model
+        * ok
+    """
+    report = {}
+
+    for collection_name, indexes in declared_indexes().items():
+        collection = locutus.persistence().collection(collection_name)
+        declared_keys = {tuple(keys) for keys, _ in indexes}
+
+        usage = {}
+        for stats in collection.aggregate([{"$indexStats": {}}]):
+            usage[stats["name"]] = (
+                tuple(stats["key"].items()),
+                stats.get("accesses", {}).get("ops", 0),
+            )
+
+        entries = []
+        found = set()
+        for name, (keys, ops) in usage.items():
+            found.add(keys)
+            if name == "_id_":
+                status = "ok"
+            elif keys not in declared_keys:
+                status = "undeclared"
+            elif ops == 0:
+                status = "unused"
+            else:
+                status = "ok"
+            entries.append({"name": name, "keys": keys, "ops": ops, "status": status})
+
+        for keys, options in indexes:
+            if tuple(keys) not in found:
+                entries.append(
+                    {
+                        "name": options.get("name", ""),
+                        "keys": tuple(keys),
+                        "ops": 0,
+                        "status": "missing",
+                    }
+                )
+
+        report[collection_name] = entries
+
+    return report
@@ -1,6 +1,9 @@
 import csv
 import logging
 import os
+import time
+from collections import defaultdict
+from threading import Lock, RLock
 from datetime import datetime, timedelta
 from pathlib import Path
 
@@ -9,6 +12,7 @@ from search_dragon.support import ftd_ontology_lookup
 
 import locutus
 import locutus.model.terminology
+from locutus.model import cache_version
 from locutus.model.validation import validate_enums
 
 
@@ -22,38 +26,149 @@ class ResourceSingletonBase:
             to their respective singleton instances.
         db: A database client instance, initialized when the singleton is created.
         resource_ref: A reference to the specific document or collection in the database.
-        _cached_resource: Cached data retrieved from the database, either as a dictionary (for documents)
-            or a list of dictionaries (for collections).
+        _cache: Cached data retrieved from the database (under "resource"), either as a dictionary
+            (for documents) or a list of dictionaries (for collections), along with anything the
+            subclass derives from it. It is replaced as a whole, so the two always match.
+        _ttl: Number of seconds the cached data is considered current. Set via
+            the LOCUTUS_LOOKUP_TTL environment variable. By default, the
+            cache never expires, though refresh() can always be called to
+            reload it (or invalidate() to have it reloaded when next used).
+        _version_check_interval: Number of seconds between checks of the
+            resource's version stamp (see locutus.model.cache_version), set
+            via LOCUTUS_CACHE_VERSION_CHECK (5 by default). Changes made by
+            other processes are picked up within this many seconds.
     """
 
     _instances = {}
+    _instances_lock = RLock()
+    _ttl = float(os.getenv("LOCUTUS_LOOKUP_TTL", 0)) or None
+    _version_check_interval = float(os.getenv("LOCUTUS_CACHE_VERSION_CHECK", 5))
+
+    # resource names cached by the subclasses, whose changes must bump the
+    # version stamp
+    _versioned = set()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "resource_name" in cls.__dict__:
+            ResourceSingletonBase._versioned.add(cls.resource_name)
 
     def __new__(cls, resource_name, is_collection=False):
         """Ensure only one instance of each terminology or collection is created."""
-        if (resource_name, is_collection) not in cls._instances:
-            instance = super(ResourceSingletonBase, cls).__new__(cls)
-            cls._instances[(resource_name, is_collection)] = instance
-            instance.db = locutus.persistence()  # Initialize database client
-            if is_collection:
-                # Cache the entire collection
-                instance.termref = instance.db.collection(resource_name).stream()
-                instance._cached_resource = [doc.to_dict() for doc in instance.termref]
-            else:
-                # Cache a single document
-                instance._cached_resource = locutus.model.terminology.Terminology.get(
-                    resource_name, return_instance=True
-                )
-
-                if instance._cached_resource is not None:
-                    instance._cached_resource = (
-                        instance._cached_resource.realize_as_dict()
-                    )
+        # Other threads wait for the first to finish loading the instance.
+        # Loading one resource can instantiate another (or, in the same
+        # thread, the same one), hence the RLock.
+        with ResourceSingletonBase._instances_lock:
+            if (resource_name, is_collection) not in cls._instances:
+                instance = super(ResourceSingletonBase, cls).__new__(cls)
+                cls._instances[(resource_name, is_collection)] = instance
+                instance.resource_name = resource_name
+                instance.is_collection = is_collection
+                instance._lock = Lock()
+                try:
+                    instance.refresh()
+                except Exception:
+                    del cls._instances[(resource_name, is_collection)]
+                    raise
 
         return cls._instances[(resource_name, is_collection)]
 
+    @property
+    def db(self):
+        # Not held onto, since the client is replaced in forked workers
+        return locutus.persistence()
+
+    def refresh(self):
+        """(Re)load the resource from the database along with anything the
+        subclass derives from it"""
+        with self._lock:
+            self._reload()
+
+    def _reload(self):
+        # Read the version before the data, so that a change made while we
+        # are loading is picked up by the next check
+        version = cache_version.current(self.resource_name)
+        resource = self._load()
+        cache = {**self._build_derived(resource), "resource": resource}
+
+        # Other threads keep using the old cache until it is swapped out
+        self._cache = cache
+        self._version = version
+        self._loaded_at = time.monotonic()
+        self._version_checked_at = self._loaded_at
+        self._stale = False
+
+    def _load(self):
+        if self.is_collection:
+            # Cache the entire collection
+            return [
+                doc.to_dict() for doc in self.db.collection(self.resource_name).stream()
+            ]
+
+        # Cache a single document
+        terminology = locutus.model.terminology.Terminology.get(
+            self.resource_name, return_instance=True
+        )
+        if terminology is None:
+            return None
+        return terminology.realize_as_dict()
+
+    def _build_derived(self, resource):
+        """Hook for subclasses to precompute whatever they need from the
+        resource. Called each time the resource is (re)loaded, and returns a
+        dict which is cached along with the resource."""
+        return {}
+
+    def _expired(self, now):
+        return self._stale or (self._ttl is not None and now - self._loaded_at > self._ttl)
+
+    def _due_for_version_check(self, now):
+        return now - self._version_checked_at >= self._version_check_interval
+
+    def _refresh_if_stale(self):
+        now = time.monotonic()
+        if not self._expired(now) and not self._due_for_version_check(now):
+            return
+
+        # Only one thread checks (and reloads); the others wait for it and
+        # then find that there's nothing left to do
+        with self._lock:
+            now = time.monotonic()
+            if self._expired(now):
+                self._reload()
+            elif self._due_for_version_check(now):
+                self._version_checked_at = now
+                if cache_version.current(self.resource_name) != self._version:
+                    logging.info(f"{self.resource_name} has changed, reloading it")
+                    self._reload()
+
+    def _current(self):
+        """The cache, reloaded first if need be"""
+        self._refresh_if_stale()
+        return self._cache
+
+    @classmethod
+    def resource_changed(cls, resource_name):
+        """Call this whenever the resource (a terminology id or collection
+        name) changes. Our copy is reloaded the next time it is used and the
+        version stamp is bumped so that other processes reload theirs."""
+        if resource_name not in ResourceSingletonBase._versioned:
+            return
+
+        for instance in cls._instances.values():
+            if instance.resource_name == resource_name:
+                instance._stale = True
+        cache_version.bump(resource_name)
+
+    @classmethod
+    def invalidate(cls):
+        """Reload the resource the next time it is used, here and in every
+        other process. Call this whenever the underlying documents change."""
+        cls.resource_changed(cls.resource_name)
+
     def get_cached_resource(self):
         """Access the cached terminology document."""
-        return self._cached_resource
+        return self._current()["resource"]
 
 
 class FTDConceptMapTerminology(ResourceSingletonBase):
@@ -65,20 +180,43 @@ class FTDConceptMapTerminology(ResourceSingletonBase):
         # Automatically pass the resource_name to the base class
         return super(FTDConceptMapTerminology, cls).__new__(cls, cls.resource_name)
 
+    def _build_derived(self, terminology_data):
+        if terminology_data is None:
+            logging.error(f"The terminology, {self.resource_name}, wasn't found.")
+            terminology_data = {"codes": []}
+
+        return {
+            "valid_codes": frozenset(
+                entry["code"] for entry in terminology_data["codes"] if "code" in entry
+            )
+        }
+
     def get_cached_resource(self):
         """Access the FTD Concept Map terminology document."""
         terminology_data = super().get_cached_resource()
         return terminology_data
 
+    def valid_codes(self):
+        """The set of codes found in the terminology"""
+        return self._current()["valid_codes"]
+
+    def is_valid_code(self, code, additional_enums=None):
+        """Fast check for a single code (such as a mapping_relationship)"""
+        return code in self.valid_codes() or (
+            additional_enums is not None and code in additional_enums
+        )
+
     def validate_codes_against(self, codes, additional_enums=None):
         """Validates the provided codes against the terminology."""
-        terminology_data = self.get_cached_resource()
-
-        terminology_codes = [
-            entry["code"] for entry in terminology_data["codes"] if "code" in entry
-        ]
+        # Most calls are for a single, valid, code
+        if isinstance(codes, str) and self.is_valid_code(
+            codes, additional_enums=additional_enums
+        ):
+            return True
 
-        validate_enums(codes, terminology_codes, additional_enums=additional_enums)
+        return validate_enums(
+            codes, sorted(self.valid_codes()), additional_enums=additional_enums
+        )
 
 
 class OntologyAPICollection(ResourceSingletonBase):
@@ -99,37 +237,44 @@ class OntologyAPICollection(ResourceSingletonBase):
             cls, cls.resource_name, is_collection=True
         )
 
-    def get_ontology_data(self, field):
-        """Retrieve specific field data for each ontology object.
+    def _build_derived(self, collection):
+        """Build the per-field lookups each time the collection is loaded.
         cached data format [ontologies:{ado:{ado ontology data}}]
         """
+        # field => {ONTOLOGY CODE => value}
+        field_data = defaultdict(dict)
+        ontology_keys = None
 
-        cached_data = self.get_cached_resource()
-        ontology_data = {}
-
-        for ontology_object in cached_data:
+        for ontology_object in collection:
             ontologies = ontology_object.get("ontologies", {})
+            if ontology_keys is None:
+                ontology_keys = list(ontologies.keys())
 
             for ontology_code, ontology_details in ontologies.items():
-                # Check if the requested field exists in the details
-                if field in ontology_details:
-                    ontology_data[ontology_code.upper()] = ontology_details[field]
+                for field, value in ontology_details.items():
+                    field_data[field][ontology_code.upper()] = value
 
-        logging.debug(f"ontology data {ontology_data}")
-        return ontology_data
+        return {
+            "field_data": dict(field_data),
+            "ontology_keys": ontology_keys,
+            "valid_curies": frozenset(
+                curie.upper() for curie in field_data.get("curie", {}).values()
+            ),
+        }
 
-    def get_ontology_keys(self):
-        """ """
-        cached_data = self.get_cached_resource()
-
-        for ontology_object in cached_data:
-            ontologies = ontology_object.get("ontologies", {})
-
-            ontology_keys = ontologies.keys()
+    def get_ontology_data(self, field):
+        """Retrieve specific field data for each ontology object, keyed by the
+        (upper case) ontology code. The dict is shared, so don't modify it.
+        """
+        return self._current()["field_data"].get(field, {})
 
-            ontology_keys_list = list(ontology_keys)
+    def valid_curies(self):
+        """The set of (upper case) curies across all of the ontologies"""
+        return self._current()["valid_curies"]
 
-            return ontology_keys_list
+    def get_ontology_keys(self):
+        """The ontology codes of the first OntologyAPI"""
+        return self._current()["ontology_keys"]
 
 
 class FTDOntologyLookup:
@@ -147,6 +292,7 @@ class FTDOntologyLookup:
     _expiration_days = 90
     stored_ontology_lookup = {}
     reverse_lookup = {}
+    _loaded = False
 
     @staticmethod
     def is_expired(filepath, expiration_days):
@@ -159,24 +305,38 @@ class FTDOntologyLookup:
         return datetime.now() - file_mtime > timedelta(days=expiration_days)
 
     @classmethod
-    def load_data_to_memory(cls):
+    def load_data_to_memory(cls, force=False):
         """
         Load the data from the CSV file into memory.
         This is called after the CSV is fetched or if it exists locally.
 
+        Unless force is True, this only happens once. Use reload() to pick up
+        a new copy of the lookup.
         """
-        if cls.stored_ontology_lookup:
+        if cls._loaded and not force:
             return
 
+        ontology_lookup = {}
+        reverse_lookup = {}
         for curie, system in ftd_ontology_lookup().items():
             if curie and system:
-                cls.stored_ontology_lookup[curie] = system
-                # Reverse lookup: also allow system-to-curie if needed
-                if system not in cls.reverse_lookup:
-                    cls.reverse_lookup[system] = curie
+                ontology_lookup[curie] = system
+                # Reverse lookup: the first curie for a given system wins
+                if system not in reverse_lookup:
+                    reverse_lookup[system] = curie
+
+        # Swap in the complete dicts so that nobody ever sees a partial lookup
+        cls.stored_ontology_lookup = ontology_lookup
+        cls.reverse_lookup = reverse_lookup
+        cls._loaded = True
 
         logging.debug("Ontology data loaded into memory.")
 
+    @classmethod
+    def reload(cls):
+        """Rebuild the in memory lookups from the current ontology data"""
+        cls.load_data_to_memory(force=True)
+
     @classmethod
     def fetch_and_store_csv(cls):
         """
@@ -193,18 +353,13 @@ class FTDOntologyLookup:
         """
         Get the system URL given a CURIE (e.g., 'LNC' → 'http://loinc.org').
         """
-        for curie, system in ftd_ontology_lookup().items():
-            if curie == ori_system:
-                return system
-        return ori_system
+        cls.load_data_to_memory()
+        return cls.stored_ontology_lookup.get(ori_system, ori_system)
 
     @classmethod
     def get_mapped_curie(cls, system_url):
         """
         Get the CURIE given a system URL (e.g., 'http://loinc.org' → 'LNC').
         """
-        for curie, system in ftd_ontology_lookup().items():
-            if system == system_url:
-                return curie
-
-        return ""
+        cls.load_data_to_memory()
+        return cls.reverse_lookup.get(system_url, "")
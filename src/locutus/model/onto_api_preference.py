@@ -1,4 +1,4 @@
-
+import logging
 from marshmallow import Schema, fields, post_load
 from locutus.model.exceptions import InvalidValueError
 import search_dragon.search
@@ -23,7 +23,7 @@ class OntoApiPreference:
 
     def set_preference(self, api, preferences):
         self.api_preference[api] = preferences
-        print(self.api_preference)
+        logging.debug(self.api_preference)
 
     def reset(self):
         self.api_preference = {}
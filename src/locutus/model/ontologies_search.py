@@ -4,6 +4,7 @@ from search_dragon.search import run_search
 from locutus import persistence
 from locutus.model.exceptions import InvalidValueError
 from locutus.model.lookups import OntologyAPICollection
+from locutus.model.search_cache import OntologySearch
 
 from . import Serializable
 
@@ -95,6 +96,23 @@ class OntologyAPI(Serializable):
             """
             return OntologyAPI(**data)
 
+    @classmethod
+    def ontologies_changed(cls):
+        """Drop everything derived from the OntologyAPI documents so that it
+        is rebuilt from the changes"""
+        OntologyAPICollection.invalidate()
+        OntologyAPISearchModel.clear_cache()
+
+    def save(self):
+        result = super().save()
+        OntologyAPI.ontologies_changed()
+        return result
+
+    def delete(self, hard_delete=True):
+        result = super().delete(hard_delete=hard_delete)
+        OntologyAPI.ontologies_changed()
+        return result
+
     @classmethod
     def get_api_ontologies(cls, api_id=None):
         """
@@ -117,20 +135,37 @@ class OntologyAPI(Serializable):
 
 
 class OntologyAPISearchModel:
-    def run_search_dragon(keywords, ontologies, apis, results_per_page, start_index):
+    # Created when first needed (see searcher)
+    _searcher = None
+
+    @classmethod
+    def searcher(cls):
+        """The OntologySearch running searches (concurrently and cached)
+        against search_dragon"""
+        if cls._searcher is None:
+            cls._searcher = OntologySearch(backend=run_search)
+        return cls._searcher
+
+    @classmethod
+    def clear_cache(cls):
+        if cls._searcher is not None:
+            cls._searcher.cache.clear()
+
+    @classmethod
+    def run_search_dragon(cls, keywords, ontologies, apis, results_per_page, start_index):
         onto_seed_data = OntologyAPICollection()
         onto_data = onto_seed_data.get_ontology_data("system")
 
         # Validate ontologies(FE provided) against expected ontologies(firestore)
-        onto_curies = onto_seed_data.get_ontology_data("curie")
-        valid_curies = set([curie.upper() for curie in onto_curies.values()])
+        valid_curies = onto_seed_data.valid_curies()
         for onto in ontologies:
             if onto.upper() not in valid_curies:
+                onto_curies = onto_seed_data.get_ontology_data("curie")
                 raise InvalidValueError(
                     value=f"{onto}", valid_values=onto_curies.values()
                 )
 
-        search_result = run_search(
+        search_result = cls.searcher().search(
             onto_data, keywords, ontologies, apis, results_per_page, start_index
         )
         return search_result
@@ -1,11 +1,78 @@
 from enum import StrEnum
-from datetime import datetime
-from marshmallow import Schema, fields, post_load
+from itertools import groupby
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from bson.errors import InvalidId
+from marshmallow import Schema, ValidationError, fields, post_load
+from pymongo import ASCENDING, DESCENDING
 from .simple import Simple 
+from locutus.model import provenance_queue
+from locutus.model.exceptions import InvalidQueryParameter
 from locutus.model.reference import Reference
 import locutus
 import pdb
 
+# Older provenance timestamps were stored as strings, in local time, in one of
+# these formats
+_legacy_timestamp_formats = [
+    "%Y-%m-%d %I:%M:%S.%f%p",
+    locutus.PROVENANCE_TIMESTAMP_FORMAT,
+]
+
+
+def parse_timestamp(value):
+    """Normalize a timestamp to the naive UTC datetime (to the millisecond,
+    which is all BSON keeps) that we store. Accepts datetimes (naive ones are
+    taken to be UTC, as they are when they come from the database), legacy
+    timestamp strings (local time) and ISO 8601 strings."""
+    if value is None or value == "":
+        return None
+
+    if isinstance(value, str):
+        for timestamp_format in _legacy_timestamp_formats:
+            try:
+                # astimezone treats the naive result as local time
+                value = datetime.strptime(value, timestamp_format).astimezone(
+                    timezone.utc
+                )
+                break
+            except ValueError:
+                pass
+        else:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+    if not isinstance(value, datetime):
+        raise ValueError(f"{value!r} is not a timestamp")
+
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def format_timestamp(value):
+    """The timestamp as the local time string our responses have always had"""
+    if value is None or isinstance(value, str):
+        return value
+    return (
+        parse_timestamp(value)
+        .replace(tzinfo=timezone.utc)
+        .astimezone()
+        .strftime(Provenance.PROVENANCE_TIMESTAMP_FORMAT)
+    )
+
+
+class TimestampField(fields.Field):
+    """Stored as a BSON datetime. See parse_timestamp"""
+
+    def _serialize(self, value, attr, obj, **kwargs):
+        return parse_timestamp(value)
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        try:
+            return parse_timestamp(value)
+        except ValueError as e:
+            raise ValidationError(str(e))
+
 
 class DictOrStringField(fields.Field):
     def _serialize(self, value, attr, obj, **kwargs):
@@ -81,7 +148,7 @@ class Provenance(Simple):
         self.valid = valid
 
         if timestamp is None:
-            self.timestamp = datetime.now().strftime(Provenance.PROVENANCE_TIMESTAMP_FORMAT)
+            self.timestamp = parse_timestamp(datetime.now(timezone.utc))
     
     @classmethod 
     def add_terminology_provenance(cls, 
@@ -123,12 +190,149 @@ class Provenance(Simple):
         return cls.find(params=params , 
             return_instance=False, sorting="timestamp")
 
+    @classmethod
+    def history(cls,
+                terminology_id,
+                target=None,
+                since=None,
+                until=None,
+                limit=None,
+                cursor=None,
+                valid_only=True):
+        """A page of the provenance for the terminology (target None) or one
+        of its codes, oldest first, from since (inclusive) until (exclusive).
+
+        Returns the records (dicts) and the cursor for the next page (None if
+        this is the last one). Paging is by (timestamp, _id), so it is served
+        by the (terminology_id, target, timestamp, _id) index no matter how
+        deep the page."""
+        params = {
+            "terminology_id": terminology_id,
+            "target": target,
+        }
+        if valid_only:
+            params['valid'] = True
+
+        timestamp_range = {}
+        if since is not None:
+            timestamp_range["$gte"] = parse_timestamp(since)
+        if until is not None:
+            timestamp_range["$lt"] = parse_timestamp(until)
+        if timestamp_range:
+            params["timestamp"] = timestamp_range
+
+        if cursor is not None:
+            timestamp, _id = cls.decode_cursor(cursor)
+            params = {"$and": [params, {"$or": [
+                {"timestamp": {"$gt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$gt": _id}},
+            ]}]}
+
+        cref = locutus.persistence().collection(cls.__name__)
+        records = [
+            item.to_dict()
+            for item in cref.find(
+                params,
+                sorting=[("timestamp", ASCENDING), ("_id", ASCENDING)],
+                limit=None if limit is None else limit + 1,
+            )
+        ]
+
+        next_cursor = None
+        if limit is not None and len(records) > limit:
+            records = records[:limit]
+            next_cursor = cls.encode_cursor(records[-1])
+        return records, next_cursor
+
+    @classmethod
+    def history_by_target(cls,
+                          terminology_id,
+                          since=None,
+                          until=None,
+                          latest=None,
+                          valid_only=True):
+        """The provenance for the terminology and all of its codes, from a
+        single query, grouped by target (None for the terminology itself).
+
+        Returns a dict of target => (changes, total), where changes are
+        oldest first and, when latest is given, only the latest that many of
+        the total changes to the target."""
+        params = {"terminology_id": terminology_id}
+        if valid_only:
+            params['valid'] = True
+
+        timestamp_range = {}
+        if since is not None:
+            timestamp_range["$gte"] = parse_timestamp(since)
+        if until is not None:
+            timestamp_range["$lt"] = parse_timestamp(until)
+        if timestamp_range:
+            params["timestamp"] = timestamp_range
+
+        pipeline = [{"$match": params}]
+        if latest is not None:
+            # Number each target's changes, newest first, and count them, so
+            # that only the latest changes make it past the $match. Nothing
+            # ever holds all of a target's changes at once.
+            pipeline += [
+                {"$setWindowFields": {
+                    "partitionBy": "$target",
+                    "sortBy": {"timestamp": DESCENDING, "_id": DESCENDING},
+                    "output": {
+                        "_rank": {"$documentNumber": {}},
+                        "_total": {
+                            "$count": {},
+                            "window": {"documents": ["unbounded", "unbounded"]},
+                        },
+                    },
+                }},
+                {"$match": {"_rank": {"$lte": latest}}},
+                {"$unset": "_rank"},
+            ]
+        # Served by the (terminology_id, target, timestamp, _id) index when
+        # there's no window
+        pipeline.append(
+            {"$sort": {"target": ASCENDING, "timestamp": ASCENDING, "_id": ASCENDING}}
+        )
+
+        cref = locutus.persistence().collection(cls.__name__)
+        history = {}
+        changes = cref.aggregate(pipeline, allow_disk_use=True)
+        for target, group in groupby(changes, key=lambda change: change.get("target")):
+            group = list(group)
+            total = len(group)
+            for change in group:
+                change.setdefault("id", str(change["_id"]))
+                total = change.pop("_total", total)
+            history[target] = (group, total)
+        return history
+
+    # Cursors are "<milliseconds since the epoch>-<_id>" of the last record
+    _epoch = datetime(1970, 1, 1)
+
+    @classmethod
+    def encode_cursor(cls, record):
+        timestamp = parse_timestamp(record["timestamp"])
+        epoch_ms = (timestamp - cls._epoch) // timedelta(milliseconds=1)
+        return f"{epoch_ms}-{record['_id']}"
+
+    @classmethod
+    def decode_cursor(cls, cursor):
+        try:
+            epoch_ms, _id = cursor.rsplit("-", 1)
+            timestamp = cls._epoch + timedelta(milliseconds=int(epoch_ms))
+            return timestamp, ObjectId(_id)
+        except (ValueError, InvalidId, OverflowError):
+            raise InvalidQueryParameter("cursor", cursor)
+
     @classmethod
     def index_list(cls):
         "For codings, we must have either a terminology or system and the code"
+        # _id breaks ties between identical timestamps, so that history can
+        # page through them in a stable order
         return [
-            [("terminology_id", 1), ("target", 1), ("timestamp", 1), ("valid", 1)],
-            [("terminology_id", 1), ("timestamp", 1), ("valid", 1)],
+            [("terminology_id", 1), ("target", 1), ("timestamp", 1), ("_id", 1)],
+            [("terminology_id", 1), ("timestamp", 1), ("_id", 1)],
         ]
 
     @classmethod 
@@ -175,7 +379,7 @@ class Provenance(Simple):
         editor = fields.Str(required=True)
         new_value = fields.Str()
         old_value = DictOrStringField() 
-        timestamp = fields.Str()
+        timestamp = TimestampField()
         valid = fields.Bool()
 
         target = fields.Str()
@@ -185,6 +389,15 @@ class Provenance(Simple):
             return Provenance(**data)
 
 
+    def save(self):
+        """New provenance is queued and written in batches (see
+        locutus.model.provenance_queue). Changes to existing provenance are
+        saved as usual."""
+        if self._id is None and provenance_queue.enabled:
+            provenance_queue.enqueue(self)
+        else:
+            super().save()
+
     def delete(self, hard_delete=True):
         if not hard_delete:
             self.valid = False 
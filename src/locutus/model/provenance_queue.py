@@ -0,0 +1,315 @@
+"""
+Write-behind queue for new provenance records.
+
+Almost every edit adds two or three provenance records, and saving each one
+as it happens costs a round trip apiece on the edit's critical path. Instead,
+Provenance.save() hands new records to this queue, which writes them with a
+single insert_many when:
+
+    * the request finishes (see flush_provenance, a teardown_request hook),
+    * LOCUTUS_PROVENANCE_QUEUE_SIZE records are waiting (100), or
+    * the oldest waiting record is LOCUTUS_PROVENANCE_FLUSH_INTERVAL seconds
+      old (2), which covers scripts and anything else outside of a request.
+
+Anything that reads from (or otherwise touches) the Provenance collection
+flushes the queue first (see locutus.storage.mongo._flush_pending), so
+nobody ever reads around records that are still waiting.
+
+Records get their _id when they are queued, which makes writing them again
+harmless. If a write fails (for any reason), the records are appended to a
+spool file (LOCUTUS_PROVENANCE_SPOOL) rather than dropped, and the spool is
+replayed by the next successful flush. The queue is also flushed when the
+process exits.
+
+The spool is only as durable as the disk it's on. Set LOCUTUS_PROVENANCE_SPOOL
+to a path on persistent storage; the default, in the temp directory, is
+in-memory on some platforms (Cloud Run, for one) and lost with the instance,
+so a warning is logged at startup when it is used.
+
+stats() reports the queue's depth along with counts of what has been
+written and spooled, and is included in the /api/ready response.
+
+Setting LOCUTUS_PROVENANCE_WRITE_BEHIND=false writes each record as it is
+saved, as we always used to.
+"""
+
+import atexit
+import logging
+import os
+import tempfile
+import time
+from copy import deepcopy
+from threading import Event, Lock, Thread, get_ident
+
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError
+
+import locutus
+
+collection_name = "Provenance"
+
+enabled = os.getenv("LOCUTUS_PROVENANCE_WRITE_BEHIND", "true").lower() in (
+    "true",
+    "1",
+    "yes",
+)
+max_size = int(os.getenv("LOCUTUS_PROVENANCE_QUEUE_SIZE", 100))
+flush_interval = float(os.getenv("LOCUTUS_PROVENANCE_FLUSH_INTERVAL", 2))
+spool_path = os.getenv("LOCUTUS_PROVENANCE_SPOOL")
+if spool_path is None:
+    spool_path = os.path.join(tempfile.gettempdir(), "locutus-provenance-spool.jsonl")
+    if enabled:
+        logging.warning(
+            f"LOCUTUS_PROVENANCE_SPOOL isn't set, so provenance that can't be "
+            f"written is spooled to {spool_path}, which may not survive a "
+            f"restart. Set it to a path on persistent storage."
+        )
+
+# MongoDB's duplicate key error. Since every record has its _id before it is
+# written, a duplicate just means it was already written.
+_duplicate_key = 11000
+
+
+class ProvenanceQueue:
+    def __init__(self, max_size=100, flush_interval=2, spool_path=None, clock=time.monotonic):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self.clock = clock
+
+        self._documents = []
+        # When the oldest of the waiting documents was queued
+        self._oldest = None
+        self._lock = Lock()
+
+        # Held for the entire flush, so that anyone flushing (in order to
+        # read) waits for a flush already underway to finish writing
+        self._flush_lock = Lock()
+        # Writing to the collection asks for a flush, which the thread doing
+        # the flushing can ignore
+        self._flushing = None
+
+        # Whether there might be a spool to replay. A spool left behind by
+        # an earlier process is picked up by the first flush.
+        self._spool_pending = self._spool_exists()
+
+        self._timer = None
+        self._stopped = Event()
+
+        self.written = 0
+        self.spooled = 0
+        self.failed_flushes = 0
+
+    def __len__(self):
+        return len(self._documents)
+
+    def put(self, document):
+        with self._lock:
+            self._documents.append(document)
+            if self._oldest is None:
+                self._oldest = self.clock()
+            full = len(self._documents) >= self.max_size
+
+        if full:
+            self.flush()
+        else:
+            self._start_timer()
+
+    def _take(self):
+        with self._lock:
+            documents, self._documents = self._documents, []
+            self._oldest = None
+        return documents
+
+    def flush(self):
+        """Write everything waiting (and anything spooled by an earlier
+        failure). Returns the number of documents written."""
+        if self._flushing == get_ident():
+            return 0
+        # The usual case, checked (without the lock) for every Provenance read
+        if len(self._documents) == 0 and not self._spool_pending:
+            return 0
+
+        with self._flush_lock:
+            self._flushing = get_ident()
+            try:
+                return self._flush()
+            finally:
+                self._flushing = None
+
+    def _flush(self):
+        documents = self._take()
+        if len(documents) == 0 and not self._spool_pending:
+            return 0
+
+        # The documents are no longer queued, so whatever goes wrong they
+        # must be spooled rather than dropped
+        try:
+            written = self._write(documents)
+        except Exception as e:
+            self.failed_flushes += 1
+            logging.error(
+                f"Unable to write {len(documents)} provenance record(s), "
+                f"spooling them to {self.spool_path}: {e!r}"
+            )
+            self._spool(documents)
+            return 0
+
+        self.written += written
+        self._replay_spool()
+        return written
+
+    def _write(self, documents):
+        if len(documents) == 0:
+            return 0
+        try:
+            locutus.persistence().collection(collection_name).insert_many(
+                documents, ordered=False
+            )
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != _duplicate_key for error in errors):
+                raise
+        return len(documents)
+
+    def _spool_exists(self):
+        return self.spool_path is not None and os.path.exists(self.spool_path)
+
+    def _spool(self, documents):
+        if len(documents) == 0:
+            return
+        if self._append_spool(documents):
+            self.spooled += len(documents)
+            self._spool_pending = True
+
+    def _append_spool(self, documents):
+        if self.spool_path is None:
+            logging.critical(
+                f"Dropping {len(documents)} provenance record(s): no spool file"
+            )
+            return False
+
+        try:
+            with open(self.spool_path, "a") as spool:
+                for document in documents:
+                    spool.write(json_util.dumps(document) + "\n")
+        except OSError as e:
+            logging.critical(
+                f"Dropping {len(documents)} provenance record(s): unable to "
+                f"write to {self.spool_path}: {e}"
+            )
+            return False
+        return True
+
+    def _replay_spool(self):
+        if not self._spool_pending:
+            return
+        self._spool_pending = False
+
+        # Claim the spool, so that no other process replays it too
+        claimed = f"{self.spool_path}.{os.getpid()}"
+        try:
+            os.replace(self.spool_path, claimed)
+        except FileNotFoundError:
+            return
+
+        with open(claimed) as spool:
+            documents = [json_util.loads(line) for line in spool if line.strip()]
+
+        try:
+            written = self._write(documents)
+        except Exception as e:
+            logging.error(f"Unable to replay spooled provenance: {e!r}")
+            self._spool_pending = self._append_spool(documents)
+        else:
+            logging.warning(f"Replayed {written} spooled provenance record(s)")
+            self.written += written
+        os.remove(claimed)
+
+    def _start_timer(self):
+        if self._timer is not None or self.flush_interval <= 0:
+            return
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = Thread(
+                target=self._run_timer, name="provenance-flush", daemon=True
+            )
+            self._timer.start()
+
+    def _run_timer(self):
+        while not self._stopped.wait(self.flush_interval / 2):
+            oldest = self._oldest
+            if oldest is not None and self.clock() - oldest >= self.flush_interval:
+                try:
+                    self.flush()
+                except Exception:
+                    logging.exception("Provenance flush failed")
+
+    def stop(self):
+        self._stopped.set()
+
+    def stats(self):
+        return {
+            "depth": len(self._documents),
+            "written": self.written,
+            "spooled": self.spooled,
+            "failed_flushes": self.failed_flushes,
+        }
+
+
+queue = ProvenanceQueue(
+    max_size=max_size, flush_interval=flush_interval, spool_path=spool_path
+)
+
+
+def enqueue(instance):
+    """Queue a new (Provenance) instance to be written. It gets its _id now,
+    so it can be referenced right away."""
+    if instance._id is None:
+        instance._id = ObjectId()
+    instance.id = str(instance._id)
+
+    document = instance.dump()
+    instance._snapshot = deepcopy(document)
+    document["_id"] = ObjectId(instance._id)
+    queue.put(document)
+
+
+def flush():
+    return queue.flush()
+
+
+def depth():
+    return len(queue)
+
+
+def stats():
+    return queue.stats()
+
+
+def flush_provenance(exc=None):
+    """teardown_request hook"""
+    try:
+        queue.flush()
+    except Exception:
+        logging.exception("Unable to flush the provenance queue")
+
+
+def _forget_queue():
+    """A forked child starts with an empty queue (and no timer thread) of its
+    own; the parent remains responsible for what it had queued"""
+    global queue
+    queue = ProvenanceQueue(
+        max_size=max_size, flush_interval=flush_interval, spool_path=spool_path
+    )
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_queue)
+
+
+@atexit.register
+def _flush_at_exit():
+    queue.stop()
+    flush_provenance()
@@ -1,6 +1,11 @@
+import logging
+from collections import defaultdict
+
 from .serializable import Serializable
 from marshmallow import Schema, fields, post_load
 import locutus
+from locutus.model import unit_of_work
+from locutus.tracing import traced
 
 
 """
@@ -8,13 +13,48 @@ The reference just represents a placeholder for an entity from another table
 """
 
 
+def dereference_all(references, registry, reference_class):
+    """Populate the cache for each of the references using a single $in
+    query per resource type rather than one query per reference.
+
+    registry is the factory (resource type => class) the references' types
+    are found in and reference_class provides the query for a batch of ids
+    (_in_filter) and the id of each instance found (_instance_id).
+
+    References that are already cached are left alone and any reference
+    whose document can't be found remains uncached, so a subsequent call
+    to dereference() behaves exactly as it would have otherwise."""
+    pending = defaultdict(lambda: defaultdict(list))
+    for ref in references:
+        if ref._reference is None and ref.reference is not None:
+            resource_type, id = ref.reference.split("/")
+            resource_class = registry[resource_type.lower()]
+            ref._reference = unit_of_work.lookup(resource_class.__name__, id)
+            if ref._reference is None:
+                pending[resource_type][id].append(ref)
+
+    for resource_type, refs_by_id in pending.items():
+        resource_class = registry[resource_type.lower()]
+        query = reference_class._in_filter(list(refs_by_id))
+        if query is None:
+            continue
+
+        for instance in resource_class.find(query):
+            id = str(reference_class._instance_id(instance))
+            instance = unit_of_work.register(resource_class.__name__, id, instance)
+            for ref in refs_by_id.get(id, []):
+                ref._reference = instance
+
+    return references
+
+
 class Reference(Serializable):
     """A FHIR-like reference entity-for our needs, the reference should be to
     a local url."""
 
     def __init__(self, reference=None, instance=None):
         if type(reference) is not str:
-            print(f"What sort of reference is this?\n{reference}")
+            logging.warning(f"What sort of reference is this?\n{reference}")
 
         self.reference = reference
 
@@ -49,3 +89,18 @@ class Reference(Serializable):
 
     def reference_id(self):
         return self.reference.split("/")[-1]
+
+    @classmethod
+    @traced()
+    def dereference_all(cls, references):
+        """See dereference_all"""
+        return dereference_all(references, Serializable._factory_workers, cls)
+
+    @classmethod
+    def _in_filter(cls, ids):
+        """Filter for the documents with these ids (see dereference_all)"""
+        return {"id": {"$in": ids}}
+
+    @classmethod
+    def _instance_id(cls, instance):
+        return instance.id
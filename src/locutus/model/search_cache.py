@@ -0,0 +1,201 @@
+"""
+Concurrent, cached ontology searches.
+
+Curators tend to type-ahead search for the same handful of keywords over and
+over again, and each search waits on one or more remote ontology APIs. So:
+
+    * Results are kept in an LRU cache, for a limited time, keyed by the
+      keyword, ontologies, APIs and page.
+    * Concurrent requests for the same search wait on the one already in
+      flight rather than repeating it.
+    * The search runs on a shared thread pool, so that a search which takes
+      too long can be abandoned (SearchTimeout, a 504) rather than holding
+      the request up indefinitely.
+
+Each search is a single call to the backend, for all of the selected APIs,
+so the response (and its paging) is exactly what the backend returns. That
+means one timeout for the whole search rather than one per API; searching
+the APIs separately would mean merging their pages ourselves.
+
+An abandoned call can't be stopped and keeps its worker until the APIs answer.
+Rather than queue behind those (with the wait counting against the timeout),
+a search is turned away with SearchBusy (a 503) when every worker is taken. The backend is anything
+that can be called like search_dragon's run_search, which makes it easy to
+swap in a stub for testing.
+
+Settings:
+    LOCUTUS_SEARCH_CACHE_SIZE   number of searches to keep (512)
+    LOCUTUS_SEARCH_CACHE_TTL    seconds to keep them (300)
+    LOCUTUS_SEARCH_TIMEOUT      seconds to wait on a search (20)
+    LOCUTUS_SEARCH_WORKERS      number of searches in flight at once (8)
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from threading import Lock
+
+from locutus.model.exceptions import SearchBusy, SearchTimeout
+
+_missing = object()
+
+
+class SearchCache:
+    """Thread safe LRU cache whose entries expire after ttl seconds, with
+    in-flight request coalescing (see get_or_compute)"""
+
+    def __init__(self, max_size=512, ttl=300, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+
+        # key => (expiration, value), least recently used first
+        self._entries = OrderedDict()
+        # key => Future for computations currently underway
+        self._in_flight = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _missing
+        if entry[0] <= self.clock():
+            del self._entries[key]
+            return _missing
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._get(key)
+        return default if value is _missing else value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_compute(self, key, compute, should_cache=None):
+        """Return the cached value for key or compute (and, if should_cache
+        says so, cache) it. If another thread is already computing it, we
+        wait for that result (or exception) instead."""
+        with self._lock:
+            value = self._get(key)
+            if value is not _missing:
+                return value
+
+            future = self._in_flight.get(key)
+            computing = future is None
+            if computing:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not computing:
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            if should_cache is None or should_cache(value):
+                self.put(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+
+class OntologySearch:
+    def __init__(self, backend, cache=None, timeout=None, max_workers=None):
+        self.backend = backend
+        if cache is None:
+            cache = SearchCache(
+                max_size=int(os.getenv("LOCUTUS_SEARCH_CACHE_SIZE", 512)),
+                ttl=float(os.getenv("LOCUTUS_SEARCH_CACHE_TTL", 300)),
+            )
+        self.cache = cache
+        self.timeout = timeout or float(os.getenv("LOCUTUS_SEARCH_TIMEOUT", 20))
+        self.max_workers = max_workers or int(os.getenv("LOCUTUS_SEARCH_WORKERS", 8))
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="ontology-search"
+        )
+
+        # Calls to the backend which haven't returned yet, and those of them
+        # which have timed out
+        self._lock = Lock()
+        self._running = set()
+        self._abandoned = set()
+
+    def stats(self):
+        with self._lock:
+            return {"running": len(self._running), "abandoned": len(self._abandoned)}
+
+    def _finished(self, future):
+        with self._lock:
+            self._running.discard(future)
+            self._abandoned.discard(future)
+
+    @staticmethod
+    def cache_key(keywords, ontologies, apis, results_per_page, start_index):
+        return (
+            " ".join(keywords.lower().split()),
+            tuple(sorted(ontology.upper() for ontology in ontologies)),
+            tuple(sorted(api.lower() for api in apis)),
+            str(results_per_page),
+            str(start_index),
+        )
+
+    def search(self, onto_data, keywords, ontologies, apis, results_per_page, start_index):
+        key = self.cache_key(keywords, ontologies, apis, results_per_page, start_index)
+        return self.cache.get_or_compute(
+            key,
+            lambda: self._run(
+                onto_data, keywords, ontologies, apis, results_per_page, start_index
+            ),
+        )
+
+    def _run(self, onto_data, keywords, ontologies, apis, results_per_page, start_index):
+        with self._lock:
+            if len(self._running) >= self.max_workers:
+                raise SearchBusy(len(self._running))
+            future = self.executor.submit(
+                self.backend,
+                onto_data,
+                keywords,
+                ontologies,
+                apis,
+                results_per_page,
+                start_index,
+            )
+            self._running.add(future)
+        future.add_done_callback(self._finished)
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                if not future.done():
+                    self._abandoned.add(future)
+                abandoned = len(self._abandoned)
+            logging.warning(
+                f"Ontology search of {', '.join(apis)} timed out ({keywords}), "
+                f"{abandoned} abandoned search(es) still waiting on their APIs"
+            )
+            raise SearchTimeout(apis, self.timeout)
@@ -4,7 +4,10 @@ from nanoid import generate
 
 import locutus 
 import locutus.model.global_id
-from pymongo import ASCENDING
+from locutus.model import unit_of_work
+from locutus.tracing import traced
+from bson import ObjectId
+from pymongo import ASCENDING, ReplaceOne
 
 import pdb
 
@@ -14,6 +17,10 @@ class Serializable:
     # deserialization
     _factory_workers = {}
 
+    # The document as it was when last pulled from (or written to) the 
+    # database. Used to limit writes to what has actually changed. 
+    _snapshot = None
+
     def __init__(self, id=None, _id=None, collection_type=None, resource_type=None):
         self.id = id
         # For Simple objects, we won't have an actual ID, we'll keep both, but here, 
@@ -31,18 +38,46 @@ class Serializable:
 
 
     @classmethod
-    def find(cls, params, sorting=None, return_instance=True):
-        """Pull instance from the database and (default) instantiate"""
+    @traced()
+    def find(
+        cls,
+        params,
+        sorting=None,
+        return_instance=True,
+        projection=None,
+        limit=None,
+        after=None,
+    ):
+        """Pull instance from the database and (default) instantiate
+
+        A projection can be used to limit (or compute) the fields returned,
+        but only when return_instance is False, since we can't build an
+        instance from part of a document.
+
+        limit and after page through the results by id (see
+        CollectionReference.find)."""
+        if projection is not None and return_instance:
+            raise ValueError("A projection can only be used with return_instance=False")
 
         items = []
 
         # Return a single resource
         cref = locutus.persistence().collection(cls.__name__)
-        for item in cref.find(params, sorting=sorting):
+        for item in cref.find(
+            params,
+            sorting=sorting,
+            projection=projection,
+            limit=limit,
+            after=after,
+            cursor_field="id",
+        ):
             item = item.to_dict()
 
             if return_instance:
-                items.append(cls(**item))
+                snapshot = deepcopy(item)
+                instance = cls(**item)
+                instance._snapshot = snapshot
+                items.append(instance)
             else:
                 items.append(item)
 
@@ -56,20 +91,30 @@ class Serializable:
         return resource_class.get(id=id, return_instance=return_instance)
 
     @classmethod
-    def get(cls, id=None, return_instance=True):
-        """Pull instance from the database and (default) instantiate"""
+    @traced()
+    def get(cls, id=None, return_instance=True, projection=None, limit=None, after=None):
+        """Pull instance from the database and (default) instantiate
+
+        When id is None, all items of this type are returned (ordered by id).
+        limit and after can be used to page through them: after is the id of
+        the last item of the previous page."""
 
         # Return all items of this type.
         if id is None:
-            serializables = []
-
-            for item in locutus.persistence().collection(cls.__name__).stream():
-                item = item.to_dict()
-                if return_instance:
-                    serializables.append(cls(**item))
-                else:
-                    serializables.append(item)
-            return serializables
+            return cls.find(
+                {},
+                sorting=[("id", 1)],
+                return_instance=return_instance,
+                projection=projection,
+                limit=limit,
+                after=after,
+            )
+
+        # Within a request, we only need to pull it once
+        if return_instance:
+            instance = unit_of_work.lookup(cls.__name__, id)
+            if instance is not None:
+                return instance
 
         # Return a single resource
         resource = cls.find(params={"id": id}, return_instance=return_instance)
@@ -77,6 +122,8 @@ class Serializable:
         if len(resource) == 0:
             return None
 
+        if return_instance:
+            return unit_of_work.register(cls.__name__, id, resource[0])
         return resource[0]
 
     def identify(self):
@@ -88,6 +135,7 @@ class Serializable:
             # self.id = gid.id
             self.id = f"{locutus.model.resource_types[self.resource_type]._id_prefix}-{generate()}"
 
+    @traced()
     def save(self):
         # commit the data to persistent storage
         
@@ -98,7 +146,57 @@ class Serializable:
                     id_matches = id_matches[0]
                 self._id = id_matches['_id']
 
-        self._id = locutus.persistence().collection(self.resource_type).document(self._id).set(self.dump())
+        # Only what has changed is written (see unit_of_work.save_instance)
+        self._id = unit_of_work.save_instance(self.resource_type, self)
+        unit_of_work.register(self.__class__.__name__, self.id, self, replace=True)
+
+    @classmethod
+    @traced()
+    def save_all(cls, instances, session=None):
+        """Commit all of the instances using a single bulk_write rather than
+        one round trip each. Unlike save(), this doesn't go looking for an
+        existing _id, so instances without one are assumed to be new."""
+        requests = []
+        for instance in instances:
+            if instance._id is None:
+                instance._id = ObjectId()
+            doc = instance.dump()
+            doc["_id"] = ObjectId(instance._id)
+            if "id" not in doc:
+                doc["id"] = instance.id
+            requests.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+
+        locutus.persistence().collection(cls.__name__).bulk_write(
+            requests, ordered=False, session=session
+        )
+
+    # Lists (such as a Table's variables) whose length is reported, as
+    # <field>_count, when summarizing resources (see summary_projection)
+    _summary_counts = []
+
+    @classmethod
+    def summary_projection(cls):
+        """Projection for the handful of fields needed to list resources
+        without pulling the whole document"""
+        projection = {
+            "_id": 0,
+            "id": 1,
+            "name": 1,
+            "title": 1,
+            "url": 1,
+            "resource_type": 1,
+        }
+        for field in cls._summary_counts:
+            projection[f"{field}_count"] = {"$size": {"$ifNull": [f"${field}", []]}}
+        return projection
+
+    # Resources are looked up by id far more than anything else
+    _id_index = {"keys": [("id", 1)], "unique": True, "name": "unique_id"}
+
+    @classmethod
+    def index_list(cls):
+        "Indexes for the class's collection (see locutus.model.indexes)"
+        return []
 
     def dump(self):
         return self.__class__._get_schema().dump(self)
@@ -148,6 +246,7 @@ class Serializable:
             del d["resource_type"]
         return cls._factory_workers[data["resource_type"].lower()](**d)
 
+    @traced()
     def delete(self, hard_delete=True):
         if not hard_delete:
             self.valid = False 
@@ -158,5 +257,7 @@ class Serializable:
             t = dref.get().to_dict()
 
             time_of_delete = dref.delete()
+            unit_of_work.evict(self.__class__.__name__, self.id,
+                    collection=self.resource_type, _id=self._id)
 
         return t
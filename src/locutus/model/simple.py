@@ -1,7 +1,9 @@
 from copy import deepcopy
 
 import locutus
-from pymongo import ASCENDING
+from locutus.model import unit_of_work
+from locutus.tracing import traced
+from pymongo import ASCENDING, ReplaceOne
 
 from bson import ObjectId
 
@@ -10,6 +12,10 @@ class Simple:
     _schema = None 
     _factory_workers = {}
 
+    # The document as it was when last pulled from (or written to) the
+    # database. Used to limit writes to what has actually changed.
+    _snapshot = None
+
     def __init__(self, _id=None, id=None, collection_type=None, resource_type=None):
         self.id = id 
         self._id = _id
@@ -23,22 +29,44 @@ class Simple:
         self.resource_type = resource_type 
 
     @classmethod 
+    @traced()
     def pull(cls, resource_type, id, return_instance=True):
         resource_class = cls._factory_workers[resource_type.lower()]
+
+        # Within a request, we only need to pull it once
+        if return_instance:
+            instance = unit_of_work.lookup(resource_class.__name__, id)
+            if instance is not None:
+                return instance
+
+            return unit_of_work.register(
+                resource_class.__name__,
+                id,
+                resource_class.get(_id=id, return_instance=return_instance),
+            )
         return resource_class.get(_id=id, return_instance=return_instance)
 
     @classmethod
-    def find(cls, params, sorting=None, return_instance=True):
-        """Pull instance from the database and (default) instantiate"""
+    @traced()
+    def find(cls, params, sorting=None, return_instance=True, projection=None):
+        """Pull instance from the database and (default) instantiate
+
+        As with Serializable.find, a projection can only be used when
+        return_instance is False."""
+        if projection is not None and return_instance:
+            raise ValueError("A projection can only be used with return_instance=False")
 
         items = []
 
         # Return a single resource
         cref = locutus.persistence().collection(cls.__name__)
-        for item in cref.find(params, sorting=sorting):
+        for item in cref.find(params, sorting=sorting, projection=projection):
             item = item.to_dict()
             if return_instance:
-                items.append(cls(**item))
+                snapshot = deepcopy(item)
+                instance = cls(**item)
+                instance._snapshot = snapshot
+                items.append(instance)
             else:
                 items.append(item)
 
@@ -51,10 +79,18 @@ class Simple:
 
     @classmethod 
     def create_indexes(cls):
+        """Indexes are either a list of (key, dir) tuples or a dict with the
+        list under "keys" and any other index options (unique, 
+        partialFilterExpression, etc) alongside it"""
         index_items = cls.index_list()
+        collection = locutus.persistence().collection(cls.__name__)
 
         for idx in index_items:
-            collection.create_index(idx)
+            if type(idx) is dict:
+                options = {k: v for k, v in idx.items() if k != "keys"}
+                collection.create_index(idx["keys"], **options)
+            else:
+                collection.create_index(idx)
         # For now, let's not do this. I suspect nothing really needs this sort of work done. We'll explicity enumerate all valid indexes
         """
         for idx in index_items:
@@ -64,10 +100,13 @@ class Simple:
                 idx.pop(0)
         """
 
+    @traced()
     def save(self):
-        # commit the data to persistent storage
-        self._id = locutus.persistence().collection(self.resource_type).document(self._id).set(self.dump())
+        # commit the data to persistent storage (only what has changed, see
+        # unit_of_work.save_instance)
+        self._id = unit_of_work.save_instance(self.resource_type, self)
         self.id = str(self._id)
+        unit_of_work.register(self.__class__.__name__, self.id, self, replace=True)
 
         # EST - 2025-05-25 -- Leaving this here as an example to profile tricky bugs
         # especially for situations where you have asynchronous calls
@@ -77,6 +116,25 @@ class Simple:
         #     print(self.dump())
         #     print("--------------------------")
 
+    @classmethod
+    @traced()
+    def save_all(cls, instances, session=None):
+        """Commit all of the instances using a single bulk_write rather than
+        one round trip each. Instances without an _id have one assigned here
+        so that callers can reference them before the write happens."""
+        requests = []
+        for instance in instances:
+            if instance._id is None:
+                instance._id = ObjectId()
+                instance.id = str(instance._id)
+            doc = instance.dump()
+            doc["_id"] = ObjectId(instance._id)
+            requests.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+
+        locutus.persistence().collection(cls.__name__).bulk_write(
+            requests, ordered=False, session=session
+        )
+
     def dump(self):
         return self.__class__._get_schema().dump(self)
 
@@ -107,6 +165,7 @@ class Simple:
             del d["resource_type"]
         return cls._factory_workers[data["resource_type"].lower()](**d)
     
+    @traced()
     def delete(self, hard_delete=False):
         if hasattr(self, 'valid') and not hard_delete:
             self.valid =False 
@@ -117,4 +176,6 @@ class Simple:
             t = dref.get().to_dict()
 
             time_of_delete = dref.delete()
+            unit_of_work.evict(self.__class__.__name__, self.id,
+                    collection=self.resource_type, _id=self._id)
         return t
\ No newline at end of file
@@ -1,6 +1,12 @@
-from .simple import Simple
+import logging
+
+from bson import ObjectId
 from marshmallow import Schema, fields, post_load
+
+from .simple import Simple
 import locutus
+from locutus.model.reference import dereference_all
+from locutus.tracing import traced
 
 
 """
@@ -14,7 +20,7 @@ class SimpleReference(Simple):
 
     def __init__(self, reference=None, instance=None):
         if type(reference) is not str:
-            print(f"What sort of reference is this?\n{reference}")
+            logging.warning(f"What sort of reference is this?\n{reference}")
 
         self.reference = reference
 
@@ -49,3 +55,21 @@ class SimpleReference(Simple):
 
     def reference_id(self):
         return self.reference.split("/")[-1]
+
+    @classmethod
+    @traced()
+    def dereference_all(cls, references):
+        """See locutus.model.reference.dereference_all"""
+        return dereference_all(references, Simple._factory_workers, cls)
+
+    @classmethod
+    def _in_filter(cls, ids):
+        """Simple resources are referenced by their ObjectId"""
+        object_ids = [ObjectId(id) for id in ids if ObjectId.is_valid(id)]
+        if len(object_ids) == 0:
+            return None
+        return {"_id": {"$in": object_ids}}
+
+    @classmethod
+    def _instance_id(cls, instance):
+        return instance._id
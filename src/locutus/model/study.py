@@ -1,12 +1,18 @@
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
 from . import Serializable
 from marshmallow import Schema, fields, post_load
 
 from locutus.model.datadictionary import DataDictionary
 from locutus.model.table import Table 
+from locutus.model.cascade import CascadeDelete
 from locutus.model.reference import Reference
 
 from locutus.model.harmony_export import HarmonyFormat, HarmonyOutputFormat, basic_date
 from locutus.model.harmony_export import harmony_exporter as build_harmony_exporter
+from locutus.model.harmony_pipeline import harmony_rows
 
 
 """
@@ -40,13 +46,13 @@ This will be references to the data-dictionaries associated with the study
 
 """
 
-def build_combined_harmony(study_ids="",
+def iter_combined_harmony(study_ids="",
                 dd_ids="",
                 table_ids="",
                 harmony_format=HarmonyFormat.Whistle,
                 harmony_output_format=HarmonyOutputFormat.JSON,
                 version=None):
-    """Build a harmony file based on piecemeal components
+    """Yield the rows of a harmony file based on piecemeal components
     
     study_ids, dd_ids, table_ids all must be strings. Multiple IDs can be 
     provided as a comma separated list of IDs (no whitespace). 
@@ -58,7 +64,6 @@ def build_combined_harmony(study_ids="",
     from both studies above in addition to the table, tb-fgdsasdf
     """
     harmony_exporter = build_harmony_exporter(harmony_format=harmony_format, output_format=harmony_output_format)
-    total_mappings = []
 
     if version is None:
         version = basic_date()
@@ -68,7 +73,7 @@ def build_combined_harmony(study_ids="",
             study = Study.get(study_id)
 
             if study:
-                total_mappings += study.as_harmony(harmony_exporter=harmony_exporter,
+                yield from study.iter_harmony(harmony_exporter=harmony_exporter,
                 version=version)
 
     if dd_ids != "":
@@ -76,7 +81,7 @@ def build_combined_harmony(study_ids="",
             dd = DataDictionary.get(dd_id)
 
             if dd:
-                total_mappings += dd.as_harmony(harmony_exporter=harmony_exporter,
+                yield from dd.iter_harmony(harmony_exporter=harmony_exporter,
                 version=version)
     
     if table_ids != "":
@@ -84,13 +89,18 @@ def build_combined_harmony(study_ids="",
             table = Table.get(table_id)
 
             if table:
-                total_mappings += table.as_harmony(harmony_exporter=harmony_exporter,
+                yield from table.iter_harmony(harmony_exporter=harmony_exporter,
                 version=version)                
-    
-    return total_mappings 
+
+
+def build_combined_harmony(**kwargs):
+    """Build a harmony file based on piecemeal components. See 
+    iter_combined_harmony for the parameters."""
+    return list(iter_combined_harmony(**kwargs))
 
 class Study(Serializable):
     _id_prefix = "st"
+    _summary_counts = ["datadictionary"]
 
     def __init__(
         self,
@@ -137,28 +147,80 @@ class Study(Serializable):
     def keys(self):
         return [self.title, self.url, self.name]
 
-    def as_harmony(self, 
+    def iter_harmony(self, 
                 harmony_exporter=None,
                 harmony_format=HarmonyFormat.Whistle,
                 harmony_output_format=HarmonyOutputFormat.JSON,
                 version=None):
+        """Yields the harmony rows from each of the data-dictionaries, in order.
 
+        The rows for every table in the study come from a single aggregation
+        (see harmony_pipeline)."""
         if version is None:
             version = basic_date()
 
         if harmony_exporter is None:
             harmony_exporter = build_harmony_exporter(harmony_format=harmony_format, output_format=harmony_output_format)
 
-        total_mappings = []
-        for dd in self.datadictionary:
-            total_mappings += dd.dereference().as_harmony(harmony_exporter=harmony_exporter,
-                study_title=self.title,
-                study_name=self.name,
-                study_id=self.id,
-                version=version)
-        
-        return total_mappings
-
+        # Tables can, technically, belong to more than one of the study's
+        # data-dictionaries, in which case their rows are repeated for each,
+        # wherever the table appears. The pipeline returns each table's rows
+        # once, in the order the tables are first seen, so we hold on to the
+        # rows of those tables until their last data-dictionary is done.
+        dd_tables = []
+        for ddref in Reference.dereference_all(self.datadictionary):
+            dd = ddref.dereference()
+            if dd is not None:
+                for table in dd.tables:
+                    dd_tables.append((dd, table.reference_id()))
+        remaining = Counter(table_id for dd, table_id in dd_tables)
+
+        tables = groupby(harmony_rows(list(remaining)), key=itemgetter("table_id"))
+        next_table = next(tables, None)
+        held_rows = {}
+        for dd, table_id in dd_tables:
+            if table_id in held_rows:
+                rows = held_rows[table_id]
+            elif next_table is not None and next_table[0] == table_id:
+                rows = next_table[1]
+                if remaining[table_id] > 1:
+                    rows = held_rows[table_id] = list(rows)
+            else:
+                # No rows for this table
+                rows = held_rows[table_id] = []
+
+            for row in rows:
+                yield from harmony_exporter.add_row(**row,
+                    study_title=self.title,
+                    study_name=self.name,
+                    study_id=self.id,
+                    dd_name=dd.name,
+                    dd_id=dd.id,
+                    version=version)
+
+            # The group has to be used up before moving on to the next
+            if next_table is not None and next_table[0] == table_id:
+                next_table = next(tables, None)
+            remaining[table_id] -= 1
+            if remaining[table_id] == 0:
+                held_rows.pop(table_id, None)
+
+    def as_harmony(self, **kwargs):
+        return list(self.iter_harmony(**kwargs))
+
+    def delete(self, hard_delete=True, cascade=False, use_transaction=False):
+        """Delete the study. With cascade, its data dictionaries (and their
+        tables and terminologies) go with it, unless something else still
+        uses them. See locutus.model.cascade"""
+        t = self.dump()
+        CascadeDelete(
+            hard_delete=hard_delete, cascade=cascade, use_transaction=use_transaction
+        ).studies(self.id).run()
+        return t
+
+    @classmethod
+    def index_list(cls):
+        return [cls._id_index]
 
     class _Schema(Schema):
         id = fields.Str()
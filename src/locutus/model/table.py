@@ -1,15 +1,16 @@
 import logging
 import sys
 
-import rich
 from flask import request
 from marshmallow import Schema, fields, post_load
 
 import locutus
 from locutus.api import default_headers
+from locutus.model.cascade import CascadeDelete
 from locutus.model.exceptions import *
 from locutus.model.harmony_export import HarmonyFormat, HarmonyOutputFormat, basic_date
 from locutus.model.harmony_export import harmony_exporter as build_harmony_exporter
+from locutus.model.harmony_pipeline import iter_harmony_rows
 from locutus.model.provenance import Provenance
 from locutus.model.reference import Reference
 from locutus.model.terminology import Terminology
@@ -50,6 +51,7 @@ the table with any changes.
 
 class Table(Serializable):
     _id_prefix = "tb"
+    _summary_counts = ["variables"]
 
     def __init__(
         self,
@@ -81,6 +83,10 @@ class Table(Serializable):
         self.variables = []
         self._terminology = None
 
+        # Lazily built code => Variable and name => Variable lookups. See
+        # _variable_lookup()
+        self._variable_index = None
+
         # For the time being, since old tables don't have them, we must create
         # the shadow terminologies on the fly. If we do this, we need to save
         # the table, but only after we've repopulated it with the corresponding
@@ -105,7 +111,7 @@ class Table(Serializable):
             logging.info(f"Saving Table {name}")
             t.save()
             logging.info("Saved Completed")
-            print(
+            logging.info(
                 f"Creating Shadow Terminology for table: {self.name} -- Terminology ID: {t.id}"
             )
             self.terminology = Reference(f"Terminology/{t.id}", t)
@@ -121,26 +127,24 @@ class Table(Serializable):
             self.save()
 
     def remove_variable(self, varname, editor):
-        success = False
         varname = locutus.normalize_ftd_placeholders(varname)
 
-        for var in self.variables:
-            if var.name == varname:
-                # TODO: How to handle deleting enumerated variables tables
-                # For now, I am not willing to handle enumerated variables
-                # differently, since it could result in unwittingly deleting
-                # something that is intended to remain. That is something
-                # real to address, though.
-                print(f"Removing variable '{varname}' from {self.name}.")
-                self.variables.remove(var)
-                self.terminology.dereference().remove_code(code=var.code, editor=editor)
-                success = True
-                return
-        if not success:
+        var = self._variable_lookup()[1].get(varname)
+        if var is None:
             msg = f"The table, '{self.name}' ({self.id}), has no code, '{varname}'"
-            print(msg)
+            logging.warning(msg)
             raise KeyError(msg)
 
+        # TODO: How to handle deleting enumerated variables tables
+        # For now, I am not willing to handle enumerated variables
+        # differently, since it could result in unwittingly deleting
+        # something that is intended to remain. That is something
+        # real to address, though.
+        logging.info(f"Removing variable '{varname}' from {self.name}.")
+        self.variables.remove(var)
+        self._variable_index = None
+        self.terminology.dereference().remove_code(code=var.code, editor=editor)
+
     def rename_var(self, original_varname, new_varname, new_description, editor):
         status = 200
         # Ensure codes are not placeholders at this point.
@@ -148,99 +152,117 @@ class Table(Serializable):
 
         new_varname = locutus.normalize_ftd_placeholders(new_varname)
 
-        print(
+        logging.info(
             f"Renaming Variable, {original_varname} to {new_varname} with new desc: {new_description}"
         )
         old_values = []
         new_values = []
 
         terms = self.terminology.dereference()
-        for var in self.variables:
-            # print(f"{self.name} - {var.name} == {original_varname}")
-            if var.name == original_varname:
-                original_code = var.code
-
-                # It's not unreasonable we have only been asked to update the
-                # display, so no need to wastefully change all of the details
-                # about the code when the end result is the same
+        var = self._variable_lookup()[1].get(original_varname)
+        if var is not None:
+            original_code = var.code
+
+            # It's not unreasonable we have only been asked to update the
+            # display, so no need to wastefully change all of the details
+            # about the code when the end result is the same
+            if original_varname != new_varname:
+                old_values.append(f"variable: {original_varname}")
+                new_values.append(f"variable: {new_varname}")
+                var.name = new_varname
+                var.code = new_varname
+                self._variable_index = None
+                if var.code != original_code:
+                    # Since we found a matching code, we'll pull the mappings and
+                    # save those under the new code after deleting the old ones.
+
+                    mappings = terms.mappings(original_code)
+                    if original_code in mappings and mappings[original_code] != []:
+                        terms.set_mapping(
+                            var.code, mappings[original_code], editor=editor
+                        )
+                        terms.delete_mappings(code=original_code, editor=editor)
+
+            if new_description is not None:
+                old_values.append(f"description: {var.description}")
+                new_values.append(f"description: {new_description}")
+                var.description = new_description
+
+            old_values = ",".join(old_values)
+            new_values = ",".join(new_values)
+
+            self.save()
+            if new_values:
+                terminology = self.terminology.dereference()
+                terminology.add_provenance(
+                    change_type=Provenance.ChangeType.EditTerm,
+                    target=original_code,
+                    old_value=old_values,
+                    new_value=new_values,
+                    editor=editor,
+                )
+                terminology.add_provenance(
+                    change_type=Provenance.ChangeType.EditTerm,
+                    target="self",
+                    old_value=old_values,
+                    new_value=new_values,
+                    editor=editor,
+                )
                 if original_varname != new_varname:
-                    old_values.append(f"variable: {original_varname}")
-                    new_values.append(f"variable: {new_varname}")
-                    var.name = new_varname
-                    var.code = new_varname
-                    if var.code != original_code:
-                        # Since we found a matching code, we'll pull the mappings and
-                        # save those under the new code after deleting the old ones.
-
-                        mappings = terms.mappings(original_code)
-                        if original_code in mappings and mappings[original_code] != []:
-                            terms.set_mapping(
-                                var.code, mappings[original_code], editor=editor
-                            )
-                            terms.delete_mappings(code=original_code, editor=editor)
-
-                if new_description is not None:
-                    old_values.append(f"description: {var.description}")
-                    new_values.append(f"description: {new_description}")
-                    var.description = new_description
-
-                old_values = ",".join(old_values)
-                new_values = ",".join(new_values)
-
-                self.save()
-                if new_values:
-                    terminology = self.terminology.dereference()
-                    terminology.add_provenance(
-                        change_type=Provenance.ChangeType.EditTerm,
-                        target=original_code,
-                        old_value=old_values,
-                        new_value=new_values,
-                        editor=editor,
-                    )
-                    terminology.add_provenance(
-                        change_type=Provenance.ChangeType.EditTerm,
-                        target="self",
-                        old_value=old_values,
-                        new_value=new_values,
-                        editor=editor,
-                    )
-                    if original_varname != new_varname:
-                        for prov in Provenance.mapping_provenance(
-                            terminology_id=self.id,
-                            target_coding=original_varname,
-                            return_instance=True,
-                        ):
-                            prov.target_coding = new_varname
-                            prov.save()
-                return True
+                    for prov in Provenance.mapping_provenance(
+                        terminology_id=self.id,
+                        target_coding=original_varname,
+                        return_instance=True,
+                    ):
+                        prov.target_coding = new_varname
+                        prov.save()
+            return True
         return False
 
+    def _variable_lookup(self):
+        """Returns the (code => Variable, name => Variable) indexes, building
+        them if necessary. The first variable with a given code or name wins,
+        which matches the linear search these replaced. The functions that
+        modify self.variables keep it current, but we also rebuild if the list
+        has been swapped out or resized elsewhere (TableLoader does this)."""
+        if (
+            self._variable_index is None
+            or self._variable_index[2] is not self.variables
+            or self._variable_index[3] != len(self.variables)
+        ):
+            by_code = {}
+            by_name = {}
+            for var in self.variables:
+                by_code.setdefault(var.code, var)
+                by_name.setdefault(var.name, var)
+            self._variable_index = (by_code, by_name, self.variables, len(self.variables))
+
+        return self._variable_index
+
     def get_variable(self, code_or_var):
         # We'll preference the code, but if none match at the code level, then
         # we match on name, or return None
+        by_code, by_name = self._variable_lookup()[0:2]
 
-        var_of_interest = None
-
-        for var in self.variables:
-            if var.code == code_or_var:
-                var_of_interest = var
-                break
-
+        var_of_interest = by_code.get(code_or_var)
         if var_of_interest is None:
-            for var in self.variables:
-                if var.name == code_or_var:
-                    var_of_interest = var
-                    break
+            var_of_interest = by_name.get(code_or_var)
         return var_of_interest
 
     def _insert_variable(self, variable):
         """If aa variable with the same name exists, replace it. Else append"""
+        by_code, by_name = self._variable_lookup()[0:2]
+
+        existing = by_name.get(variable.name)
+        if existing is not None:
+            self.variables[self.variables.index(existing)] = variable
+            self._variable_index = None
+            return True
 
-        for idx, var in enumerate(self.variables):
-            if variable.name == var.name:
-                self.variables[idx] = variable
-                return True
         self.variables.append(variable)
+        by_code.setdefault(variable.code, variable)
+        by_name.setdefault(variable.name, variable)
+        self._variable_index = (by_code, by_name, self.variables, len(self.variables))
 
     def add_variable(self, variable, editor=None):
         v = variable
@@ -279,60 +301,16 @@ class Table(Serializable):
         except CodeAlreadyPresent as e:
             pass
 
-    def build_harmony_row(
-        self, local_coding, mapped_coding, harmony_exporter, **kwargs
-    ):
-        return harmony_exporter.add_row(
-            table_id=self.id,
-            source_text=local_coding.code,
-            source_description=local_coding.display,
-            source_domain=self.name,
-            parent_varname="",  # I'm not sure if we can get this ATM
-            source_system=local_coding.system,
-            mapping_relationship=mapped_coding.mapping_relationship,
-            mapped_code=mapped_coding.code,
-            mapped_display=mapped_coding.display,
-            mapped_system=mapped_coding.system,
-            comment="",
-            **kwargs,
-        )
-
-    def harmonize_mappings(
-        self,
-        codings,
-        mappings,
-        harmony_mappings,
-        var_name=None,
-        harmony_exporter=None,
-        **kwargs,
-    ):
-
-        for code in mappings:
-            if code not in codings:
-                allowed_codes = "'" + "','".join(codings.keys()) + "'"
-                print(
-                    f"WARNING: The code, {code}, from variable, {self.name}:{var_name}, doesn't match any of the available codes: {allowed_codes}\n"
-                )
-            else:
-                coding = codings[code]
-
-                mapped_codings = mappings[code]
-
-                for mc in mapped_codings:
-                    harmony_row = self.build_harmony_row(
-                        coding, mc, harmony_exporter, **kwargs
-                    )
-                    if harmony_row is not None:
-                        harmony_mappings += harmony_row
-
-    def as_harmony(
+    def iter_harmony(
         self,
         harmony_exporter=None,
         harmony_format=HarmonyFormat.Whistle,
         harmony_output_format=HarmonyOutputFormat.JSON,
         **kwargs,
     ):
-
+        """Yields the table's harmony rows one at a time so that callers can
+        stream them out rather than holding the entire export in memory. The
+        rows are built by a single aggregation (see harmony_pipeline)."""
         if kwargs.get("version") is None:
             kwargs["version"] = basic_date()
 
@@ -341,36 +319,10 @@ class Table(Serializable):
                 harmony_format=harmony_format, output_format=harmony_output_format
             )
 
-        # Iterate over each table
-        harmony_mappings = []
-
-        if self.terminology is not None:
-            shadow = self.terminology.dereference()
-            table_mappings = shadow.mappings()
-            table_codings = shadow.build_code_dict()
-            self.harmonize_mappings(
-                codings=table_codings,
-                mappings=table_mappings,
-                harmony_mappings=harmony_mappings,
-                harmony_exporter=harmony_exporter,
-                **kwargs,
-            )
-        for var in self.variables:
-            if var.data_type == Variable.DataType.ENUMERATION:
-                term = var.get_terminology()
-
-                # Capture a dictionary with code=>coding
-                codings = term.build_code_dict()
-                mappings = var.get_mappings()
-                self.harmonize_mappings(
-                    codings=codings,
-                    mappings=mappings,
-                    harmony_mappings=harmony_mappings,
-                    var_name=var.name,
-                    harmony_exporter=harmony_exporter,
-                    **kwargs,
-                )
-        return harmony_mappings
+        yield from iter_harmony_rows([self.id], harmony_exporter, **kwargs)
+
+    def as_harmony(self, **kwargs):
+        return list(self.iter_harmony(**kwargs))
 
     def keys(self):
         return [self.url, self.name]
@@ -394,7 +346,7 @@ class Table(Serializable):
             return pref
 
         except Exception as e:
-            print(f"An error occurred while retrieving preferences: {str(e)}")
+            logging.error(f"An error occurred while retrieving preferences: {str(e)}")
             raise
 
     def add_or_update_pref(self, api_preference, code=None):
@@ -404,7 +356,7 @@ class Table(Serializable):
             )
 
         except Exception as e:
-            print(f"An error occurred while updating preferences: {str(e)}")
+            logging.error(f"An error occurred while updating preferences: {str(e)}")
             raise
 
     def remove_pref(self, code=None):
@@ -412,7 +364,7 @@ class Table(Serializable):
             message = self.terminology.dereference().remove_pref(code=code)
             return message
         except Exception as e:
-            print(f"An error occurred while updating preferences: {str(e)}")
+            logging.error(f"An error occurred while updating preferences: {str(e)}")
             raise
 
     def get_preferred_terminology(self):
@@ -440,7 +392,7 @@ class Table(Serializable):
             return pref
 
         except Exception as e:
-            print(f"An error occurred while retrieving preferred terminology: {e}")
+            logging.error(f"An error occurred while retrieving preferred terminology: {e}")
             raise
 
     def replace_preferred_terminology(self, editor, preferred_terminology):
@@ -466,7 +418,7 @@ class Table(Serializable):
             )
 
         except Exception as e:
-            print(f"An error occurred while updating preferences: {str(e)}")
+            logging.error(f"An error occurred while updating preferences: {str(e)}")
             raise
 
     def remove_preferred_terminology(self):
@@ -490,9 +442,23 @@ class Table(Serializable):
             self.terminology.dereference().remove_preferred_terminology()
 
         except Exception as e:
-            print(f"An error occurred while updating preferences: {str(e)}")
+            logging.error(f"An error occurred while updating preferences: {str(e)}")
             raise
 
+    def delete(self, hard_delete=True, cascade=False, use_transaction=False):
+        """Delete the table and remove it from any data dictionaries. With
+        cascade, its shadow and enumeration terminologies go with it, unless
+        another table still uses them. See locutus.model.cascade"""
+        t = self.dump()
+        CascadeDelete(
+            hard_delete=hard_delete, cascade=cascade, use_transaction=use_transaction
+        ).tables(self.id).run()
+        return t
+
+    @classmethod
+    def index_list(cls):
+        return [cls._id_index]
+
     class _Schema(Schema):
         id = fields.Str()
         code = fields.Str()
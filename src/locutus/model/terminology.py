@@ -15,6 +15,7 @@ from locutus.api import (
     generate_mapping_index,
     generate_paired_string,
 )
+from locutus.model.cascade import CascadeDelete
 from locutus.model.coding import BasicCoding, Coding
 from locutus.model.lookups import FTDConceptMapTerminology, FTDOntologyLookup
 from locutus.model.onto_api_preference import OntoApiPreference
@@ -51,6 +52,7 @@ the "codes" array.
 
 class Terminology(Serializable):
     _id_prefix = "tm"
+    _summary_counts = ["codes"]
 
     class MappingStatus(StrEnum):
         AwaitingApproval = "Awaiting Approval"
@@ -78,6 +80,10 @@ class Terminology(Serializable):
         self.url = url
         self.codes = []
 
+        # Lazily built code => SimpleReference lookup. See _code_lookup()
+        self._code_index = None
+        self._code_index_size = 0
+
         self.api_preferences = api_preferences
         self.preferred_terminologies = preferred_terminologies
 
@@ -142,43 +148,60 @@ class Terminology(Serializable):
 
         raise ValueError(f"Terminology.find_match() requires both a url and name.")
 
+    def save(self):
+        result = super().save()
+        # Some terminologies are cached by every process (see lookups)
+        locutus.model.lookups.ResourceSingletonBase.resource_changed(self.id)
+        return result
+
     def delete(self, hard_delete=True):
+        """Delete the terminology along with its codings, provenance and user
+        input (see locutus.model.cascade)"""
         t = self.realize_as_dict()
-        super().delete(hard_delete=hard_delete)
-
-        # User Input
-        for cnv in MappingConversation.get(
-            terminology_id=self.id, return_instance=True
-        ):
-            cnv.delete(hard_delete=hard_delete)
-
-        for vote in MappingVote.get(terminology_id=self.id, return_instance=True):
-            vote.delete(hard_delete=hard_delete)
-
-        # Delete all provenance
-        for prov in locutus.model.provenance.Provenance.find(
-            {"terminology_id": self.id}
-        ):
-            prov.delete(hard_delete=hard_delete)
-
-        all_codings = locutus.model.coding.Coding.get(
-            terminology_id=self.id, valid_only=False
-        )
-        if type(all_codings) is locutus.model.coding.Coding:
-            all_codings = [all_codings]
-
-        for coding in all_codings:
-            coding.delete(hard_delete=hard_delete)
-
+        CascadeDelete(hard_delete=hard_delete).terminologies(self.id).run()
         return t
 
     def keys(self):
         return [self.url, self.name]
 
+    def dereference_codes(self):
+        """Resolve every code reference with a single query so that walking
+        self.codes doesn't cost a round trip per code."""
+        SimpleReference.dereference_all(self.codes)
+        return self.codes
+
+    def _code_lookup(self):
+        """Returns the code => SimpleReference index, building it if it hasn't
+        been built yet or if self.codes has changed size behind our back. The
+        functions that modify self.codes keep it current otherwise."""
+        if self._code_index is None or self._code_index_size != len(self.codes):
+            self._code_index = {}
+            for ref in self.dereference_codes():
+                # Codes shouldn't appear more than once, but if they do, the
+                # first one wins just like the linear search did
+                self._code_index.setdefault(ref.dereference().code, ref)
+            self._code_index_size = len(self.codes)
+
+        return self._code_index
+
+    def _index_code(self, ref):
+        self.codes.append(ref)
+        if self._code_index is not None:
+            self._code_index.setdefault(ref.dereference().code, ref)
+            self._code_index_size = len(self.codes)
+
+    def _unindex_code(self, ref):
+        self.codes.remove(ref)
+        if self._code_index is not None:
+            code = ref.dereference().code
+            if self._code_index.get(code) is ref:
+                del self._code_index[code]
+            self._code_index_size = len(self.codes)
+
     def build_code_dict(self):
         codings = {}
 
-        for cref in self.codes:
+        for cref in self.dereference_codes():
             coding = cref.dereference()
             codings[coding.code] = coding
 
@@ -245,7 +268,7 @@ class Terminology(Serializable):
                     )
 
                 if new_to_codes:
-                    self.codes.append(SimpleReference(f"Coding/{coding.id}"))
+                    self._index_code(SimpleReference(f"Coding/{coding.id}", coding))
                     self.save()
                 return
 
@@ -255,13 +278,12 @@ class Terminology(Serializable):
             display=display,
             description=description,
             system=self.url,
-            editor=editor,
             rank=len(self.codes),
         )
 
         new_coding.save()
 
-        self.codes.append(SimpleReference(f"Coding/{new_coding.id}"))
+        self._index_code(SimpleReference(f"Coding/{new_coding.id}", new_coding))
         self.save()
 
         if editor:
@@ -296,7 +318,7 @@ class Terminology(Serializable):
             cinstance.valid = False
             cinstance.save()
 
-            self.codes.remove(coding)
+            self._unindex_code(coding)
             self.save()
             self.add_provenance(
                 locutus.model.provenance.Provenance.ChangeType.RemoveTerm,
@@ -314,13 +336,14 @@ class Terminology(Serializable):
         self, original_code, new_code, new_display, editor, new_description=None
     ):
         status = 200
-        print(
+        logging.info(
             f"Renaming Code, {original_code} to {new_code} with new display: {new_display} and new description: {new_description}"
         )
         old_values = []
         new_values = []
 
-        for coderef in self.codes:
+        coderef = self.get_coding(original_code, return_instance=False)
+        if coderef is not None:
             code = coderef.dereference()
             if code.code == original_code:
                 # It's not unreasonable we have only been asked to update the
@@ -330,6 +353,7 @@ class Terminology(Serializable):
                     old_values.append(f"code: {original_code}")
                     new_values.append(f"code: {new_code}")
                     code.code = new_code
+                    self._code_index = None
 
                     # Since we found a matching code, we'll pull the mappings and
                     # save those under the new code after deleting the old ones.
@@ -398,7 +422,7 @@ class Terminology(Serializable):
         # Ensure codes are not placeholders at this point.
         code = locutus.normalize_ftd_placeholders(code)
 
-        return any(entry.dereference().code == code for entry in self.codes)
+        return code in self._code_lookup()
 
     def delete_mappings(self, editor, code=None):
         """
@@ -431,7 +455,7 @@ class Terminology(Serializable):
                 )
 
         else:
-            for coding in self.codes:
+            for coding in self.dereference_codes():
                 old_values = {
                     "code": coding.dereference().code,
                     "codes": coding.dereference().delete_mappings(),
@@ -463,57 +487,79 @@ class Terminology(Serializable):
             else:
                 codes[code] = coding.mappings
         else:
-            for coderef in self.codes:
+            for coderef in self.dereference_codes():
                 code = coderef.dereference()
                 codes[code.code] = code.mappings
         return codes
 
     def get_coding(self, code, return_instance=True, as_reference=False):
-        for item in self.codes:
-            coding = item.dereference()
-            if coding.code == code:
-                if return_instance:
-                    return coding
-                return item
+        item = self._code_lookup().get(code)
+
+        # Someone renamed the coding without going through rename_code
+        if item is not None and item.dereference().code != code:
+            self._code_index = None
+            item = self._code_lookup().get(code)
 
-        return None
+        if item is None:
+            return None
+
+        if return_instance:
+            return item.dereference()
+        return item
 
     def get_provenance(self, code=None):
-        prov = {}
+        return self.provenance_page(code=code)[0]
 
-        if code is None or code == "self":
-            # This isn't really relevant any more, but the FE does use it so we will keep it
-            prov["self"] = {}
-            prov["self"]["target"] = "self"
-            changes = []
-
-            for prv in locutus.model.provenance.Provenance.terminology_provenance(
-                terminology_id=self.id
-            ):
-                if type(prv["timestamp"]) is not str:
-                    prv["timestamp"] = prv["timestamp"].strftime(
-                        locutus.PROVENANCE_TIMESTAMP_FORMAT
-                    )
-                changes.append(prv)
-            prov["self"]["changes"] = changes
-        else:
-            prov[code] = {}
-            prov[code]["target"] = code
-            changes = []
-
-            for prv in locutus.model.provenance.Provenance.mapping_provenance(
-                terminology_id=self.id, target_coding=code
-            ):
-                if prv is not None:
-                    if type(prv["timestamp"]) is not str:
-                        prv["timestamp"] = prv["timestamp"].strftime(
-                            locutus.PROVENANCE_TIMESTAMP_FORMAT
-                        )
-                    changes.append(prv)
-                else:
-                    changes = []
-            prov[code]["changes"] = changes
-        return prov
+    def provenance_page(self, code=None, since=None, until=None, limit=None, cursor=None):
+        """The provenance for the terminology itself (code None or "self")
+        or one of its codes, optionally limited to the changes made from
+        since until until and paged through limit at a time. Returns the
+        provenance and the cursor for the next page (None if there isn't one).
+        See Provenance.history"""
+        Provenance = locutus.model.provenance.Provenance
+
+        # This isn't really relevant any more, but the FE does use it so we will keep it
+        target = "self" if code is None or code == "self" else code
+
+        changes, next_cursor = Provenance.history(
+            terminology_id=self.id,
+            target=None if target == "self" else target,
+            since=since,
+            until=until,
+            limit=limit,
+            cursor=cursor,
+        )
+        for prv in changes:
+            prv["timestamp"] = locutus.model.provenance.format_timestamp(
+                prv.get("timestamp")
+            )
+
+        return {target: {"target": target, "changes": changes}}, next_cursor
+
+    def provenance_by_target(self, since=None, until=None, latest=None):
+        """The provenance for the terminology ("self") and every one of its
+        codes, keyed by target, optionally limited to the changes made from
+        since until until and to the latest changes to each target. Each
+        target's total number of changes is included, so it is clear when
+        changes were left out. See Provenance.history_by_target"""
+        Provenance = locutus.model.provenance.Provenance
+
+        provenance = {}
+        history = Provenance.history_by_target(
+            terminology_id=self.id, since=since, until=until, latest=latest
+        )
+        for target, (changes, total) in history.items():
+            target = "self" if target is None else target
+            for prv in changes:
+                prv["timestamp"] = locutus.model.provenance.format_timestamp(
+                    prv.get("timestamp")
+                )
+            provenance[target] = {
+                "target": target,
+                "changes": changes,
+                "total": total,
+            }
+        return provenance
 
     def add_provenance(
         self, change_type, editor, target=None, timestamp=None, **kwargs
@@ -528,7 +574,7 @@ class Terminology(Serializable):
             )
         else:
             if target.count("|") > 1:
-                print(
+                logging.warning(
                     f"Warning: Invalid target format '{target}'. Skipping provenance addition."
                 )
                 return
@@ -732,6 +778,10 @@ class Terminology(Serializable):
         logging.debug(message)
         return message
 
+    @classmethod
+    def index_list(cls):
+        return [cls._id_index]
+
     class _Schema(Schema):
         id = fields.Str()
         name = fields.Str(required=True)
@@ -753,7 +803,7 @@ class Terminology(Serializable):
         this_term = self.dump()
         this_term["codes"] = []
 
-        for ref in self.codes:
+        for ref in self.dereference_codes():
             this_term["codes"].append(ref.dereference().dump())
 
         return this_term
@@ -764,46 +814,94 @@ class MappingUserInputModel:
         """Mappings may have user_input data stored seperate from the mapping itself.
         This function collects and formats the user_input data for a given mapping,
         then creates the user_input object to be included in a CodingMapping.
+
+        When building the user_input for many mappings, use
+        summarize_user_input instead, which costs two queries in total rather
+        than two per mapping.
         """
-        code_index = locutus.get_code_index(code)
-        mapped_code_index = locutus.get_code_index(mapped_code)
+        summaries = MappingUserInputModel.summarize_user_input(
+            id, user_id, source_code=code, mapped_code=mapped_code
+        )
+        return MappingUserInputModel.user_input_for(summaries, code, mapped_code)
+
+    def summarize_user_input(id, user_id, source_code=None, mapped_code=None):
+        """Collect the user_input for every mapping in the terminology (or
+        just those for source_code/mapped_code) with one query for the
+        conversations and one for the votes.
+
+        Returns a dict keyed by (source_code, mapped_code). Use user_input_for
+        to look up a mapping's user_input in it."""
+        params = {"terminology_id": id}
 
         # Ensure codes/mappings are not placeholders at this point
-        code = locutus.normalize_ftd_placeholders(code)
+        if source_code is not None:
+            params["source_code"] = locutus.normalize_ftd_placeholders(source_code)
+        if mapped_code is not None:
+            params["mapped_code"] = locutus.normalize_ftd_placeholders(mapped_code)
 
-        mapped_code = locutus.normalize_ftd_placeholders(mapped_code)
+        summaries = {}
 
-        conversation = MappingConversation.get(
-            terminology_id=id,
-            source_code=code,
-            mapped_code=mapped_code,
-            return_instance=False,
-        )
-        votes = MappingVote.get(
-            terminology_id=id,
-            source_code=code,
-            mapped_code=mapped_code,
+        # Conversations can grow long, so we only need the database to count them
+        for conversation in MappingConversation.find(
+            params,
             return_instance=False,
-        )
-
-        comment_count = 0
-        if conversation != []:
-            comment_count = len(conversation["mapping_conversations"])
+            projection={
+                "_id": 0,
+                "source_code": 1,
+                "mapped_code": 1,
+                "comments_count": {
+                    "$size": {"$ifNull": ["$mapping_conversations", []]}
+                },
+            },
+        ):
+            key = (conversation["source_code"], conversation["mapped_code"])
+            summary = summaries.setdefault(
+                key, MappingUserInputModel.empty_user_input()
+            )
+            summary["comments_count"] = conversation["comments_count"]
 
-        vote_count = {"up": 0, "down": 0}
-        user_vote = ""
-        if votes != []:
-            vote_count = MappingUserInputModel.get_mapping_votes_counts(
-                votes["mapping_votes"]
+        for votes in MappingVote.find(
+            params,
+            return_instance=False,
+            projection={
+                "_id": 0,
+                "source_code": 1,
+                "mapped_code": 1,
+                "mapping_votes": 1,
+            },
+        ):
+            key = (votes["source_code"], votes["mapped_code"])
+            summary = summaries.setdefault(
+                key, MappingUserInputModel.empty_user_input()
+            )
+            mapping_votes = votes.get("mapping_votes") or {}
+            summary["votes_count"] = MappingUserInputModel.get_mapping_votes_counts(
+                mapping_votes
             )
-            user_vote = votes["mapping_votes"].get(user_id)
+            user_vote = mapping_votes.get(user_id)
             if user_vote is not None:
                 user_vote = user_vote["vote"]
+            summary["users_vote"] = user_vote
+
+        return summaries
+
+    def user_input_for(summaries, code, mapped_code):
+        """The user_input for a single mapping from summarize_user_input's
+        results (mappings nobody has commented on or voted for get zeros)"""
+        key = (
+            locutus.normalize_ftd_placeholders(code),
+            locutus.normalize_ftd_placeholders(mapped_code),
+        )
+        summary = summaries.get(key)
+        if summary is None:
+            return MappingUserInputModel.empty_user_input()
+        return summary
 
+    def empty_user_input():
         return {
-            "comments_count": comment_count,
-            "votes_count": vote_count,
-            "users_vote": user_vote,
+            "comments_count": 0,
+            "votes_count": {"up": 0, "down": 0},
+            "users_vote": "",
         }
 
     def get_mapping_votes_counts(mapping_votes):
@@ -1,3 +1,4 @@
+import logging
 from marshmallow import Schema, fields, post_load
 from locutus import persistence, FTD_PLACEHOLDERS, normalize_ftd_placeholders
 from enum import StrEnum  # Adds 3.11 requirement or 3.6+ with StrEnum library
@@ -33,7 +34,7 @@ class MappingRelationshipModel:
                 editor=editor)
 
         except Exception as e:
-            print(f"An error occurred while setting the mapping relationship: {str(e)}")
+            logging.error(f"An error occurred while setting the mapping relationship: {str(e)}")
             raise
 
         response = TerminologyMappings.get_mappings(id)
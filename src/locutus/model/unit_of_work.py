@@ -0,0 +1,286 @@
+"""
+Request scoped identity map and unit of work.
+
+Over the course of a single request, the same Terminology (or Table, Coding,
+etc) tends to be pulled from the database over and over again as different
+References are dereferenced. And each of the changes made to it tends to be
+saved as it happens, so a single request might write the same document many
+times over.
+
+While a request is active, the UnitOfWork attached to flask's g:
+
+    * Remembers every resource pulled by id (Serializable.get,
+      Serializable.pull, Simple.pull and, therefore, Reference.dereference)
+      so that subsequent pulls return the same instance without a query.
+    * Holds on to save() calls for objects that already exist in the
+      database. Repeated saves of the same object become a single write,
+      which happens when the request finishes (or sooner, see below).
+
+To keep the database consistent with what the code expects, pending saves
+for a collection are written before anything else reads from or writes to
+that collection (see locutus.storage.mongo._flush_pending).
+
+Outside of a request (scripts, tests which use the models directly, etc),
+none of this is active and everything works just as it always has.
+"""
+
+import logging
+from collections import defaultdict
+from copy import deepcopy
+
+from bson import ObjectId
+from flask import g, has_app_context
+from pymongo import ReplaceOne, UpdateOne
+
+import locutus
+
+
+class UnitOfWork:
+    def __init__(self):
+        # (resource_type, id) => instance
+        self.identities = {}
+
+        # (collection, _id) => (document, snapshot, fields) waiting to be
+        # written. The document is captured when save() is called, so changes
+        # made after the save aren't written unless the object is saved again.
+        # The snapshot is the document as it was in the database before the
+        # first of the saves (see document_changes)
+        self.pending = {}
+
+        # Called once the pending saves have been written at the end of the
+        # request (see after_commit)
+        self.after_commit = []
+
+    def lookup(self, resource_type, id):
+        return self.identities.get((resource_type, str(id)))
+
+    def register(self, resource_type, id, instance, replace=False):
+        if id is None or instance is None:
+            return instance
+
+        key = (resource_type, str(id))
+        if replace:
+            self.identities[key] = instance
+        return self.identities.setdefault(key, instance)
+
+    def evict(self, resource_type, id, collection=None, _id=None):
+        self.identities.pop((resource_type, str(id)), None)
+        if collection is not None and _id is not None:
+            self.pending.pop((collection, str(_id)), None)
+
+    def defer_save(self, collection, instance, doc, snapshot):
+        doc["_id"] = ObjectId(instance._id)
+        if "id" not in doc:
+            doc["id"] = str(instance._id)
+
+        # Later saves replace the earlier ones, but keep their place in line
+        key = (collection, str(instance._id))
+        if key in self.pending:
+            snapshot = self.pending[key][1]
+        self.pending[key] = (doc, snapshot, instance.__class__._get_schema().fields)
+
+    def run_after_commit(self):
+        callbacks, self.after_commit = self.after_commit, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                logging.exception("after_commit callback failed")
+
+    def flush(self, collection=None):
+        """Write the pending saves for the collection (or all of them if
+        collection is None)"""
+        if collection is None:
+            keys = list(self.pending)
+        else:
+            keys = [key for key in self.pending if key[0] == collection]
+
+        if len(keys) == 0:
+            return
+
+        # Pull everything out before writing, since the writes will, in turn,
+        # ask us to flush the collection they are writing to
+        requests = defaultdict(list)
+        for key in keys:
+            doc, snapshot, fields = self.pending.pop(key)
+            if snapshot is None:
+                requests[key[0]].append(
+                    ReplaceOne({"_id": doc["_id"]}, doc, upsert=True)
+                )
+            else:
+                changes = document_changes(doc, snapshot, fields)
+                if changes is not None:
+                    requests[key[0]].append(UpdateOne({"_id": doc["_id"]}, changes))
+
+        for collection_name, writes in requests.items():
+            logging.debug(f"Flushing {len(writes)} {collection_name} save(s)")
+            locutus.persistence().collection(collection_name).bulk_write(
+                writes, ordered=False
+            )
+
+
+_missing = object()
+
+
+def document_changes(doc, snapshot, fields):
+    """Build the update required to turn the snapshot (the document as it is
+    in the database) into doc (the freshly dumped object). Returns None if
+    nothing changed.
+
+    Lists which have only grown at the end (such as a terminology's codes
+    after add_code) are $pushed rather than rewritten. Fields which have
+    disappeared from doc are only $unset if they are one of the schema's
+    fields, so anything else stored with the document is left alone."""
+    set_fields = {}
+    push_fields = {}
+    for key, value in doc.items():
+        if key == "_id":
+            continue
+
+        previous = snapshot.get(key, _missing)
+        if previous == value:
+            continue
+
+        if (
+            isinstance(value, list)
+            and isinstance(previous, list)
+            and len(value) > len(previous)
+            and value[: len(previous)] == previous
+        ):
+            push_fields[key] = {"$each": value[len(previous) :]}
+        else:
+            set_fields[key] = value
+
+    unset_fields = {
+        key: ""
+        for key in fields
+        if key not in ("_id", "id") and key in snapshot and key not in doc
+    }
+
+    update = {}
+    if set_fields:
+        update["$set"] = set_fields
+    if push_fields:
+        update["$push"] = push_fields
+    if unset_fields:
+        update["$unset"] = unset_fields
+
+    if len(update) == 0:
+        return None
+    return update
+
+
+def current():
+    """The active UnitOfWork, if there is one"""
+    if not has_app_context():
+        return None
+    return g.get("unit_of_work")
+
+
+def lookup(resource_type, id):
+    uow = current()
+    if uow is None or id is None:
+        return None
+    return uow.lookup(resource_type, id)
+
+
+def register(resource_type, id, instance, replace=False):
+    """Add the instance to the identity map. Unless replace is True, an
+    instance that is already mapped wins and is returned instead."""
+    uow = current()
+    if uow is None:
+        return instance
+    return uow.register(resource_type, id, instance, replace=replace)
+
+
+def evict(resource_type, id, collection=None, _id=None):
+    uow = current()
+    if uow is not None:
+        uow.evict(resource_type, id, collection=collection, _id=_id)
+
+
+def defer_save(collection, instance, doc, snapshot):
+    """Returns True if the save has been deferred until the end of the
+    request, in which case the caller shouldn't write anything itself.
+
+    doc is the freshly dumped instance and snapshot what we believe is in the
+    database (None if we don't know)."""
+    uow = current()
+    if uow is None or instance._id is None:
+        return False
+
+    uow.defer_save(collection, instance, doc, snapshot)
+    return True
+
+
+def save_instance(collection, instance):
+    """Write the instance (Serializable or Simple) to the collection and
+    return its _id.
+
+    If we know what the document looked like when it was pulled from the
+    database (instance._snapshot), only the fields that changed are written
+    and nothing at all is written if nothing changed. Otherwise, the entire
+    document is replaced. Within a request, the write is deferred (see
+    defer_save)."""
+    doc = instance.dump()
+    snapshot = instance._snapshot
+
+    if defer_save(collection, instance, doc, snapshot):
+        _id = instance._id
+    elif instance._id is not None and snapshot is not None:
+        changes = document_changes(
+            doc, snapshot, instance.__class__._get_schema().fields
+        )
+        if changes is not None:
+            locutus.persistence().collection(collection).document(
+                instance._id
+            ).modify(changes)
+        _id = instance._id
+    else:
+        _id = locutus.persistence().collection(collection).document(instance._id).set(doc)
+
+    instance._snapshot = deepcopy(doc)
+    return _id
+
+
+def flush(collection=None):
+    uow = current()
+    if uow is not None:
+        uow.flush(collection)
+
+
+def after_commit(callback):
+    """Call callback once everything saved so far has been written. Outside
+    of a request, that's right now."""
+    uow = current()
+    if uow is None:
+        callback()
+    else:
+        uow.after_commit.append(callback)
+
+
+def begin_unit_of_work():
+    g.unit_of_work = UnitOfWork()
+
+
+def commit_unit_of_work(response):
+    # Writing here, rather than at teardown, means a failed write still
+    # results in an error response
+    flush()
+    uow = current()
+    if uow is not None:
+        uow.run_after_commit()
+    return response
+
+
+def end_unit_of_work(exc=None):
+    try:
+        # Anything saved before an error was raised would have been written
+        # had the save not been deferred
+        flush()
+    except Exception:
+        logging.exception("Unable to write the request's pending saves")
+    finally:
+        uow = g.pop("unit_of_work", None)
+        if uow is not None:
+            uow.run_after_commit()
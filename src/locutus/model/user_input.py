@@ -7,6 +7,9 @@ Current Use:
     - Mapping votes: users up/down vote regarding a single mapping
 
 """
+import logging
+
+from bson import ObjectId
 from marshmallow import Schema, fields, post_load
 import locutus
 from locutus.api import generate_mapping_index, get_editor
@@ -24,6 +27,31 @@ class UserInput:
         self.input_type = input_type
         self.update_policy = update_policy
 
+    # There is one document per terminology/source_code/mapped_code, which
+    # lets us upsert user input atomically (see _upsert)
+    _unique_index = {
+        "keys": [("terminology_id", 1), ("source_code", 1), ("mapped_code", 1)],
+        "unique": True,
+        "name": "unique_mapping",
+    }
+
+    def _upsert(self, update):
+        """Atomically apply the update to this mapping's document, creating it
+        if it doesn't exist yet, and adopt the result's _id/id"""
+        saved = locutus.persistence().collection(self.resource_type).find_one_and_update(
+            {
+                "terminology_id": self.terminology_id,
+                "source_code": self.source_code,
+                "mapped_code": self.mapped_code,
+            },
+            update,
+            upsert=True,
+        )
+        self._id = saved["_id"]
+        self.id = saved.get("id", str(self._id))
+        self._snapshot = saved
+        return saved
+
     @classmethod 
     def get_input_class(cls, type):
         """
@@ -212,7 +240,7 @@ class UserInput:
                 else:
                     # Append a new entry.
                     existing_data.insert(0, new_record[0])
-                print(f"Updated mapping conversations: {existing_data}")
+                logging.debug(f"Updated mapping conversations: {existing_data}")
             else:
                 raise ValueError("The existing data should be of return_format type 'list'.")
 
@@ -245,16 +273,8 @@ class MappingConversation(Simple, UserInput):
         self.source_code=source_code 
         self.mapped_code=mapped_code 
 
-
-        prev = self.exists_in_db(return_instance=False)
-        if prev is not None:
-            _id = prev['_id']
-
-            if id is None:
-                id = prev['id']
-            if mapping_conversations == []:
-                mapping_conversations = prev['mapping_conversations']
-
+        # If there is already a conversation for this mapping, save() will
+        # add to it, so there's no need to go looking for it here
         Simple.__init__(self, id=id,
                         _id=_id, 
                         collection_type="mapping_conversations",
@@ -270,6 +290,24 @@ class MappingConversation(Simple, UserInput):
         input_data=self.build_user_input(input, editor, timestamp)
         self.mapping_conversations.append(input_data)
 
+    def save(self):
+        """New conversation entries are appended to the mapping's existing
+        conversation (if any). Afterwards, mapping_conversations holds the 
+        entire conversation."""
+        if self._id is not None:
+            return Simple.save(self)
+
+        _id = ObjectId()
+        saved = self._upsert({
+            "$push": {"mapping_conversations": {"$each": self.mapping_conversations}},
+            "$setOnInsert": {"_id": _id, "id": str(_id)}
+        })
+        self.mapping_conversations = saved['mapping_conversations']
+
+    @classmethod
+    def index_list(cls):
+        return [UserInput._unique_index]
+
     def get_input(self):
         return self.mapping_conversations
 
@@ -287,7 +325,7 @@ class MappingConversation(Simple, UserInput):
             user_id = SessionManager.create_user_id(editor=editor)
 
         except ValueError as e:
-            print(f"Error: {e}")
+            logging.error(f"Error: {e}")
 
 
         if type(note) is dict:
@@ -376,16 +414,8 @@ class MappingVote(Simple, UserInput):
         self.source_code=source_code 
         self.mapped_code=mapped_code 
 
-        prev = self.exists_in_db(return_instance=False)
-
-        if prev is not None:
-            _id = prev['_id']
-
-            if id is None:
-                id = prev['id']
-            if mapping_votes == {}:
-                mapping_votes = prev['mapping_votes']
-
+        # If there are already votes for this mapping, save() will merge
+        # these into them, so there's no need to go looking for them here
         Simple.__init__(self, id=id,
                         _id=_id, 
                         collection_type="mapping_votes",
@@ -405,7 +435,7 @@ class MappingVote(Simple, UserInput):
         try:
             user_id = SessionManager.create_user_id(editor=editor)
         except ValueError as e:
-            print(f"Error: {e}")
+            logging.error(f"Error: {e}")
 
         if timestamp is not None:
             date =timestamp 
@@ -445,6 +475,36 @@ class MappingVote(Simple, UserInput):
     def get_input(self):
         return self.mapping_votes
 
+    def save(self):
+        """Votes are merged into the mapping's existing votes (if any), 
+        replacing any earlier vote by the same user. Afterwards, mapping_votes
+        holds all of the mapping's votes."""
+        if self._id is not None:
+            return Simple.save(self)
+
+        # User IDs can have dots in them, so we merge the votes in with an
+        # update pipeline rather than $set each user's vote by path. Pipelines
+        # can't $setOnInsert, so _id and id are only set if they aren't
+        # already (which leaves existing documents' _id unchanged)
+        _id = ObjectId()
+        saved = self._upsert([{
+            "$set": {
+                "_id": {"$ifNull": ["$_id", _id]},
+                "id": {"$ifNull": ["$id", {"$toString": {"$ifNull": ["$_id", _id]}}]},
+                "mapping_votes": {
+                    "$mergeObjects": [
+                        {"$ifNull": ["$mapping_votes", {}]},
+                        {"$literal": self.mapping_votes}
+                    ]
+                }
+            }
+        }])
+        self.mapping_votes = saved['mapping_votes']
+
+    @classmethod
+    def index_list(cls):
+        return [UserInput._unique_index]
+
     def validate_input(self, user_input):
         vote = user_input.get('vote')
         if not vote or vote not in ['up', 'down']:
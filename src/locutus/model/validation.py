@@ -13,16 +13,16 @@ def validate_enums(codes, enums, additional_enums=None):
     # Normalize enums
     if isinstance(enums, dict):
         valid_enums = enums.get("code", [])
-    elif isinstance(enums, list):
-        valid_enums = enums
+    elif isinstance(enums, (list, set, frozenset)):
+        valid_enums = list(enums)
     elif isinstance(enums, str):
         valid_enums = [enums]
     else:
         raise TypeError("Enums must be a dict, list, or string.")
 
-    # Allow additional enums if provided
+    # Allow additional enums if provided (without changing the caller's list)
     if additional_enums:
-        valid_enums += list(additional_enums)
+        valid_enums = valid_enums + list(additional_enums)
 
     # Normalize codes
     if isinstance(codes, dict):  # Assuming Coding or CodingMapping object
@@ -35,7 +35,8 @@ def validate_enums(codes, enums, additional_enums=None):
         raise TypeError(f"Codes, {codes}, must be a dict, list, or string.")
 
     # Validate each code
-    invalid_codes = [code for code in code_list if code not in valid_enums]
+    allowed = set(valid_enums)
+    invalid_codes = [code for code in code_list if code not in allowed]
     if invalid_codes:
         raise InvalidValueError(invalid_codes, valid_enums)
 
@@ -2,15 +2,90 @@
 import logging
 import os
 import re
+from contextlib import contextmanager
+from time import perf_counter
 from urllib.parse import unquote, urlparse
 
 from bson import ObjectId
-from pymongo import ASCENDING, MongoClient
+from pymongo import ASCENDING, MongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from locutus import tracing
+from locutus.storage import stats
 
 uri_filter = re.compile(r"(mongodb:\/\/[^:]*:)([^@]*)(@)")
 
 
-import pdb
+def _flush_pending(collection=None):
+    """Write any saves that the current request's unit of work is holding
+    for the collection (or all collections if None) before it is touched,
+    along with any queued provenance. See locutus.model.unit_of_work and
+    locutus.model.provenance_queue"""
+    from locutus.model import provenance_queue
+    from locutus.model.unit_of_work import flush
+
+    name = None if collection is None else collection.name
+    flush(name)
+    if name is None or name == provenance_queue.collection_name:
+        provenance_queue.flush()
+
+
+class _DatabaseCall:
+    """Times a single database call, adding it to the request's database
+    stats (see locutus.storage.stats) and trace (see locutus.tracing)"""
+
+    __slots__ = ("collection", "operation", "query", "documents", "start")
+
+    def __init__(self, collection, operation, query=None):
+        self.collection = collection.name
+        self.operation = operation
+        self.query = query
+        self.documents = 0
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(perf_counter() - self.start)
+        return False
+
+    def finish(self, elapsed):
+        stats.record(
+            self.collection, self.operation, elapsed, self.documents, self.query
+        )
+        trace = tracing.current_trace()
+        if trace is not None:
+            trace.record(
+                f"mongo.{self.operation}",
+                elapsed,
+                db=True,
+                attributes={"collection": self.collection, "documents": self.documents},
+            )
+
+
+def _db_call(collection, operation, query=None):
+    return _DatabaseCall(collection, operation, query)
+
+
+def _db_cursor(collection, operation, cursor, query=None):
+    """Yield the cursor's documents, timing only the fetches (not the time
+    the caller spends between them) as a single database call"""
+    call = _DatabaseCall(collection, operation, query)
+    elapsed = 0.0
+    try:
+        while True:
+            start = perf_counter()
+            try:
+                doc = next(cursor)
+            except StopIteration:
+                break
+            finally:
+                elapsed += perf_counter() - start
+            call.documents += 1
+            yield doc
+    finally:
+        call.finish(elapsed)
 
 
 class DocumentSnapshot:
@@ -31,12 +106,14 @@ class DocumentSnapshot:
             return {}
         # Filter out any database-specific fields (starting with _)
         this = {k: v for k, v in self._data.items()}  # if not k.startswith('_')}
-        if "id" not in this:
+        if "id" not in this and "_id" in this:
             this["id"] = str(this["_id"])
         return this
 
     def delete(self):
-        result = self._collection.delete_one({"_id": ObjectId(self._doc_id)})
+        _flush_pending(self._collection)
+        with _db_call(self._collection, "delete_one", {"_id": self.id}):
+            return self._collection.delete_one({"_id": self.id})
 
 
 class DocumentReference:
@@ -46,55 +123,70 @@ class DocumentReference:
         self._parent_path = parent_path
 
     def get(self):
+        _flush_pending(self._collection)
         # Try to find by _id first (MongoDB native way)
-        print(f"[DEBUG] Looking for document with _id: {self._doc_id}")
-        doc = self._collection.find_one({"_id": ObjectId(self._doc_id)})
+        query = {"_id": ObjectId(self._doc_id)}
+        with _db_call(self._collection, "find_one", query) as call:
+            doc = self._collection.find_one(query)
+            call.documents = int(doc is not None)
         if not doc:
             # If not found, try to find by id field (Firestore compatibility)
-            print(f"[DEBUG] Not found by _id, trying id field: {self._doc_id}")
-            doc = self._collection.find_one({"id": str(self._doc_id)})
+            query = {"id": str(self._doc_id)}
+            with _db_call(self._collection, "find_one", query) as call:
+                doc = self._collection.find_one(query)
+                call.documents = int(doc is not None)
 
         if doc:
             # Ensure compatibility with Firestore and MongoDB
-            print(
-                f"[DEBUG] Found document: {doc.get('_id', 'no-id')} / {doc.get('name', 'no-name')}"
-            )
             # Remove all database-specific fields (starting with _)
             doc = {k: v for k, v in doc.items()}  # if not k.startswith('_')}
             if "id" not in doc:
                 doc["id"] = doc["_id"]
-        else:
-            print(f"[DEBUG] Document not found: {self._doc_id}")
         return DocumentSnapshot(self._doc_id, doc, collection=self._collection)
 
     def set(self, data):
+        _flush_pending(self._collection)
         # Overwrites the entire document (upsert = True)
         # Use the id field for consistency, and also set _id for MongoDB compatibility
         if self._doc_id:
             data["_id"] = ObjectId(self._doc_id)
             if "id" not in data:
                 data["id"] = self._doc_id
-            doc = self._collection.replace_one(
-                {"_id": ObjectId(self._doc_id)}, data, upsert=True
-            )
+            query = {"_id": ObjectId(self._doc_id)}
+            with _db_call(self._collection, "replace_one", query):
+                doc = self._collection.replace_one(query, data, upsert=True)
         else:
-            _id = self._collection.insert_one(data)
+            with _db_call(self._collection, "insert_one"):
+                _id = self._collection.insert_one(data)
             data["_id"] = str(_id.inserted_id)
             data["id"] = data["_id"]
 
         return data["_id"]
 
     def update(self, fields):
+        _flush_pending(self._collection)
         # Merges fields into existing doc
-        self._collection.update_one(
-            {"_id": self._doc_id}, {"$set": fields}, upsert=False
-        )
+        query = {"_id": self._doc_id}
+        with _db_call(self._collection, "update_one", query):
+            self._collection.update_one(query, {"$set": fields}, upsert=False)
+
+    def modify(self, update):
+        """Apply a MongoDB update ($set, $push, $unset, etc) to the document"""
+        _flush_pending(self._collection)
+        query = {"_id": ObjectId(self._doc_id)}
+        with _db_call(self._collection, "update_one", query):
+            return self._collection.update_one(query, update)
 
     def delete(self):
+        _flush_pending(self._collection)
         # Try to delete by _id first, then by id field for compatibility
-        result = self._collection.delete_one({"_id": ObjectId(self._doc_id)})
+        query = {"_id": ObjectId(self._doc_id)}
+        with _db_call(self._collection, "delete_one", query):
+            result = self._collection.delete_one(query)
         if result.deleted_count == 0:
-            result = self._collection.delete_one({"id": ObjectId(self._doc_id)})
+            query = {"id": ObjectId(self._doc_id)}
+            with _db_call(self._collection, "delete_one", query):
+                result = self._collection.delete_one(query)
         return result
 
     def collection(self, subcollection_name):
@@ -126,23 +218,51 @@ class CollectionReference:
 
     def stream(self):
         """Stream all documents in the collection (for Firestore compatibility)"""
-        for doc in self._collection.find():
+        _flush_pending(self._collection)
+        for doc in _db_cursor(self._collection, "find", self._collection.find()):
             doc_id = doc.get("_id") or doc.get("id")
             # Remove all database-specific fields (starting with _)
             filtered_doc = {k: v for k, v in doc.items()}  # if not k.startswith('_')}
             yield DocumentSnapshot(doc_id, filtered_doc, collection=self._collection)
 
-    def find(self, query=None, sorting=None, return_instance=True):
-        """Find documents matching the query - returns raw dictionaries for direct use"""
+    def find(
+        self,
+        query=None,
+        sorting=None,
+        return_instance=True,
+        projection=None,
+        limit=None,
+        after=None,
+        cursor_field="_id",
+    ):
+        """Find documents matching the query - returns raw dictionaries for direct use
+
+        projection is passed along to MongoDB as is, so it can include or
+        exclude fields as well as compute new ones (such as $size).
+
+        For keyset pagination, after is the cursor_field value of the last
+        document of the previous page. Unless another sorting is provided,
+        results are sorted on cursor_field, which should be indexed and
+        unique (_id or id)."""
         if query is None:
             query = {}
+        _flush_pending(self._collection)
+
+        if after is not None:
+            if cursor_field == "_id" and ObjectId.is_valid(after):
+                after = ObjectId(after)
+            query = {"$and": [query, {cursor_field: {"$gt": after}}]}
+        if sorting is None and (after is not None or limit is not None):
+            sorting = [(cursor_field, ASCENDING)]
 
-        qresult = self._collection.find(query)
+        qresult = self._collection.find(query, projection)
         if sorting is not None:
             qresult = qresult.sort(sorting)
-        for doc in qresult:
+        if limit is not None:
+            qresult = qresult.limit(limit)
+        for doc in _db_cursor(self._collection, "find", qresult, query):
             if return_instance:
-                yield DocumentSnapshot(doc["_id"], doc, collection=self._collection)
+                yield DocumentSnapshot(doc.get("_id"), doc, collection=self._collection)
             else:
                 yield doc
 
@@ -150,66 +270,271 @@ class CollectionReference:
         """Find one document matching the query - returns raw dictionary for direct use"""
         if query is None:
             query = {}
-        doc = self._collection.find_one(query)
+        _flush_pending(self._collection)
+        with _db_call(self._collection, "find_one", query) as call:
+            doc = self._collection.find_one(query)
+            call.documents = int(doc is not None)
         if doc:
             # Remove all database-specific fields (starting with _)
             return {k: v for k, v in doc.items() if not k.startswith("_")}
         return None
 
+    def find_one_and_update(self, query, update, upsert=False):
+        """Atomically update (or, with upsert, create) the document matching
+        the query and return it as it is after the update"""
+        _flush_pending(self._collection)
+        try:
+            with _db_call(self._collection, "find_one_and_update", query):
+                return self._collection.find_one_and_update(
+                    query, update, upsert=upsert, return_document=ReturnDocument.AFTER
+                )
+        except DuplicateKeyError:
+            if not upsert:
+                raise
+            # Someone else inserted the document between our match and our
+            # insert. The unique index guarantees there is exactly one of
+            # them now, so simply try again and we'll update that one.
+            with _db_call(self._collection, "find_one_and_update", query):
+                return self._collection.find_one_and_update(
+                    query, update, upsert=upsert, return_document=ReturnDocument.AFTER
+                )
+
+    def create_index(self, keys, **kwargs):
+        return self._collection.create_index(keys, **kwargs)
+
+    def index_information(self):
+        return self._collection.index_information()
+
     def document(self, doc_id=None):
         return DocumentReference(self._collection, doc_id, self._parent_path)
 
+    def aggregate(self, pipeline, allow_disk_use=False, session=None):
+        """Run an aggregation pipeline against the collection, yielding the
+        raw documents it produces"""
+        # Pipelines can $lookup from anywhere
+        _flush_pending()
+        yield from _db_cursor(
+            self._collection,
+            "aggregate",
+            self._collection.aggregate(
+                pipeline, allowDiskUse=allow_disk_use, session=session
+            ),
+        )
+
+    def insert_many(self, documents, ordered=True, session=None):
+        """Insert all documents with a single call. Returns the inserted _ids"""
+        if len(documents) == 0:
+            return []
+        _flush_pending(self._collection)
+        with _db_call(self._collection, "insert_many") as call:
+            call.documents = len(documents)
+            return self._collection.insert_many(
+                documents, ordered=ordered, session=session
+            ).inserted_ids
+
+    def bulk_write(self, requests, ordered=True, session=None):
+        """Pass a list of pymongo write operations (InsertOne, UpdateOne, etc)
+        through to the database as a single batch."""
+        if len(requests) == 0:
+            return None
+        _flush_pending(self._collection)
+        with _db_call(self._collection, "bulk_write"):
+            return self._collection.bulk_write(
+                requests, ordered=ordered, session=session
+            )
+
+    def delete_many(self, query, session=None):
+        """Delete every document matching the query. Returns the number deleted"""
+        _flush_pending(self._collection)
+        with _db_call(self._collection, "delete_many", query) as call:
+            call.documents = self._collection.delete_many(
+                query, session=session
+            ).deleted_count
+        return call.documents
+
+    def update_many(self, query, update, session=None):
+        """Apply the update to every document matching the query. Returns the
+        number modified"""
+        _flush_pending(self._collection)
+        with _db_call(self._collection, "update_many", query) as call:
+            call.documents = self._collection.update_many(
+                query, update, session=session
+            ).modified_count
+        return call.documents
+
     def add_aliases(self, keys, doc_id):
-        doc = self._collection.find_one({"_id": doc_id})
+        _flush_pending(self._collection)
+        with _db_call(self._collection, "find_one", {"_id": doc_id}):
+            doc = self._collection.find_one({"_id": doc_id})
         aliases = doc.get("aliases", []) if doc else []
         updated_aliases = list(set(aliases) | set(keys))
-        self._collection.update_one(
-            {"_id": doc_id}, {"$set": {"aliases": updated_aliases}}, upsert=True
-        )
+        with _db_call(self._collection, "update_one", {"_id": doc_id}):
+            self._collection.update_one(
+                {"_id": doc_id}, {"$set": {"aliases": updated_aliases}}, upsert=True
+            )
 
-    def list_documents(self, page_size):
-        return [doc for doc in self.stream()]
+    def list_documents(self, page_size=None):
+        """The first page_size documents (all of them if page_size is None)"""
+        return list(self.find(limit=page_size))
 
 
 def filter_uri(uri):
     return uri_filter.sub(r"\1****\3", uri)
 
 
+# Environment variable => (MongoClient option, type)
+_client_settings = {
+    "LOCUTUS_MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "LOCUTUS_MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "LOCUTUS_MONGO_MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "LOCUTUS_MONGO_MAX_CONNECTING": ("maxConnecting", int),
+    "LOCUTUS_MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "LOCUTUS_MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "LOCUTUS_MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "LOCUTUS_MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "LOCUTUS_MONGO_READ_PREFERENCE": ("readPreference", str),
+    "LOCUTUS_MONGO_APP_NAME": ("appname", str),
+}
+
+# Wire compression and the module each requires
+_compressor_modules = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+def _available_compressors(requested):
+    """The requested compressors (in order of preference) whose libraries
+    are installed. Those that aren't are skipped with a warning rather than
+    keeping the client from being created."""
+    compressors = []
+    for compressor in [c.strip().lower() for c in requested.split(",") if c.strip()]:
+        module = _compressor_modules.get(compressor)
+        if module is None:
+            logging.warning(f"Unknown Mongo compressor, {compressor}, ignored")
+            continue
+        try:
+            __import__(module)
+        except ImportError:
+            logging.warning(
+                f"Mongo compressor, {compressor}, requires {module} which isn't installed"
+            )
+            continue
+        compressors.append(compressor)
+    return compressors
+
+
+def client_options():
+    """MongoClient keyword arguments based on the LOCUTUS_MONGO_* environment
+    variables. Anything not set is left to pymongo's defaults (or the
+    options in the URI)."""
+    options = {
+        # Don't open any connections until the first operation. Together with
+        # the fork handling below, this keeps a client created before gunicorn
+        # forks its workers from sharing sockets with them
+        "connect": False,
+    }
+
+    for variable, (option, option_type) in _client_settings.items():
+        value = os.getenv(variable)
+        if value is not None and value.strip() != "":
+            options[option] = option_type(value)
+
+    compressors = os.getenv("LOCUTUS_MONGO_COMPRESSORS")
+    if compressors:
+        available = _available_compressors(compressors)
+        if available:
+            options["compressors"] = ",".join(available)
+
+    return options
+
+
 class FirestoreCompatibleClient:
     logging.info("FirestoreCompatibleClient")
     from locutus.model import resource_types, simple_types
 
     allowed_collections = set(
-        list(resource_types.keys()) + simple_types + ["OntologyAPI"]
+        list(resource_types.keys()) + simple_types + ["OntologyAPI", "CacheVersion"]
     )
 
-    def __init__(self, mongo_uri=None, missing_ok=False):
+    def __init__(self, mongo_uri=None, missing_ok=False, check_database=None):
+        """When check_database is True, the server is asked whether the
+        database exists (raising a ValueError unless missing_ok) and for its
+        list of collections. Those are extra round trips for something that
+        is only logged when missing_ok, so, unless LOCUTUS_MONGO_CHECK_DB says
+        otherwise, the check is only done when the database must exist."""
         if mongo_uri is None:
             mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017/locutus")
+        if check_database is None:
+            check_database = (not missing_ok) or os.getenv(
+                "LOCUTUS_MONGO_CHECK_DB", "false"
+            ).lower() in ("true", "1", "yes")
 
-        print(f"Mongo DB URI: {filter_uri(mongo_uri)}")
+        logging.info(f"Mongo DB URI: {filter_uri(mongo_uri)}")
         parsed = urlparse(filter_uri(mongo_uri))
         db_name = unquote(parsed.path.lstrip("/")) if parsed.path else None
 
         logging.info(f"Database name parsed: '{db_name}'")
         if not db_name:
             raise ValueError("Database name must be specified in the Mongo URI path!")
-        self.client = MongoClient(mongo_uri)
-        available_dbs = self.client.list_database_names()
-
-        if db_name not in available_dbs:
-            if not missing_ok:
-                raise ValueError(
-                    f"The specified database, {db_name}, isn't present in the database. Available DBs include: {', '.join(self.client.list_database_names())}"
-                )
-            logging.error(f"Database, {db_name}, not currently found.")
+        self.pid = os.getpid()
+        self.client = MongoClient(mongo_uri, **client_options())
         self.db = self.client[db_name]
         self.db_name = db_name
-        self.collection_list = self.db.list_collection_names()
-        logging.info(
-            f"List of database collections in the connected DB: \n{', '.join(self.collection_list)}"
+        self._collection_list = None
+
+        if check_database:
+            available_dbs = self.client.list_database_names()
+
+            if db_name not in available_dbs:
+                if not missing_ok:
+                    raise ValueError(
+                        f"The specified database, {db_name}, isn't present in the database. Available DBs include: {', '.join(available_dbs)}"
+                    )
+                logging.error(f"Database, {db_name}, not currently found.")
+            logging.info(
+                f"List of database collections in the connected DB: \n{', '.join(self.collection_list)}"
+            )
+
+    @property
+    def collection_list(self):
+        """Names of the collections currently in the database (fetched the
+        first time it's asked for)"""
+        if self._collection_list is None:
+            self._collection_list = self.db.list_collection_names()
+        return self._collection_list
+
+    def ping(self):
+        """Raises an exception if the server can't be reached"""
+        with _db_call(self.client.admin, "ping"):
+            self.client.admin.command("ping")
+
+    def close(self):
+        self.client.close()
+
+    def supports_transactions(self):
+        """Transactions require a replica set (or mongos). A standalone
+        server, such as the one most of us run locally, can't do them."""
+        return self.client.topology_description.topology_type_name in (
+            "ReplicaSetWithPrimary",
+            "Sharded",
+            "LoadBalanced",
         )
 
+    @contextmanager
+    def transaction(self):
+        """Yields a session with an open transaction which is committed when
+        the block exits (or aborted if it raises). If the server can't do
+        transactions, this yields None and the writes happen as they would
+        have without the session."""
+        # Make sure we've actually talked to the server so that we know what
+        # sort of deployment this is
+        self.client.admin.command("ping")
+        if not self.supports_transactions():
+            yield None
+            return
+
+        with self.client.start_session() as session:
+            with session.start_transaction():
+                yield session
+
     def collection(self, collection_name):
         if collection_name not in FirestoreCompatibleClient.allowed_collections:
             collection_names = "\n *".join(
@@ -226,9 +551,26 @@ class FirestoreCompatibleClient:
 _client = None
 
 
+def _forget_client():
+    """MongoClients aren't fork safe. A worker forked from a process that
+    already has a client (gunicorn --preload, for instance) must not use the
+    parent's sockets, so the child starts over with a client of its own."""
+    global _client
+    _client = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_client)
+
+
 def persistence(mongo_uri=None, missing_ok=True):
     global _client
 
+    # register_at_fork covers os.fork, but not every way a process can be
+    # cloned, so double check that the client was created by this process
+    if _client is not None and _client.pid != os.getpid():
+        _forget_client()
+
     if _client is None:
         _client = FirestoreCompatibleClient(mongo_uri, missing_ok)
     return _client
@@ -0,0 +1,121 @@
+"""
+Per-request database statistics and the slow query log.
+
+Every call locutus.storage.mongo makes to the database is recorded here. While
+a request is active, the number of queries, the documents they returned and
+the time they took are tallied on flask's g and returned to the client as the
+X-DB-Queries, X-DB-Documents and X-DB-Time-ms response headers.
+
+Headers go out before the body, so for streamed responses (such as the
+harmony exports) they only cover what happened before the body started and
+leave out the queries which produce the body itself. The totals for the
+entire request are logged once the response is closed.
+
+Queries taking longer than LOCUTUS_SLOW_QUERY_MS (100ms by default, 0 turns
+the log off) are logged along with the shape of their filter, that is, the
+filter with each of its values replaced by the value's type, so that the log
+shows which queries are slow without filling up with the values themselves.
+"""
+
+import logging
+import os
+
+from flask import g, has_app_context
+
+logger = logging.getLogger("locutus.storage.stats")
+
+slow_query_ms = float(os.getenv("LOCUTUS_SLOW_QUERY_MS", 100))
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.documents = 0
+        self.time = 0.0
+
+    def add(self, elapsed, documents):
+        self.queries += 1
+        self.documents += documents
+        self.time += elapsed
+
+
+# Operators whose arrays are clauses rather than values
+_logical_operators = {"$and", "$or", "$nor"}
+
+
+def filter_shape(query):
+    """{"id": {"$in": ["tm-1", "tm-2"]}} => {"id": {"$in": ["str"]}}
+
+    Arrays of values are cut down to their first element, but each of the
+    clauses of $and, $or and $nor is kept"""
+    if isinstance(query, dict):
+        return {
+            key: [filter_shape(clause) for clause in value]
+            if key in _logical_operators and isinstance(value, (list, tuple))
+            else filter_shape(value)
+            for key, value in query.items()
+        }
+    if isinstance(query, (list, tuple)):
+        return [filter_shape(value) for value in query[:1]]
+    return type(query).__name__
+
+
+def current():
+    if not has_app_context():
+        return None
+    return g.get("db_stats")
+
+
+def record(collection, operation, elapsed, documents=0, query=None):
+    """Add a database call (elapsed is in seconds) to the request's stats
+    and log it if it was slow"""
+    stats = current()
+    if stats is not None:
+        stats.add(elapsed, documents)
+
+    elapsed_ms = elapsed * 1000
+    if slow_query_ms > 0 and elapsed_ms > slow_query_ms:
+        shape = filter_shape(query) if query is not None else None
+        logger.warning(
+            f"Slow query: {collection}.{operation} took {elapsed_ms:.1f}ms "
+            f"({documents} documents) filter: {shape}",
+            extra={
+                "collection": collection,
+                "operation": operation,
+                "elapsed_ms": round(elapsed_ms, 3),
+                "documents": documents,
+                "filter_shape": shape,
+            },
+        )
+
+
+def begin_db_stats():
+    g.db_stats = RequestStats()
+
+
+def _log_db_stats(request_id, stats):
+    logger.debug(
+        f"Request {request_id}: {stats.queries} queries, "
+        f"{stats.documents} documents, {stats.time * 1000:.1f}ms"
+    )
+
+
+def add_db_stats_headers(response):
+    """after_request hook. For streamed responses, the headers only cover the
+    queries made before the body is streamed (see above)."""
+    request_id = g.get("request_id", "n/a")
+    if response.is_streamed:
+        # Keep tallying while the body is streamed, and log the final count
+        stats = g.get("db_stats")
+        if stats is not None:
+            response.call_on_close(lambda: _log_db_stats(request_id, stats))
+    else:
+        stats = g.pop("db_stats", None)
+        if stats is not None:
+            _log_db_stats(request_id, stats)
+
+    if stats is not None:
+        response.headers["X-DB-Queries"] = str(stats.queries)
+        response.headers["X-DB-Documents"] = str(stats.documents)
+        response.headers["X-DB-Time-ms"] = f"{stats.time * 1000:.1f}"
+    return response
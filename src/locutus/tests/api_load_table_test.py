@@ -121,3 +121,36 @@ def test_loading_table_put(client, ftd_concept_relationships):
 
     # t.global_id().delete()
     t.delete(hard_delete=True)
+
+
+def test_loading_table_invalid_row(client, ftd_concept_relationships):
+    global mini_table_body
+
+    original_table = Table(
+        name="FTD Table 02",
+        url="http://ftd.unit.tests/basic_table/02",
+        description="Simple Test Table",
+        editor="unit-test",
+    )
+    original_table.save()
+
+    body = deepcopy(mini_table_body)
+    body["csvContents"][-1]["data_type"] = "not-a-type"
+
+    response = client.put(
+        f"/api/LoadTable/{original_table.id}",
+        json=body,
+        headers={"Content-Type": "application/json"},
+    )
+    assert response.status_code == 400
+
+    # The CSV is validated before anything is written, so none of the valid
+    # rows should have made it in either
+    t = Table.get(original_table.id)
+    assert len(t.variables) == 0
+
+    term = t.terminology.dereference()
+    assert len(term.codes) == 0
+
+    term.delete(hard_delete=True)
+    t.delete(hard_delete=True)
@@ -16,4 +16,28 @@ def test_table_get(client, sample_terminology, basic_table):
 
     table = response.json 
     assert table['id'] == basic_table.id 
-    assert table['name'] == basic_table.name
\ No newline at end of file
+    assert table['name'] == basic_table.name
+
+def test_table_list_summary_and_pages(client, sample_terminology, basic_table):
+    response = client.get("/api/Table?summary=true")
+    assert response.status_code == 200
+    tables = response.json
+
+    summary = [t for t in tables if t["id"] == basic_table.id][0]
+    assert summary["name"] == basic_table.name
+    assert summary["variables_count"] == len(basic_table.variables)
+    assert "variables" not in summary
+
+    # A page that holds exactly what's left isn't followed by another
+    response = client.get(f"/api/Table?summary=true&limit={len(tables)}")
+    assert len(response.json) == len(tables)
+    assert "X-Next-Cursor" not in response.headers
+
+    if len(tables) > 1:
+        response = client.get(f"/api/Table?summary=true&limit={len(tables) - 1}")
+        assert response.headers["X-Next-Cursor"] == response.json[-1]["id"]
+        response = client.get(
+            f"/api/Table?summary=true&limit={len(tables)}&after={response.headers['X-Next-Cursor']}"
+        )
+        assert [t["id"] for t in response.json] == [tables[-1]["id"]]
+        assert "X-Next-Cursor" not in response.headers
@@ -0,0 +1,146 @@
+import pytest
+
+from locutus.model.cascade import CascadeDelete, _references
+from locutus.model.coding import Coding, CodingMapping
+from locutus.model.datadictionary import DataDictionary
+from locutus.model.provenance import Provenance
+from locutus.model.table import Table
+from locutus.model.terminology import Terminology
+from locutus.model.user_input import MappingConversation, MappingVote
+
+
+def build_terminology(id):
+    t = Terminology(
+        id=id,
+        name=id,
+        url=f"http://example.com/{id}",
+        description=f"{id} for the cascade tests",
+        editor="unit tests",
+        codes=[
+            Coding(terminology_id=id, code="C1", display="Code One", system=f"http://example.com/{id}"),
+            Coding(terminology_id=id, code="C2", display="Code Two", system=f"http://example.com/{id}"),
+        ],
+    )
+    t.save()
+    return t
+
+
+def enum_variable(name, terminology):
+    return {
+        "name": name,
+        "data_type": "enumeration",
+        "code": name,
+        "description": f"{name} description",
+        "enumerations": {"reference": f"Terminology/{terminology.id}"},
+    }
+
+
+def test_references():
+    doc = {
+        "terminology": {"reference": "Terminology/tm-shadow"},
+        "variables": [
+            {"name": "a", "enumerations": {"reference": "Terminology/tm-a"}},
+            {"name": "b"},
+            {"name": "c", "enumerations": {"reference": "Terminology/tm-c"}},
+        ],
+        "tables": [{"reference": "Table/tb-1"}, {"reference": "Table/tb-2"}],
+    }
+    assert _references(doc, "terminology") == ["Terminology/tm-shadow"]
+    assert _references(doc, "variables.enumerations") == [
+        "Terminology/tm-a",
+        "Terminology/tm-c",
+    ]
+    assert _references(doc, "tables") == ["Table/tb-1", "Table/tb-2"]
+    assert _references(doc, "datadictionary") == []
+
+
+def test_terminology_cascade():
+    t = build_terminology("cascade-one")
+    t.set_mapping(
+        "C1",
+        [CodingMapping("MAPPED_CODE", "Mapped Display", "http://mapping.system", mapping_relationship="")],
+        "test_editor",
+    )
+
+    conversation = MappingConversation(terminology_id=t.id, source_code="C1", mapped_code="MAPPED_CODE")
+    conversation.add_input("A comment", editor="user1")
+    conversation.save()
+    vote = MappingVote(terminology_id=t.id, source_code="C1", mapped_code="MAPPED_CODE")
+    vote.add_input("up", "user1")
+    vote.save()
+
+    provenance_count = len(Provenance.find({"terminology_id": t.id}, return_instance=False))
+    assert provenance_count > 0
+
+    counts = CascadeDelete(hard_delete=True).terminologies(t.id).run()
+    assert counts["Terminology"] == 1
+    assert counts["Coding"] == 2
+    assert counts["Provenance"] == provenance_count
+    assert counts["MappingConversation"] == 1
+    assert counts["MappingVote"] == 1
+
+    assert Terminology.get(t.id) is None
+    for collection in [Coding, Provenance, MappingConversation, MappingVote]:
+        assert collection.find({"terminology_id": t.id}, return_instance=False) == []
+
+
+def test_soft_delete_terminology():
+    t = build_terminology("cascade-soft")
+
+    counts = CascadeDelete(hard_delete=False).terminologies(t.id).run()
+    assert counts["Coding"] == 2
+
+    codings = Coding.find({"terminology_id": t.id}, return_instance=False)
+    assert len(codings) == 2
+    assert all(coding["valid"] is False for coding in codings)
+
+    CascadeDelete(hard_delete=True).terminologies(t.id).run()
+
+
+def test_table_cascade():
+    owned = build_terminology("cascade-owned")
+    shared = build_terminology("cascade-shared")
+
+    table = Table(
+        name="Cascade Table",
+        url="http://ftd.unit.tests/cascade/01",
+        description="Table to be deleted",
+        editor="unit-test",
+        variables=[enum_variable("owned_var", owned), enum_variable("shared_var", shared)],
+    )
+    table.save()
+    other_table = Table(
+        name="Other Table",
+        url="http://ftd.unit.tests/cascade/02",
+        description="Table sharing an enumeration",
+        editor="unit-test",
+        variables=[enum_variable("shared_var", shared)],
+    )
+    other_table.save()
+
+    dd = DataDictionary(
+        name="cascade-dd",
+        description="References both tables",
+        tables=[
+            {"reference": f"Table/{table.id}"},
+            {"reference": f"Table/{other_table.id}"},
+        ],
+    )
+    dd.save()
+
+    shadow_id = table.terminology.reference_id()
+    table.delete(hard_delete=True, cascade=True)
+
+    assert Table.get(table.id) is None
+    assert Terminology.get(shadow_id) is None
+    assert Terminology.get(owned.id) is None
+
+    # The other table still needs this one
+    assert Terminology.get(shared.id) is not None
+
+    dd = DataDictionary.get(dd.id)
+    assert [ref.reference for ref in dd.tables] == [f"Table/{other_table.id}"]
+
+    dd.delete(hard_delete=True, cascade=True)
+    assert Table.get(other_table.id) is None
+    assert Terminology.get(shared.id) is None
@@ -160,6 +160,66 @@ class TestCoding:
         assert len(db_copy.mappings) == 0
 
 
+    def test_upsert_existing_coding(self, coding_one):
+        coding_one.set_mappings([
+            CodingMapping(code="MAP_C1_A", display="Map C1 A", system="http://map.com/A", mapping_relationship='equivalent'),
+        ])
+        coding_one.save()
+
+        # A new instance for the same code updates the existing coding...
+        again = Coding(terminology_id=coding_one.terminology_id,
+            code=coding_one.code,
+            display="Code One, Again",
+            system=coding_one.system,
+        )
+        again.save()
+        assert again.id == coding_one.id
+        assert len(Coding.find({"terminology_id": coding_one.terminology_id,
+                                "code": coding_one.code}, return_instance=False)) == 1
+
+        # ...keeping its mappings, since it doesn't have any of its own
+        db_copy = Coding.get(terminology_id=coding_one.terminology_id, code=coding_one.code)
+        assert db_copy.display == "Code One, Again"
+        assert [m.code for m in db_copy.mappings] == ["MAP_C1_A"]
+        assert [m.code for m in again.mappings] == ["MAP_C1_A"]
+
+        # Mappings of its own replace them
+        replaced = Coding(terminology_id=coding_one.terminology_id,
+            code=coding_one.code,
+            system=coding_one.system,
+            mappings=[{"code": "MAP_C1_B", "display": "Map C1 B", "system": "http://map.com/B"}],
+        )
+        replaced.save()
+        assert replaced.id == coding_one.id
+        db_copy = Coding.get(terminology_id=coding_one.terminology_id, code=coding_one.code)
+        assert [m.code for m in db_copy.mappings] == ["MAP_C1_B"]
+
+    def test_new_invalid_coding(self, coding_one):
+        # An invalid coding for the same code is a separate record, and leaves
+        # the valid one alone
+        retired = Coding(terminology_id=coding_one.terminology_id,
+            code=coding_one.code,
+            system=coding_one.system,
+            valid=False,
+        )
+        retired.save()
+        assert retired.id != coding_one.id
+
+        db_copy = Coding.get(terminology_id=coding_one.terminology_id, code=coding_one.code)
+        assert db_copy.id == coding_one.id
+        assert db_copy.valid is True
+        retired.delete(hard_delete=True)
+
+    def test_editor_saves(self):
+        coding = Coding(terminology_id="Example-Terminology",
+            code="edited",
+            system="http://example.com/example-terminology",
+            editor="unit-test",
+        )
+        assert coding.id is not None
+        assert Coding.get(terminology_id="Example-Terminology", code="edited").id == coding.id
+        coding.delete(hard_delete=True)
+
     def test_coding_with_dots(self):
         """Tests successful initialization with all fields."""
 
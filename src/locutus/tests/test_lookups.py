@@ -0,0 +1,182 @@
+import threading
+
+import pytest
+
+import locutus.model.lookups
+from locutus.model import cache_version
+from locutus.model.exceptions import InvalidValueError
+from locutus.model.lookups import FTDOntologyLookup, OntologyAPICollection
+from locutus.model.validation import validate_enums
+
+
+@pytest.fixture
+def ontology_lookup(monkeypatch):
+    calls = []
+
+    def fake_lookup():
+        calls.append(1)
+        return {
+            "LNC": "http://loinc.org",
+            "LOINC": "http://loinc.org",
+            "HP": "http://purl.obolibrary.org/obo/hp.owl",
+            "": "http://example.com/no-curie",
+        }
+
+    monkeypatch.setattr(locutus.model.lookups, "ftd_ontology_lookup", fake_lookup)
+    FTDOntologyLookup.reload()
+    calls.clear()
+    yield calls
+
+    monkeypatch.undo()
+    FTDOntologyLookup.reload()
+
+
+class TestFTDOntologyLookup:
+    def test_mapped_curie(self, ontology_lookup):
+        assert FTDOntologyLookup.get_mapped_curie("http://loinc.org") == "LNC"
+        assert (
+            FTDOntologyLookup.get_mapped_curie("http://purl.obolibrary.org/obo/hp.owl")
+            == "HP"
+        )
+        assert FTDOntologyLookup.get_mapped_curie("http://example.com/no-curie") == ""
+        assert FTDOntologyLookup.get_mapped_curie("http://unknown.org") == ""
+
+        # The lookup is served from memory
+        assert len(ontology_lookup) == 0
+
+    def test_mapped_system(self, ontology_lookup):
+        assert FTDOntologyLookup.get_mapped_system("LOINC") == "http://loinc.org"
+        assert FTDOntologyLookup.get_mapped_system("UNKNOWN") == "UNKNOWN"
+        assert len(ontology_lookup) == 0
+
+    def test_reload(self, ontology_lookup):
+        FTDOntologyLookup.reload()
+        assert len(ontology_lookup) == 1
+        assert FTDOntologyLookup.get_mapped_curie("http://loinc.org") == "LNC"
+
+
+class TestValidateEnums:
+    def test_additional_enums_leave_enums_alone(self):
+        enums = ["equivalent", "related"]
+
+        assert validate_enums("", enums, additional_enums=[""])
+        assert validate_enums("", enums, additional_enums=[""])
+        assert enums == ["equivalent", "related"]
+
+        with pytest.raises(InvalidValueError):
+            validate_enums("", enums)
+
+    def test_set_enums(self):
+        assert validate_enums(["related"], frozenset(["equivalent", "related"]))
+
+        with pytest.raises(InvalidValueError):
+            validate_enums("unrelated", frozenset(["equivalent", "related"]))
+
+
+@pytest.fixture
+def ontology_api_collection(monkeypatch):
+    documents = [
+        {
+            "api_id": "ols",
+            "ontologies": {
+                "hp": {"system": "http://purl.obolibrary.org/obo/hp.owl", "curie": "HP"},
+                "mondo": {
+                    "system": "http://purl.obolibrary.org/obo/mondo.owl",
+                    "curie": "Mondo",
+                },
+            },
+        },
+        {
+            "api_id": "umls",
+            "ontologies": {"snomedct": {"system": "http://snomed.info/sct"}},
+        },
+    ]
+    loads = []
+
+    def load(self):
+        loads.append(1)
+        return documents
+
+    monkeypatch.setattr(OntologyAPICollection, "_load", load)
+    monkeypatch.setattr(OntologyAPICollection, "_instances", {})
+    monkeypatch.setattr(cache_version, "store", cache_version.MemoryVersionStore())
+    collection = OntologyAPICollection()
+    loads.clear()
+    yield collection, loads
+
+
+class TestOntologyAPICollection:
+    def test_ontology_data(self, ontology_api_collection):
+        collection, loads = ontology_api_collection
+
+        assert collection.get_ontology_data("system") == {
+            "HP": "http://purl.obolibrary.org/obo/hp.owl",
+            "MONDO": "http://purl.obolibrary.org/obo/mondo.owl",
+            "SNOMEDCT": "http://snomed.info/sct",
+        }
+        assert collection.get_ontology_data("curie") == {"HP": "HP", "MONDO": "Mondo"}
+        assert collection.get_ontology_data("version") == {}
+        assert collection.valid_curies() == {"HP", "MONDO"}
+        assert collection.get_ontology_keys() == ["hp", "mondo"]
+        assert len(loads) == 0
+
+    def test_invalidate(self, ontology_api_collection):
+        collection, loads = ontology_api_collection
+
+        OntologyAPICollection.invalidate()
+        assert len(loads) == 0
+        assert cache_version.current("OntologyAPI") == 1
+
+        collection.valid_curies()
+        collection.valid_curies()
+        assert len(loads) == 1
+
+    def test_changes_from_other_processes(self, ontology_api_collection, monkeypatch):
+        collection, loads = ontology_api_collection
+        monkeypatch.setattr(collection, "_version_check_interval", 0)
+
+        collection.valid_curies()
+        assert len(loads) == 0
+
+        # Another worker changed an OntologyAPI
+        cache_version.store.bump("OntologyAPI")
+        collection.valid_curies()
+        collection.valid_curies()
+        assert len(loads) == 1
+
+    def test_concurrent_reload(self, ontology_api_collection, monkeypatch):
+        collection, loads = ontology_api_collection
+        monkeypatch.setattr(collection, "_version_check_interval", 0)
+
+        # Hold the first reload up until every thread has asked for the data
+        slow_load = OntologyAPICollection._load
+        started = threading.Event()
+        proceed = threading.Event()
+
+        def load(self):
+            started.set()
+            proceed.wait(5)
+            return slow_load(self)
+
+        monkeypatch.setattr(OntologyAPICollection, "_load", load)
+        cache_version.store.bump("OntologyAPI")
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(collection.valid_curies()))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        proceed.set()
+        for thread in threads:
+            thread.join(5)
+
+        # Only one of them reloaded, and they all got the complete lookup
+        assert len(loads) == 1
+        assert results == [frozenset({"HP", "MONDO"})] * 4
+
+    def test_unversioned_resources_are_ignored(self, ontology_api_collection):
+        OntologyAPICollection.resource_changed("tm-not-cached")
+        assert cache_version.current("tm-not-cached") == 0
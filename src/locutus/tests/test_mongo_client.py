@@ -0,0 +1,42 @@
+import os
+
+from locutus.storage import mongo
+
+
+def test_client_options(monkeypatch):
+    for variable in mongo._client_settings:
+        monkeypatch.delenv(variable, raising=False)
+    monkeypatch.delenv("LOCUTUS_MONGO_COMPRESSORS", raising=False)
+
+    assert mongo.client_options() == {"connect": False}
+
+    monkeypatch.setenv("LOCUTUS_MONGO_MAX_POOL_SIZE", "25")
+    monkeypatch.setenv("LOCUTUS_MONGO_READ_PREFERENCE", "secondaryPreferred")
+    monkeypatch.setenv("LOCUTUS_MONGO_COMPRESSORS", "zlib, not-a-compressor")
+
+    assert mongo.client_options() == {
+        "connect": False,
+        "maxPoolSize": 25,
+        "readPreference": "secondaryPreferred",
+        "compressors": "zlib",
+    }
+
+
+def test_client_is_replaced_after_fork(monkeypatch):
+    created = []
+
+    class FakeClient:
+        def __init__(self, mongo_uri, missing_ok):
+            self.pid = os.getpid()
+            created.append(self)
+
+    monkeypatch.setattr(mongo, "FirestoreCompatibleClient", FakeClient)
+    monkeypatch.setattr(mongo, "_client", None)
+
+    client = mongo.persistence()
+    assert mongo.persistence() is client
+
+    # Pretend the client was created by our parent process
+    client.pid = -1
+    assert mongo.persistence() is not client
+    assert len(created) == 2
@@ -1,7 +1,8 @@
 import pytest 
-from locutus.model.provenance import Provenance 
+from locutus.model.provenance import Provenance, parse_timestamp
+import locutus
 from locutus.model.coding import Coding
-from datetime import datetime 
+from datetime import datetime, timedelta
 
 from time import sleep
 
@@ -150,7 +151,121 @@ class TestProvenance:
         p2.delete(hard_delete=True)
         p3.delete(hard_delete=True)
 
+    def test_timestamps_are_datetimes(self):
+        p = Provenance(
+                terminology_id="tm-0000001",
+                action=Provenance.ChangeType.Create,
+                editor="unit-test",
+                timestamp="2025-03-04 01:15:22.123456PM"
+            )
+        p.save()
+
+        prov = Provenance.terminology_provenance("tm-0000001")
+        assert prov[0]['timestamp'] == parse_timestamp("2025-03-04 01:15:22.123456PM")
+        assert type(prov[0]['timestamp']) is datetime
+        p.delete(hard_delete=True)
+
+    def test_history_pages(self):
+        start = datetime(2025, 1, 1, 11, 0)
+        records = []
+        for minutes in range(5):
+            p = Provenance(
+                    terminology_id="tm-0000001",
+                    action=Provenance.ChangeType.AddMapping,
+                    editor="unit-test",
+                    target="C1",
+                    new_value=str(minutes),
+                    # Straddles noon, which string timestamps sorted wrong
+                    timestamp=start + timedelta(minutes=minutes * 30)
+                )
+            p.save()
+            records.append(p)
+
+        page, cursor = Provenance.history("tm-0000001", target="C1", limit=2)
+        assert [x['new_value'] for x in page] == ["0", "1"]
+        page, cursor = Provenance.history("tm-0000001", target="C1", limit=2, cursor=cursor)
+        assert [x['new_value'] for x in page] == ["2", "3"]
+        page, cursor = Provenance.history("tm-0000001", target="C1", limit=2, cursor=cursor)
+        assert [x['new_value'] for x in page] == ["4"]
+        assert cursor is None
+
+        page, cursor = Provenance.history(
+            "tm-0000001",
+            target="C1",
+            since=start + timedelta(minutes=30),
+            until=start + timedelta(minutes=90),
+        )
+        assert [x['new_value'] for x in page] == ["1", "2"]
+        assert cursor is None
 
+        # Terminology level provenance is kept separate
+        page, cursor = Provenance.history("tm-0000001")
+        assert page == []
 
+        with pytest.raises(locutus.model.exceptions.InvalidQueryParameter):
+            Provenance.history("tm-0000001", target="C1", cursor="not-a-cursor")
+
+        for p in records:
+            p.delete(hard_delete=True)
+
+    def test_history_by_target(self):
+        start = datetime(2025, 2, 1, 9, 0)
+        records = []
+        for minutes, target in enumerate(["C1", "C2", "C1", None, "C1"]):
+            p = Provenance(
+                    terminology_id="tm-0000002",
+                    action=Provenance.ChangeType.AddTerm,
+                    editor="unit-test",
+                    target=target,
+                    new_value=str(minutes),
+                    timestamp=start + timedelta(minutes=minutes)
+                )
+            p.save()
+            records.append(p)
+
+        history = Provenance.history_by_target("tm-0000002")
+        assert sorted(history, key=str) == sorted(["C1", "C2", None], key=str)
+        changes, total = history["C1"]
+        assert [x['new_value'] for x in changes] == ["0", "2", "4"]
+        assert total == 3
+
+        # Only the latest changes to each target, but the full count
+        history = Provenance.history_by_target("tm-0000002", latest=2)
+        changes, total = history["C1"]
+        assert [x['new_value'] for x in changes] == ["2", "4"]
+        assert total == 3
+        assert [x['new_value'] for x in history["C2"][0]] == ["1"]
+
+        history = Provenance.history_by_target(
+            "tm-0000002", since=start + timedelta(minutes=2)
+        )
+        assert "C2" not in history
+        assert [x['new_value'] for x in history["C1"][0]] == ["2", "4"]
+
+        for p in records:
+            p.delete(hard_delete=True)
+
+    def test_migrate_timestamps(self):
+        from locutus.utility.provenance_timestamps import migrate
+
+        collection = locutus.persistence().collection("Provenance")
+        _id = collection.document(None).set({
+            "terminology_id": "tm-0000001",
+            "action": "Create Terminology",
+            "editor": "unit-test",
+            "target": None,
+            "valid": True,
+            "timestamp": "2025-03-04 01:15:22.123456PM",
+        })
+
+        converted, failed = migrate()
+        assert converted >= 1
+        assert failed == []
+
+        prov = Provenance.terminology_provenance("tm-0000001")
+        assert prov[0]['timestamp'] == parse_timestamp("2025-03-04 01:15:22.123456PM")
 
+        converted, failed = migrate()
+        assert converted == 0
 
+        collection.document(_id).delete()
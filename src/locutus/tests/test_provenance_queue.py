@@ -0,0 +1,137 @@
+import pytest
+from bson import ObjectId
+from bson.errors import InvalidDocument
+from pymongo.errors import AutoReconnect
+
+from locutus.model import provenance_queue
+from locutus.model.provenance import Provenance
+from locutus.model.provenance_queue import ProvenanceQueue
+
+
+class FlakyQueue(ProvenanceQueue):
+    """Keeps what it writes in memory and fails while down is set"""
+
+    def __init__(self, **kwargs):
+        super().__init__(flush_interval=0, **kwargs)
+        self.down = False
+        self.error = AutoReconnect("database is down")
+        self.batches = []
+
+    def _write(self, documents):
+        if self.down:
+            raise self.error
+        if documents:
+            self.batches.append(list(documents))
+        return len(documents)
+
+
+def doc(n):
+    return {"_id": ObjectId(), "terminology_id": "tm-queue", "target": f"C{n}"}
+
+
+def test_flushes_when_full():
+    queue = FlakyQueue(max_size=3)
+    queue.put(doc(1))
+    queue.put(doc(2))
+    assert queue.batches == []
+    assert queue.stats()["depth"] == 2
+
+    queue.put(doc(3))
+    assert [len(batch) for batch in queue.batches] == [3]
+    assert queue.stats()["depth"] == 0
+    assert queue.stats()["written"] == 3
+
+
+def test_flush_interval():
+    now = [0.0]
+    queue = FlakyQueue(max_size=100, clock=lambda: now[0])
+
+    queue.put(doc(1))
+    assert queue._oldest == 0.0
+    now[0] = 1.0
+    queue.put(doc(2))
+
+    # The age of the oldest record is what counts
+    assert queue._oldest == 0.0
+    queue.flush()
+    assert queue._oldest is None
+
+
+def test_spools_when_the_database_is_down(tmp_path):
+    spool = tmp_path / "spool.jsonl"
+    queue = FlakyQueue(max_size=100, spool_path=str(spool))
+
+    queue.down = True
+    first = [doc(1), doc(2)]
+    for document in first:
+        queue.put(document)
+    assert queue.flush() == 0
+    assert spool.exists()
+    assert queue.stats()["spooled"] == 2
+    assert queue.stats()["failed_flushes"] == 1
+
+    queue.down = False
+    queue.put(doc(3))
+    assert queue.flush() == 1
+
+    # The new record, then the spooled ones
+    assert [len(batch) for batch in queue.batches] == [1, 2]
+    assert [d["_id"] for d in queue.batches[1]] == [d["_id"] for d in first]
+    assert not spool.exists()
+    assert queue.stats()["written"] == 3
+
+
+def test_spools_whatever_the_error(tmp_path):
+    spool = tmp_path / "spool.jsonl"
+    queue = FlakyQueue(max_size=100, spool_path=str(spool))
+
+    # Not a PyMongoError, but the records still mustn't be lost
+    queue.down = True
+    queue.error = InvalidDocument("cannot encode object")
+    queue.put(doc(1))
+    assert queue.flush() == 0
+    assert queue.stats()["spooled"] == 1
+
+    queue.down = False
+    assert queue.flush() == 0
+    assert [len(batch) for batch in queue.batches] == [1]
+    assert not spool.exists()
+
+
+def test_spool_left_by_another_process(tmp_path):
+    spool = tmp_path / "spool.jsonl"
+    crashed = FlakyQueue(spool_path=str(spool))
+    crashed.down = True
+    crashed.put(doc(1))
+    crashed.flush()
+
+    queue = FlakyQueue(spool_path=str(spool))
+    assert queue.flush() == 0
+    assert [len(batch) for batch in queue.batches] == [1]
+    assert not spool.exists()
+
+
+def test_provenance_is_queued():
+    p = Provenance(
+        terminology_id="tm-queue-test",
+        action=Provenance.ChangeType.AddTerm,
+        editor="unit-test",
+        target="C1",
+    )
+    p.save()
+
+    if provenance_queue.enabled:
+        assert p._id is not None
+        assert provenance_queue.depth() > 0
+
+    # Reading from the collection writes whatever is queued first
+    found = Provenance.find({"terminology_id": "tm-queue-test"}, return_instance=True)
+    assert [x.id for x in found] == [p.id]
+    assert provenance_queue.depth() == 0
+
+    # Changes to queued (and now written) records are saved as usual
+    p.delete(hard_delete=False)
+    found = Provenance.find({"terminology_id": "tm-queue-test"}, return_instance=False)
+    assert found[0]["valid"] is False
+
+    p.delete(hard_delete=True)
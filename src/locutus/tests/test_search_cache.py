@@ -0,0 +1,173 @@
+import threading
+import time
+
+import pytest
+
+from locutus.model.exceptions import SearchBusy, SearchTimeout
+from locutus.model.search_cache import OntologySearch, SearchCache
+
+
+class StubBackend:
+    """Stands in for search_dragon's run_search"""
+
+    def __init__(self, delays=None, failures=None):
+        self.calls = []
+        self.delays = delays or {}
+        self.failures = failures or set()
+        self.lock = threading.Lock()
+
+    def __call__(self, onto_data, keywords, ontologies, apis, results_per_page, start_index):
+        with self.lock:
+            self.calls.append((keywords, tuple(apis)))
+        time.sleep(max(self.delays.get(api, 0) for api in apis))
+        for api in apis:
+            if api in self.failures:
+                raise RuntimeError(f"{api} is down")
+        return {
+            "search_query": f"https://search/?q={keywords}&apis={','.join(apis)}",
+            "results": [{"code": f"{api}:1", "display": keywords} for api in apis],
+            "results_per_ontology": {ontology: len(apis) for ontology in ontologies},
+            "results_count": len(apis),
+            "more_results_available": "ols" in apis,
+        }
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def search(searcher, keywords="cat scratch fever", apis=("ols",)):
+    return searcher.search({}, keywords, ["CL", "DUO"], list(apis), "10", "0")
+
+
+class TestSearchCache:
+    def test_lru(self):
+        cache = SearchCache(max_size=2, ttl=60)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+
+        # b is now the least recently used
+        cache.put("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = SearchCache(max_size=2, ttl=60, clock=clock)
+        cache.put("a", 1)
+
+        clock.now = 59
+        assert cache.get("a") == 1
+        clock.now = 60
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_in_flight_requests_are_coalesced(self):
+        cache = SearchCache()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "result"
+
+        results = []
+        first = threading.Thread(
+            target=lambda: results.append(cache.get_or_compute("key", compute))
+        )
+        first.start()
+        started.wait(5)
+
+        others = [
+            threading.Thread(
+                target=lambda: results.append(cache.get_or_compute("key", compute))
+            )
+            for _ in range(3)
+        ]
+        for thread in others:
+            thread.start()
+        release.set()
+        for thread in [first] + others:
+            thread.join(5)
+
+        assert results == ["result"] * 4
+        assert len(calls) == 1
+
+
+class TestOntologySearch:
+    def test_results_are_cached(self):
+        backend = StubBackend()
+        searcher = OntologySearch(backend, cache=SearchCache(), timeout=5)
+
+        first = search(searcher)
+        assert first["results"] == [{"code": "ols:1", "display": "cat scratch fever"}]
+
+        # Case and spacing of the keyword don't matter
+        assert search(searcher, keywords="Cat  Scratch Fever") == first
+        assert len(backend.calls) == 1
+
+        search(searcher, keywords="dog")
+        assert len(backend.calls) == 2
+
+    def test_one_search_for_all_apis(self):
+        backend = StubBackend()
+        searcher = OntologySearch(backend, cache=SearchCache(), timeout=5)
+
+        # The response is the backend's, as is
+        result = search(searcher, apis=["ols", "umls"])
+        assert result == backend({}, "cat scratch fever", ["CL", "DUO"], ["ols", "umls"], "10", "0")
+        assert backend.calls[0] == ("cat scratch fever", ("ols", "umls"))
+
+        # The order of the APIs doesn't matter to the cache
+        search(searcher, apis=["umls", "ols"])
+        assert len(backend.calls) == 2
+
+    def test_errors(self):
+        searcher = OntologySearch(
+            StubBackend(failures={"broken"}), cache=SearchCache(), timeout=5
+        )
+        with pytest.raises(RuntimeError):
+            search(searcher, apis=["broken"])
+
+        searcher = OntologySearch(
+            StubBackend(delays={"slow": 1}), cache=SearchCache(), timeout=0.1
+        )
+        with pytest.raises(SearchTimeout):
+            search(searcher, apis=["slow"])
+
+        # Failures aren't cached
+        backend = StubBackend(failures={"broken"})
+        searcher = OntologySearch(backend, cache=SearchCache(), timeout=5)
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                search(searcher, apis=["ols", "broken"])
+        assert len(backend.calls) == 2
+
+    def test_abandoned_searches_dont_pile_up(self):
+        backend = StubBackend(delays={"slow": 0.5})
+        searcher = OntologySearch(backend, cache=SearchCache(), timeout=0.1, max_workers=1)
+
+        with pytest.raises(SearchTimeout):
+            search(searcher, apis=["slow"])
+        assert searcher.stats() == {"running": 1, "abandoned": 1}
+
+        # The timed out search still has the only worker, so rather than
+        # waiting for it (and timing out too), the next is turned away
+        start = time.monotonic()
+        with pytest.raises(SearchBusy):
+            search(searcher, keywords="dog", apis=["ols"])
+        assert time.monotonic() - start < 0.1
+
+        # Once the slow search returns, its worker is free again
+        time.sleep(0.6)
+        assert searcher.stats() == {"running": 0, "abandoned": 0}
+        assert search(searcher, keywords="dog", apis=["ols"])["results_count"] == 1
@@ -0,0 +1,63 @@
+import pytest
+from flask import Flask, g
+
+from locutus.storage import stats
+
+
+@pytest.fixture
+def request_stats():
+    app = Flask(__name__)
+    with app.test_request_context():
+        stats.begin_db_stats()
+        yield g.db_stats
+
+
+def test_filter_shape():
+    assert stats.filter_shape({"id": "tm-1234"}) == {"id": "str"}
+    assert stats.filter_shape(
+        {"$and": [{"terminology_id": "tm-1"}, {"valid": True}], "n": {"$gt": 3}}
+    ) == {"$and": [{"terminology_id": "str"}, {"valid": "bool"}], "n": {"$gt": "int"}}
+    assert stats.filter_shape(
+        {"$or": [{"id": {"$in": ["tm-1", "tm-2"]}}, {"$nor": [{"a": 1}, {"b": "x"}]}]}
+    ) == {"$or": [{"id": {"$in": ["str"]}}, {"$nor": [{"a": "int"}, {"b": "str"}]}]}
+
+
+def test_request_stats(request_stats):
+    stats.record("Terminology", "find_one", 0.002, documents=1)
+    stats.record("Coding", "find", 0.003, documents=10)
+
+    assert request_stats.queries == 2
+    assert request_stats.documents == 11
+
+    response = stats.add_db_stats_headers(Flask(__name__).response_class())
+    assert response.headers["X-DB-Queries"] == "2"
+    assert response.headers["X-DB-Documents"] == "11"
+    assert response.headers["X-DB-Time-ms"] == "5.0"
+
+
+def test_streamed_responses(request_stats, caplog):
+    stats.record("Table", "find_one", 0.001, documents=1)
+
+    def body():
+        # The queries producing the body come after the headers are sent
+        stats.record("Table", "aggregate", 0.004, documents=20)
+        yield "rows"
+
+    response = stats.add_db_stats_headers(Flask(__name__).response_class(body()))
+    assert response.headers["X-DB-Queries"] == "1"
+
+    caplog.set_level("DEBUG", logger="locutus.storage.stats")
+    assert list(response.response) == ["rows"]
+    response.close()
+    assert "2 queries, 21 documents, 5.0ms" in caplog.records[-1].getMessage()
+
+
+def test_slow_queries_are_logged(monkeypatch, caplog):
+    monkeypatch.setattr(stats, "slow_query_ms", 10)
+
+    stats.record("Coding", "find", 0.001, query={"code": "abc"})
+    assert len(caplog.records) == 0
+
+    stats.record("Coding", "find", 0.5, documents=3, query={"code": "abc"})
+    assert len(caplog.records) == 1
+    assert "{'code': 'str'}" in caplog.records[0].getMessage()
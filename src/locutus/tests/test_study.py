@@ -2,9 +2,15 @@ import json
 
 import pytest
 
+import locutus
+from locutus.model.coding import CodingMapping
+from locutus.model.datadictionary import DataDictionary
 from locutus.model.global_id import GlobalID
+from locutus.model.harmony_export import harmony_exporter
 from locutus.model.study import Study
+from locutus.model.table import Table
 
+from .test_table import basic_table
 from .test_terminology import ftd_concept_relationships, sample_terminology
 
 
@@ -27,3 +33,86 @@ def test_study_basics(basic_study):
     assert study.id == basic_study.id
     assert study.name == basic_study.name
     assert study.description == basic_study.description
+
+
+def test_study_harmony_order(basic_table, sample_terminology):
+    """A table shared by two data-dictionaries has its rows repeated where it
+    appears in each and a code listed twice in a terminology yields its rows
+    once"""
+    mapping = [
+        CodingMapping(
+            "MAPPED_CODE",
+            "Mapped Display",
+            "http://mapping.system",
+            mapping_relationship="",
+        )
+    ]
+    sample_terminology.set_mapping("C1", mapping, "unit-test")
+
+    # The same code, twice
+    terminologies = locutus.persistence().collection("Terminology")
+    codes = terminologies.find_one({"id": sample_terminology.id})["codes"]
+    terminologies.update_one(
+        {"id": sample_terminology.id}, {"$set": {"codes": codes + codes[:1]}}
+    )
+
+    other_table = Table(
+        name="FTD Table 02",
+        url="http://ftd.unit.tests/basic_table/02",
+        description="Another Simple Test Table",
+        editor="unit-test",
+        variables=[
+            {
+                "name": "Other Var",
+                "data_type": "string",
+                "code": "other_var",
+                "description": "Other Variable Description",
+            },
+        ],
+    )
+    other_table.save()
+    other_table.terminology.dereference().set_mapping(
+        "other_var", mapping, "unit-test"
+    )
+
+    first_dd = DataDictionary(
+        name="first-dd",
+        description="Just the basic table",
+        tables=[{"reference": f"Table/{basic_table.id}"}],
+    )
+    first_dd.save()
+    second_dd = DataDictionary(
+        name="second-dd",
+        description="Another table and then the basic table",
+        tables=[
+            {"reference": f"Table/{other_table.id}"},
+            {"reference": f"Table/{basic_table.id}"},
+        ],
+    )
+    second_dd.save()
+    study = Study(
+        name="FTD Study 02",
+        url="http://ftd.unit.tests/locutus/",
+        title="Harmony Order Test Fixture",
+        datadictionary=[
+            {"reference": f"DataDictionary/{first_dd.id}"},
+            {"reference": f"DataDictionary/{second_dd.id}"},
+        ],
+    )
+    study.save()
+
+    exporter = harmony_exporter()
+    dd_id = exporter._header_map.get("dd_id", "dd_id")
+    table_id = exporter._header_map.get("table_id", "table_id")
+    rows = Study.get(study.id).as_harmony(harmony_exporter=exporter, version="v1")
+    assert [(row[dd_id], row[table_id]) for row in rows] == [
+        (first_dd.id, basic_table.id),
+        (second_dd.id, other_table.id),
+        (second_dd.id, basic_table.id),
+    ]
+
+    study.delete(hard_delete=True)
+    first_dd.delete(hard_delete=True)
+    second_dd.delete(hard_delete=True)
+    other_table.terminology.dereference().delete(hard_delete=True)
+    other_table.delete(hard_delete=True)
@@ -2,8 +2,11 @@ import json
 
 import pytest
 
+import locutus
+from locutus.model.coding import CodingMapping
 from locutus.model.exceptions import InvalidValueError
 from locutus.model.global_id import GlobalID
+from locutus.model.harmony_export import harmony_exporter
 from locutus.model.table import Table
 from locutus.model.terminology import Terminology
 from locutus.model.variable import Variable
@@ -130,3 +133,86 @@ def test_table_get(basic_table):
     shadow_terminology = table.terminology.dereference()
     assert shadow_terminology.id == table.terminology.reference_id()
     assert len(shadow_terminology.codes) == len(basic_table.variables)
+
+
+def test_table_variable_lookup(basic_table):
+    table = Table.get(basic_table.id)
+    assert table.get_variable("string_var").name == "String Var"
+    assert table.get_variable("Integer Var").code == "integer-var"
+    assert table.get_variable("Not A Var") is None
+
+    table.rename_var(
+        original_varname="String Var",
+        new_varname="Renamed Var",
+        new_description=None,
+        editor="unit-test",
+    )
+    assert table.get_variable("String Var") is None
+    assert table.get_variable("Renamed Var").code == "Renamed Var"
+
+    shadow = table.terminology.dereference()
+    assert shadow.has_code("integer-var")
+    table.remove_variable("Integer Var", editor="unit-test")
+    assert table.get_variable("integer-var") is None
+    assert not shadow.has_code("integer-var")
+
+
+def test_harmony_matches_the_object_model(basic_table, sample_terminology):
+    """The harmony rows built by the aggregation should match those built by
+    walking the Table, Terminology, Coding and CodingMapping objects, even for
+    data written before codes were cleaned up on the way in"""
+    shadow = basic_table.terminology.dereference()
+    mapping = [
+        CodingMapping(
+            "MAPPED_CODE",
+            "Mapped Display",
+            "http://mapping.system",
+            mapping_relationship="",
+        )
+    ]
+    shadow.set_mapping("string_var", mapping, "unit-test")
+    sample_terminology.set_mapping("C1", mapping, "unit-test")
+    sample_terminology.set_mapping("C2", mapping, "unit-test")
+
+    # Padding and a placeholder, as older data might have
+    codings = locutus.persistence().collection("Coding")
+    codings.update_many(
+        {"terminology_id": shadow.id, "code": "string_var"},
+        {"$set": {"display": "  String Var ", "system": " http://ftd.unit.tests/basic_table/01 "}},
+    )
+    codings.update_many(
+        {"terminology_id": sample_terminology.id, "code": "C2"},
+        {"$set": {"code": "<FTD-DOT>", "mappings.0.display": " Mapped Display  "}},
+    )
+
+    expected = []
+    exporter = harmony_exporter()
+    for term in [shadow, sample_terminology]:
+        term = Terminology.get(term.id)
+        term_codings = term.build_code_dict()
+        for code, mappings in term.mappings().items():
+            coding = term_codings[code]
+            for mapped in mappings:
+                expected += exporter.add_row(
+                    table_id=basic_table.id,
+                    source_text=coding.code,
+                    source_description=coding.display,
+                    source_domain=basic_table.name,
+                    source_system=coding.system,
+                    mapping_relationship=mapped.mapping_relationship,
+                    mapped_code=mapped.code,
+                    mapped_display=mapped.display,
+                    mapped_system=mapped.system,
+                    version="v1",
+                )
+
+    rows = Table.get(basic_table.id).as_harmony(harmony_exporter=harmony_exporter(), version="v1")
+    assert len(rows) == 3
+    assert rows == expected
+
+    source_text = exporter._header_map.get("source_text", "source_text")
+    source_description = exporter._header_map.get("source_description", "source_description")
+    mapped_display = exporter._header_map.get("mapped_display", "mapped_display")
+    assert "." in [row[source_text] for row in rows]
+    assert "String Var" in [row[source_description] for row in rows]
+    assert {row[mapped_display] for row in rows} == {"Mapped Display"}
@@ -128,6 +128,24 @@ def test_terminology_get(sample_terminology):
     assert one_term["id"] == all_terms[0]["id"]
 
 
+def test_terminology_pages(sample_terminology):
+    all_terms = Terminology.get(return_instance=False)
+    ids = sorted(term["id"] for term in all_terms)
+
+    first_page = Terminology.get(return_instance=False, limit=1)
+    assert [term["id"] for term in first_page] == ids[:1]
+
+    rest = Terminology.get(return_instance=False, after=first_page[-1]["id"])
+    assert [term["id"] for term in rest] == ids[1:]
+
+    summary = Terminology.get(
+        return_instance=False, projection=Terminology.summary_projection()
+    )
+    term = [term for term in summary if term["id"] == sample_terminology.id][0]
+    assert "codes" not in term
+    assert term["codes_count"] == len(sample_terminology.codes)
+
+
 def test_terminology_id(sample_terminology):
     # Normally we want these to have unique IDs, but for this we should just reuse the same one
     assert sample_terminology.id == "ontology-one"
@@ -183,6 +201,15 @@ def test_build_code_dict(sample_terminology):
     assert code_dict["C2"].code == "C2"
 
 
+def test_dereference_codes(sample_terminology):
+    term = Terminology.get(sample_terminology.id)
+    assert all(ref._reference is None for ref in term.codes)
+
+    term.dereference_codes()
+    assert all(ref._reference is not None for ref in term.codes)
+    assert [ref.dereference().code for ref in term.codes] == ["C1", "C2"]
+
+
 def test_add_code(sample_terminology):
     sample_terminology.add_code(
         code="C3",
@@ -0,0 +1,68 @@
+import pytest
+from flask import Flask, g
+
+from locutus import tracing
+
+
+@pytest.fixture
+def trace(monkeypatch):
+    monkeypatch.setattr(tracing, "sample_rate", 1.0)
+    app = Flask(__name__)
+    with app.test_request_context("/api/Terminology"):
+        tracing.begin_trace()
+        yield g.trace
+
+
+class TestTracing:
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(tracing, "sample_rate", 0)
+
+        def work():
+            return 1
+
+        # Nothing is wrapped and spans do nothing
+        assert tracing.traced()(work) is work
+        assert tracing.span("nothing") is tracing._noop_span
+
+    def test_spans(self, trace):
+        with tracing.span("mongo.find_one", db=True, collection="Terminology"):
+            pass
+        with tracing.span("Terminology.get"):
+            pass
+
+        assert trace.db_calls == 1
+        assert [span[0] for span in trace.spans] == [
+            "mongo.find_one",
+            "Terminology.get",
+        ]
+        assert trace.spans[0][2] == {"collection": "Terminology"}
+
+    def test_traced_methods_are_named_for_the_class(self, trace):
+        class Base:
+            @classmethod
+            @tracing.traced()
+            def get(cls):
+                return cls
+
+            @tracing.traced()
+            def save(self):
+                return self
+
+        class Terminology(Base):
+            pass
+
+        Terminology.get()
+        Terminology().save()
+        assert [span[0] for span in trace.spans] == [
+            "Terminology.get",
+            "Terminology.save",
+        ]
+
+    def test_summary(self, trace):
+        with tracing.span("mongo.find_one", db=True):
+            pass
+
+        summary = trace.summary()
+        assert summary["name"] == "GET /api/Terminology"
+        assert summary["db_calls"] == 1
+        assert len(summary["spans"]) == 1
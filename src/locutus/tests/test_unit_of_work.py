@@ -0,0 +1,132 @@
+import pytest
+from bson import ObjectId
+from flask import Flask, g
+
+from locutus.model import unit_of_work
+
+
+class FakeResource:
+    def __init__(self, name):
+        self._id = ObjectId()
+        self.id = str(self._id)
+        self.name = name
+
+    class _Schema:
+        fields = {"id": None, "name": None}
+
+    @classmethod
+    def _get_schema(cls):
+        return cls._Schema
+
+    def dump(self):
+        return {"id": self.id, "name": self.name}
+
+
+@pytest.fixture
+def request_context():
+    app = Flask(__name__)
+    with app.test_request_context():
+        unit_of_work.begin_unit_of_work()
+        yield g.unit_of_work
+        g.pop("unit_of_work", None)
+
+
+class TestUnitOfWork:
+    def test_inactive_outside_of_requests(self):
+        resource = FakeResource("outside")
+        assert unit_of_work.current() is None
+        assert unit_of_work.lookup("FakeResource", resource.id) is None
+        assert unit_of_work.register("FakeResource", resource.id, resource) is resource
+        assert not unit_of_work.defer_save(
+            "FakeResource", resource, resource.dump(), None
+        )
+
+    def test_identity_map(self, request_context):
+        first = FakeResource("first")
+        assert unit_of_work.lookup("FakeResource", first.id) is None
+
+        assert unit_of_work.register("FakeResource", first.id, first) is first
+        assert unit_of_work.lookup("FakeResource", first.id) is first
+
+        # The instance we already have wins unless we are told otherwise
+        other = FakeResource("other")
+        assert unit_of_work.register("FakeResource", first.id, other) is first
+        assert unit_of_work.register("FakeResource", first.id, other, replace=True) is other
+
+        unit_of_work.evict("FakeResource", first.id)
+        assert unit_of_work.lookup("FakeResource", first.id) is None
+
+    def test_saves_are_coalesced(self, request_context):
+        resource = FakeResource("before")
+
+        assert unit_of_work.defer_save(
+            "FakeResource", resource, resource.dump(), {"name": "original"}
+        )
+        resource.name = "after"
+        assert unit_of_work.defer_save(
+            "FakeResource", resource, resource.dump(), {"name": "before"}
+        )
+
+        # Changes made after the last save aren't written
+        resource.name = "unsaved"
+
+        assert len(request_context.pending) == 1
+        doc, snapshot, fields = request_context.pending[("FakeResource", resource.id)]
+        assert doc["name"] == "after"
+        assert doc["_id"] == resource._id
+
+        # What was in the database before the first save
+        assert snapshot == {"name": "original"}
+
+        unit_of_work.evict(
+            "FakeResource", resource.id, collection="FakeResource", _id=resource._id
+        )
+        assert len(request_context.pending) == 0
+
+
+    def test_after_commit(self, request_context):
+        called = []
+        unit_of_work.after_commit(lambda: called.append("bumped"))
+        assert called == []
+
+        unit_of_work.commit_unit_of_work(None)
+        assert called == ["bumped"]
+        assert request_context.after_commit == []
+
+    def test_after_commit_outside_of_requests(self):
+        called = []
+        unit_of_work.after_commit(lambda: called.append("bumped"))
+        assert called == ["bumped"]
+
+
+class TestDocumentChanges:
+    fields = {"name": None, "codes": None, "description": None}
+
+    def test_nothing_changed(self):
+        snapshot = {"_id": ObjectId(), "name": "same", "codes": [{"reference": "a"}]}
+        doc = {"name": "same", "codes": [{"reference": "a"}]}
+
+        assert unit_of_work.document_changes(doc, snapshot, self.fields) is None
+
+    def test_set_push_and_unset(self):
+        snapshot = {
+            "name": "before",
+            "codes": [{"reference": "a"}],
+            "description": "going away",
+            "not_in_schema": "left alone",
+        }
+        doc = {"name": "after", "codes": [{"reference": "a"}, {"reference": "b"}]}
+
+        assert unit_of_work.document_changes(doc, snapshot, self.fields) == {
+            "$set": {"name": "after"},
+            "$push": {"codes": {"$each": [{"reference": "b"}]}},
+            "$unset": {"description": ""},
+        }
+
+    def test_reordered_list_is_set(self):
+        snapshot = {"codes": ["a", "b"]}
+        doc = {"codes": ["b", "a", "c"]}
+
+        assert unit_of_work.document_changes(doc, snapshot, self.fields) == {
+            "$set": {"codes": ["b", "a", "c"]}
+        }
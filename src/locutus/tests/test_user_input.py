@@ -1,7 +1,7 @@
 import pytest
 
 from locutus.model.coding import Coding, CodingMapping 
-from locutus.model.terminology import Terminology
+from locutus.model.terminology import MappingUserInputModel, Terminology
 from locutus.model.user_input import UserInput, MappingConversation, MappingVote
 
 import pdb
@@ -91,6 +91,65 @@ class TestMappingConversations:
         assert mc1.id == mc2.id
         mc2.delete(hard_delete=True)
 
+    def test_votes_are_merged(self, sample_terminology):
+        mv1 = MappingVote(
+            terminology_id=sample_terminology.id,
+            source_code="C1",
+            mapped_code="MAPPED_CODE"
+        )
+        mv1.add_input("up", "user1")
+        mv1.add_input("down", "user.two")
+        mv1.save()
+
+        # Another instance adds its votes to the first's rather than replacing
+        # them, including changing user.two's vote
+        mv2 = MappingVote(
+            terminology_id=sample_terminology.id,
+            source_code="C1",
+            mapped_code="MAPPED_CODE"
+        )
+        mv2.add_input("up", "user.two")
+        mv2.add_input("down", "user3")
+        mv2.save()
+        assert mv2.id == mv1.id
+        assert sorted(mv2.mapping_votes) == ["user.two", "user1", "user3"]
+
+        mvv = MappingVote.get(terminology_id=sample_terminology.id,
+                                    source_code="C1",
+                                    mapped_code="MAPPED_CODE",
+                                    return_instance=False)
+        assert mvv['id'] == str(mvv['_id']) == mv1.id
+        assert mvv['mapping_votes']['user.two']['vote'] == "up"
+        assert mvv['mapping_votes']['user1']['vote'] == "up"
+        mv1.delete(hard_delete=True)
+
+    def test_conversations_are_appended(self, sample_terminology):
+        mc1 = MappingConversation(
+            terminology_id=sample_terminology.id,
+            source_code="C1",
+            mapped_code="MAPPED_CODE"
+        )
+        mc1.add_input("The first comment", editor="user1")
+        mc1.save()
+
+        mc2 = MappingConversation(
+            terminology_id=sample_terminology.id,
+            source_code="C1",
+            mapped_code="MAPPED_CODE"
+        )
+        mc2.add_input("A reply", editor="user2")
+        mc2.save()
+        assert mc2.id == mc1.id
+        assert len(mc2.mapping_conversations) == 2
+
+        mcc = MappingConversation.get(terminology_id=sample_terminology.id,
+                                    source_code="C1",
+                                    mapped_code="MAPPED_CODE",
+                                    return_instance=False)
+        assert mcc['id'] == str(mcc['_id']) == mc1.id
+        assert len(mcc['mapping_conversations']) == 2
+        mc1.delete(hard_delete=True)
+
     def test_simple_votes(self, sample_terminology):
         mv = MappingVote(
             terminology_id=sample_terminology.id,
@@ -275,3 +334,57 @@ class TestMappingConversations:
         assert "message" in uitotal 
         assert uitotal['message'] == 'No user input for this mapping.'
 
+    def test_user_input_summary(self, sample_terminology):
+        mc = MappingConversation(
+            terminology_id=sample_terminology.id,
+            source_code="C1",
+            mapped_code="MAPPED_CODE"
+        )
+        mc.add_input("First comment", editor="user1")
+        mc.add_input("Second comment", editor="user2")
+        mc.save()
+
+        mv = MappingVote(
+            terminology_id=sample_terminology.id,
+            source_code="C1",
+            mapped_code="MCODE"
+        )
+        mv.add_input("up", "user1")
+        mv.add_input("up", "user2")
+        mv.add_input("down", "user3")
+        mv.save()
+
+        summaries = MappingUserInputModel.summarize_user_input(
+            sample_terminology.id, "user1"
+        )
+        assert len(summaries) == 2
+
+        assert MappingUserInputModel.user_input_for(summaries, "C1", "MAPPED_CODE") == {
+            "comments_count": 2,
+            "votes_count": {"up": 0, "down": 0},
+            "users_vote": "",
+        }
+        assert MappingUserInputModel.user_input_for(summaries, "C1", "MCODE") == {
+            "comments_count": 0,
+            "votes_count": {"up": 2, "down": 1},
+            "users_vote": "up",
+        }
+        # Nobody has weighed in on C2's mappings
+        assert MappingUserInputModel.user_input_for(summaries, "C2", "MCODE") == (
+            MappingUserInputModel.empty_user_input()
+        )
+
+        # The single mapping version agrees with the batch
+        for mapped_code in ["MAPPED_CODE", "MCODE"]:
+            assert MappingUserInputModel.generate_mapping_user_input(
+                sample_terminology.id, "C1", mapped_code, "user1"
+            ) == MappingUserInputModel.user_input_for(summaries, "C1", mapped_code)
+
+        # user4 hasn't voted, though others have
+        summaries = MappingUserInputModel.summarize_user_input(
+            sample_terminology.id, "user4", source_code="C1"
+        )
+        assert MappingUserInputModel.user_input_for(summaries, "C1", "MCODE")["users_vote"] is None
+
+        mc.delete(hard_delete=True)
+        mv.delete(hard_delete=True)
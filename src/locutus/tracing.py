@@ -0,0 +1,174 @@
+"""
+Lightweight, sampled request tracing.
+
+When LOCUTUS_TRACE_SAMPLE_RATE is set (a fraction between 0 and 1), that
+share of requests get a Trace attached to flask's g (see begin_trace and
+end_trace). Code wraps the
+interesting bits of work in spans:
+
+    with tracing.span("Terminology.get", id=id):
+        ...
+
+and database calls are recorded as db spans (see locutus.storage.mongo), so
+that when the request finishes, a single structured log record describes
+where the time went: the request's total time, the number of database calls
+and the time spent in them, and the slowest spans.
+
+Tracing is off by default. When it is off (or the request wasn't sampled),
+span() hands back a shared do-nothing context manager and traced() leaves
+the function it decorates untouched.
+"""
+
+import logging
+import os
+import random
+from functools import wraps
+from time import perf_counter
+
+from flask import g, has_app_context, request
+
+logger = logging.getLogger("locutus.tracing")
+
+sample_rate = float(os.getenv("LOCUTUS_TRACE_SAMPLE_RATE", 0))
+
+# Number of spans (slowest first) included in the request's log record
+max_logged_spans = int(os.getenv("LOCUTUS_TRACE_MAX_SPANS", 20))
+
+# Level the traces are logged at. Tracing has to be asked for, so by default
+# the traces are logged at a level that gets past the default LOCUTUS_LOGLEVEL
+trace_log_level = logging.getLevelName(
+    os.getenv("LOCUTUS_TRACE_LOGLEVEL", "WARNING").upper()
+)
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.start = perf_counter()
+
+        # (name, elapsed ms, attributes)
+        self.spans = []
+        self.db_calls = 0
+        self.db_time = 0.0
+
+    def record(self, name, elapsed, db=False, attributes=None):
+        self.spans.append((name, elapsed * 1000, attributes or {}))
+        if db:
+            self.db_calls += 1
+            self.db_time += elapsed
+
+    def summary(self):
+        slowest = sorted(self.spans, key=lambda span: span[1], reverse=True)
+        return {
+            "name": self.name,
+            "elapsed_ms": round((perf_counter() - self.start) * 1000, 3),
+            "span_count": len(self.spans),
+            "db_calls": self.db_calls,
+            "db_time_ms": round(self.db_time * 1000, 3),
+            "spans": [
+                {"name": name, "elapsed_ms": round(elapsed, 3), **attributes}
+                for name, elapsed, attributes in slowest[:max_logged_spans]
+            ],
+        }
+
+
+class _Span:
+    __slots__ = ("trace", "name", "db", "attributes", "start")
+
+    def __init__(self, trace, name, db, attributes):
+        self.trace = trace
+        self.name = name
+        self.db = db
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.trace.record(
+            self.name, perf_counter() - self.start, self.db, self.attributes
+        )
+        return False
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_noop_span = _NoopSpan()
+
+
+def current_trace():
+    """The Trace for the current request, if it is being traced"""
+    if sample_rate <= 0 or not has_app_context():
+        return None
+    return g.get("trace")
+
+
+def span(name, db=False, **attributes):
+    """Context manager timing the work it wraps. db spans also count toward
+    the request's database calls."""
+    trace = current_trace()
+    if trace is None:
+        return _noop_span
+    return _Span(trace, name, db, attributes)
+
+
+def traced(name=None):
+    """Decorator wrapping each call to the function in a span. Unless a name
+    is provided, spans for methods (and classmethods) are named after the
+    class they were called on, so Terminology.get rather than
+    Serializable.get. When tracing is disabled, the function is returned as
+    is."""
+
+    def decorator(func):
+        if sample_rate <= 0:
+            return func
+
+        is_method = "." in func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if current_trace() is None:
+                return func(*args, **kwargs)
+
+            span_name = name
+            if span_name is None:
+                if is_method and args:
+                    owner = args[0] if isinstance(args[0], type) else type(args[0])
+                    span_name = f"{owner.__name__}.{func.__name__}"
+                else:
+                    span_name = func.__qualname__
+
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def begin_trace():
+    if sample_rate > 0 and random.random() < sample_rate:
+        g.trace = Trace(f"{request.method} {request.path}")
+
+
+def end_trace(response):
+    trace = g.pop("trace", None)
+    if trace is not None:
+        summary = trace.summary()
+        summary["status"] = response.status_code
+        logger.log(
+            trace_log_level,
+            f"{trace.name} {summary['elapsed_ms']}ms with {trace.db_calls} "
+            f"database calls ({summary['db_time_ms']}ms)",
+            extra={"trace": summary},
+        )
+    return response
@@ -0,0 +1,52 @@
+"""
+Create the indexes declared by locutus's models and report on their use
+"""
+
+from locutus import persistence
+
+# Importing these registers each of the model classes, and their indexes
+import locutus.model
+import locutus.model.coding
+import locutus.model.provenance
+import locutus.model.user_input
+import locutus.model.ontologies_search
+from locutus.model.indexes import index_report, reconcile_indexes
+
+from rich import print
+import argparse
+import os
+
+
+def exec():
+    parser = argparse.ArgumentParser(
+        description="Create any missing indexes declared by the locutus models"
+    )
+    parser.add_argument(
+        "-db", "--database-uri",
+        type=str,
+        required=True,
+        help="MONGO DB URI to initialize locutos with"
+    )
+    parser.add_argument(
+        "--report",
+        action="store_true",
+        help="Don't create anything, just report on the declared and existing indexes"
+    )
+    args = parser.parse_args()
+    os.environ['MONGO_URI'] = args.database_uri
+
+    client = persistence(mongo_uri=args.database_uri, missing_ok=False)
+
+    if not args.report:
+        for collection, results in reconcile_indexes().items():
+            for index, status in results:
+                print(f"{collection}\t{index}\t{status}")
+        print()
+
+    for collection, entries in index_report().items():
+        for entry in entries:
+            keys = ", ".join(f"{key}:{direction}" for key, direction in entry["keys"])
+            print(f"{collection}\t{entry['name']}\t({keys})\tops={entry['ops']}\t{entry['status']}")
+
+if __name__ == "__main__":
+    exec()
@@ -0,0 +1,133 @@
+"""
+Simple load generator for checking how a locutus server holds up under
+concurrent requests, e.g. to compare worker and thread settings:
+
+    $ locutus-loadtest -u http://localhost:8080 -c 16 -n 500 \\
+        /api/Terminology?summary=true /api/Table
+
+Each of the concurrent clients requests the paths round robin until the total
+number of requests has been made. The report includes throughput, latency
+percentiles, status codes and, since locutus reports them with every
+response, the average number of database queries per request.
+"""
+
+import argparse
+import statistics
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+from threading import Lock
+
+
+def fetch(url, timeout):
+    """Returns (status, elapsed seconds, database queries or None)"""
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            status = response.status
+            queries = response.headers.get("X-DB-Queries")
+    except urllib.error.HTTPError as e:
+        status = e.code
+        queries = e.headers.get("X-DB-Queries")
+    except (urllib.error.URLError, TimeoutError) as e:
+        status = type(e).__name__
+        queries = None
+
+    elapsed = time.perf_counter() - start
+    return status, elapsed, None if queries is None else int(queries)
+
+
+def percentile(values, fraction):
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def run(base_url, paths, concurrency, total, timeout):
+    urls = cycle([f"{base_url.rstrip('/')}/{path.lstrip('/')}" for path in paths])
+    lock = Lock()
+
+    def next_url():
+        with lock:
+            return next(urls)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(
+            executor.map(lambda _: fetch(next_url(), timeout), range(total))
+        )
+    elapsed = time.perf_counter() - start
+
+    return results, elapsed
+
+
+def report(results, elapsed):
+    latencies = sorted(result[1] * 1000 for result in results)
+    statuses = Counter(result[0] for result in results)
+    queries = [result[2] for result in results if result[2] is not None]
+
+    print(f"Requests:    {len(results)} in {elapsed:.2f}s")
+    print(f"Throughput:  {len(results) / elapsed:.1f} requests/s")
+    print(
+        "Latency ms:  "
+        f"mean={statistics.mean(latencies):.1f} "
+        f"p50={percentile(latencies, 0.5):.1f} "
+        f"p90={percentile(latencies, 0.9):.1f} "
+        f"p99={percentile(latencies, 0.99):.1f} "
+        f"max={latencies[-1]:.1f}"
+    )
+    print(
+        "Statuses:    "
+        + ", ".join(f"{status}: {count}" for status, count in statuses.most_common())
+    )
+    if queries:
+        print(f"DB queries:  {statistics.mean(queries):.1f} per request")
+
+
+def exec():
+    parser = argparse.ArgumentParser(
+        description="Throw concurrent requests at a locutus server and report on how it did"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        default=["/api/ready", "/api/Terminology?summary=true"],
+        help="Paths to request (round robin)",
+    )
+    parser.add_argument(
+        "-u", "--url",
+        type=str,
+        default="http://localhost:8080",
+        help="Base URL of the server",
+    )
+    parser.add_argument(
+        "-c", "--concurrency",
+        type=int,
+        default=8,
+        help="Number of requests in flight at once",
+    )
+    parser.add_argument(
+        "-n", "--requests",
+        type=int,
+        default=200,
+        help="Total number of requests",
+    )
+    parser.add_argument(
+        "-t", "--timeout",
+        type=float,
+        default=60,
+        help="Seconds to wait for each response",
+    )
+    args = parser.parse_args()
+
+    results, elapsed = run(
+        args.url, args.paths, args.concurrency, args.requests, args.timeout
+    )
+    report(results, elapsed)
+
+
+if __name__ == "__main__":
+    exec()
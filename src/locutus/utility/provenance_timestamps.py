@@ -0,0 +1,107 @@
+"""
+Convert provenance timestamps stored as strings (in local time, see
+locutus.model.provenance.parse_timestamp) to BSON datetimes (UTC), so that
+provenance sorts correctly and can be queried by time range.
+
+    $ locutus-provenance-timestamps -db mongodb://localhost:27017/locutus
+
+The conversion can be run while the app is up and run again safely; only
+string timestamps are touched. Timestamps that can't be parsed are reported
+and left as they are. Run it in the same timezone as the app that wrote the
+timestamps.
+
+Afterwards, run locutus-indexes to build the provenance indexes history
+queries rely on.
+"""
+
+import argparse
+import logging
+import os
+
+from pymongo import UpdateOne
+from rich import print
+
+import locutus.model
+import locutus.model.provenance
+from locutus import persistence
+from locutus.model.provenance import parse_timestamp
+
+
+def migrate(batch_size=1000, dry_run=False):
+    """Returns the number of timestamps converted and a list of the _ids of
+    those which couldn't be"""
+    collection = persistence().collection("Provenance")
+
+    converted = 0
+    failed = []
+    updates = []
+    for doc in collection.find(
+        {"timestamp": {"$type": "string"}},
+        projection={"_id": 1, "timestamp": 1},
+        return_instance=False,
+    ):
+        try:
+            timestamp = parse_timestamp(doc["timestamp"])
+        except ValueError:
+            logging.warning(f"Unable to parse {doc['_id']}'s timestamp: {doc['timestamp']!r}")
+            failed.append(doc["_id"])
+            continue
+
+        # Only if it is still the string we read
+        updates.append(
+            UpdateOne(
+                {"_id": doc["_id"], "timestamp": doc["timestamp"]},
+                {"$set": {"timestamp": timestamp}},
+            )
+        )
+        if len(updates) >= batch_size:
+            converted += _write(collection, updates, dry_run)
+            updates = []
+
+    converted += _write(collection, updates, dry_run)
+    return converted, failed
+
+
+def _write(collection, updates, dry_run):
+    if dry_run or len(updates) == 0:
+        return len(updates)
+    return collection.bulk_write(updates, ordered=False).modified_count
+
+
+def exec():
+    parser = argparse.ArgumentParser(
+        description="Convert string provenance timestamps to BSON datetimes"
+    )
+    parser.add_argument(
+        "-db", "--database-uri",
+        type=str,
+        required=True,
+        help="MONGO DB URI to initialize locutos with"
+    )
+    parser.add_argument(
+        "-b", "--batch-size",
+        type=int,
+        default=1000,
+        help="Number of timestamps to update with each write"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Report on what would be converted without writing anything"
+    )
+    args = parser.parse_args()
+    os.environ['MONGO_URI'] = args.database_uri
+
+    client = persistence(mongo_uri=args.database_uri, missing_ok=False)
+
+    converted, failed = migrate(batch_size=args.batch_size, dry_run=args.dry_run)
+    action = "Would convert" if args.dry_run else "Converted"
+    print(f"{action} {converted} provenance timestamp(s)")
+    if failed:
+        print(f"Unable to parse {len(failed)} timestamp(s):")
+        for _id in failed:
+            print(f"\t{_id}")
+
+
+if __name__ == "__main__":
+    exec()
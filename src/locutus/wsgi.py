@@ -0,0 +1,9 @@
+"""
+WSGI entry point for production servers, such as gunicorn:
+
+    gunicorn --config python:locutus.gunicorn_config locutus.wsgi:app
+"""
+
+from locutus.app import create_app
+
+app = create_app()